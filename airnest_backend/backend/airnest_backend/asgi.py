@@ -2,6 +2,7 @@ import os
 
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
+from django.urls import re_path
 from channels.security.websocket import AllowedHostsOriginValidator
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airnest_backend.settings')
@@ -13,7 +14,9 @@ from chat import routing
 from chat.token_auth import CookieOrTokenAuthMiddleware
 
 application = ProtocolTypeRouter({
-    'http': get_asgi_application(),
+    'http': URLRouter(
+        routing.http_urlpatterns + [re_path(r'', django_asgi_app)]
+    ),
     'websocket': CookieOrTokenAuthMiddleware(
         URLRouter(routing.websocket_urlpatterns)
     ),
@@ -0,0 +1,72 @@
+"""
+游标分页工具
+
+游标是排序键的 JSON 经 urlsafe base64 编码后的字符串，对客户端不透明。
+按 (时间倒序, id) 这类复合键翻页时不需要 OFFSET，也不需要 COUNT(*)。
+"""
+
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def parse_page_size(value, default=10, maximum=50):
+    """解析 page_size，非法值回退到默认值，超出上限时截断"""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(page_size, maximum))
+
+
+def created_desc_cursor(obj, field='created_at'):
+    """生成 (-created_at, id) 排序下指向 obj 之后的游标"""
+    return encode_cursor([getattr(obj, field).isoformat(), str(obj.pk)])
+
+
+def after_created_desc(queryset, cursor, field='created_at'):
+    """
+    按 (-created_at, id) 排序时，过滤出游标之后的记录
+
+    Raises:
+        InvalidCursor: 游标格式不正确
+    """
+    values = decode_cursor(cursor)
+    if not isinstance(values, list) or len(values) != 2:
+        raise InvalidCursor('Invalid cursor')
+    created_at = parse_datetime(str(values[0]))
+    if created_at is None:
+        raise InvalidCursor('Invalid cursor')
+    try:
+        return queryset.filter(
+            Q(**{f'{field}__lt': created_at}) | Q(**{field: created_at, 'pk__gt': values[1]})
+        )
+    except ValidationError:
+        raise InvalidCursor('Invalid cursor')
+
+
+def before_created_desc(queryset, created_at, pk, field='created_at'):
+    """按 (-created_at, id) 排序时，过滤出排在 (created_at, pk) 之前（更新）的记录"""
+    return queryset.filter(
+        Q(**{f'{field}__gt': created_at}) | Q(**{field: created_at, 'pk__lt': pk})
+    )
@@ -40,6 +40,17 @@ if REDIS_URL:
 else:
     CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
 
+# 共享缓存：有 Redis 时多进程共用，否则退回进程内缓存
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 REST_AUTH = {
     'USE_JWT': True,
     # 移除所有JWT Cookie相关配置，只返回JSON
@@ -57,7 +68,7 @@ REST_AUTH = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'useraccount.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -72,6 +83,10 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# JWT 认证的进程内用户缓存（useraccount.authentication）
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', '10000'))
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', '60'))  # 秒
+
 ACCOUNT_USER_MODEL_USERNAME_FIELD = None
 ACCOUNT_EMAIL_REQUIRED = True
 ACCOUNT_USERNAME_REQUIRED = False
@@ -308,6 +323,22 @@ EMAIL_USE_LOCALTIME = False
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
 SUPPORT_EMAIL = os.environ.get('SUPPORT_EMAIL', 'support@airnest.me')
 
+# AI 评论摘要后台队列（python manage.py process_review_summaries）
+OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '')
+AI_MODEL = os.environ.get('AI_MODEL', 'google/gemini-2.0-flash-001')
+# 未配置 OpenRouter 时留空，worker 拒绝启动；本地开发需显式设置为
+# property.summary_generators.StubSummaryGenerator，避免生产环境悄悄写入占位摘要
+REVIEW_SUMMARY_GENERATOR = os.environ.get(
+    'REVIEW_SUMMARY_GENERATOR',
+    'property.summary_generators.OpenRouterSummaryGenerator' if OPENROUTER_API_KEY else '',
+)
+REVIEW_SUMMARY_DEBOUNCE_SECONDS = int(os.environ.get('REVIEW_SUMMARY_DEBOUNCE_SECONDS', '600'))
+REVIEW_SUMMARY_WORKERS = int(os.environ.get('REVIEW_SUMMARY_WORKERS', '2'))
+
+# 房源图片响应式尺寸生成（property.image_variants）
+IMAGE_VARIANT_PROCESSES = int(os.environ.get('IMAGE_VARIANT_PROCESSES', '2'))  # PIL 编码进程数
+IMAGE_VARIANT_IO_WORKERS = int(os.environ.get('IMAGE_VARIANT_IO_WORKERS', '8'))  # 下载/上传线程数
+
 
 LOGGING = {
     'version': 1,
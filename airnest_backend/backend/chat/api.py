@@ -1,57 +1,154 @@
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce, Left
 from django.http import JsonResponse
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 
-from .models import Conversation, ConversationMessage
+from . import history, notifications, read_state
+from .models import Conversation, ConversationMessage, ConversationReadState
 from .serializers import ConversationListSerializer, ConversationDetailSerializer, ConversationMessageSerializer
 
+from airnest_backend.pagination import InvalidCursor, after_created_desc, created_desc_cursor, parse_page_size
 from useraccount.models import User
 
+INBOX_PAGE_SIZE = 50
+INBOX_PAGE_SIZE_MAX = 100
+PREVIEW_LENGTH = 120
+
+
+def inbox_queryset(user):
+    """
+    当前用户的会话列表：一条查询带出最后一条消息预览、最后活动时间和未读数
+    （未读数直接读取 ConversationReadState 上维护的计数），参与者通过 prefetch 一次取回
+    """
+    messages = ConversationMessage.objects.filter(conversation=OuterRef('pk')).order_by('-created_at')
+    unread = ConversationReadState.objects.filter(conversation=OuterRef('pk'), user=user).values('unread_count')[:1]
+
+    return user.conversations.annotate(
+        last_message_at=Subquery(messages.values('created_at')[:1]),
+        last_message_preview=Subquery(messages.annotate(preview=Left('body', PREVIEW_LENGTH)).values('preview')[:1]),
+        last_message_sender_id=Subquery(messages.values('created_by_id')[:1]),
+        unread_count=Coalesce(Subquery(unread), 0),
+    ).filter(
+        # 只显示有消息的会话
+        last_message_at__isnull=False
+    ).prefetch_related('users').order_by('-last_message_at', 'id')
+
 
 @api_view(['GET'])
 def conversations_list(request):
-    conversations_with_messages = []
-    
-    for conversation in request.user.conversations.all():
-        if conversation.messages.exists():
-            conversations_with_messages.append(conversation)
-    
-    serializer = ConversationListSerializer(conversations_with_messages, many=True)
+    conversations = inbox_queryset(request.user)
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            conversations = after_created_desc(conversations, cursor, field='last_message_at')
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    limit = parse_page_size(request.GET.get('limit'), default=INBOX_PAGE_SIZE, maximum=INBOX_PAGE_SIZE_MAX)
+    page = list(conversations[:limit + 1])
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    serializer = ConversationListSerializer(page, many=True)
 
-    return JsonResponse(serializer.data, safe=False)
+    response = JsonResponse(serializer.data, safe=False)
+    # 保持列表响应格式不变，下一页游标放在响应头里
+    if has_next:
+        response['X-Next-Cursor'] = created_desc_cursor(page[-1], field='last_message_at')
+    return response
 
 
 @api_view(['GET'])
 def conversations_detail(request, pk):
-    print(f"conversations_detail - user: {request.user}, pk: {pk}")
-    conversation = request.user.conversations.get(pk=pk)
-    
+    """
+    会话详情和消息
+
+    - 默认返回最新一页，?before=<游标> 继续往前翻
+    - ?since=<消息ID> 返回该消息之后的新消息，用于断线重连补齐
+    """
+    try:
+        conversation = request.user.conversations.prefetch_related('users').get(pk=pk)
+    except Conversation.DoesNotExist:
+        return JsonResponse({'error': 'Conversation not found'}, status=404)
+
+    limit = parse_page_size(
+        request.GET.get('limit'), default=history.HISTORY_PAGE_SIZE, maximum=history.HISTORY_PAGE_SIZE_MAX
+    )
+    since = request.GET.get('since')
+
+    if since:
+        try:
+            messages, has_more = history.messages_since(conversation.id, since, limit=limit)
+        except (ConversationMessage.DoesNotExist, ValidationError):
+            return JsonResponse({'error': 'Unknown message id'}, status=400)
+        before = None
+    else:
+        try:
+            messages, before = history.page_before(conversation.id, request.GET.get('before'), limit=limit)
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        has_more = before is not None
+
+        # 打开会话（取最新一页）时标记已读，并通知该用户的其他连接
+        if not request.GET.get('before'):
+            state = read_state.mark_read(conversation.id, request.user.id)
+            notifications.notify_user(
+                request.user.id, notifications.UNREAD_UPDATED,
+                {'conversation_id': str(conversation.id), 'unread_count': state.unread_count},
+            )
+
     conversation_serializer = ConversationDetailSerializer(conversation, many=False)
-    messages_serializer = ConversationMessageSerializer(conversation.messages.all(), many=True)
-    
+    messages_serializer = ConversationMessageSerializer(messages, many=True)
+
     response_data = {
         'conversation': conversation_serializer.data,
-        'messages': messages_serializer.data
+        'messages': messages_serializer.data,
+        'has_more': has_more,
+        'before': before,
     }
-    print(f"conversations_detail - response_data: {response_data}")
-    
+
     return JsonResponse(response_data, safe=False)
 
+@api_view(['GET'])
+def unread_counts(request):
+    """各会话未读数及总数，读取维护好的计数，不统计消息表"""
+    counts = {
+        str(conversation_id): unread_count
+        for conversation_id, unread_count in ConversationReadState.objects.filter(
+            user=request.user, unread_count__gt=0
+        ).values_list('conversation_id', 'unread_count')
+    }
+    return JsonResponse({'total': sum(counts.values()), 'conversations': counts})
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def conversations_start(request, user_id):
+    if str(user_id) == str(request.user.id):
+        return JsonResponse({'error': 'Cannot start a conversation with yourself'}, status=400)
+
+    # 按参与者对的唯一索引查找，不存在时创建；并发创建时唯一约束保证只留下一个
+    pair_key = Conversation.make_pair_key(request.user.id, user_id)
+
+    conversation = Conversation.objects.filter(pair_key=pair_key).only('id').first()
+    if conversation:
+        return JsonResponse({'success': True, 'conversation_id': conversation.id})
+
     try:
-        conversations = Conversation.objects.filter(users__in=[user_id]).filter(users__in=[request.user.id])
-
-        if conversations.count() > 0:
-            conversation = conversations.first()
-            return JsonResponse({'success': True, 'conversation_id': conversation.id})
-        else:
-            user = User.objects.get(pk=user_id)
-            conversation = Conversation.objects.create()
-            conversation.users.add(request.user)
-            conversation.users.add(user)
-            return JsonResponse({'success': True, 'conversation_id': conversation.id})
+        user = User.objects.get(pk=user_id)
     except User.DoesNotExist:
-        return JsonResponse({'error': 'User not found'}, status=404)
\ No newline at end of file
+        return JsonResponse({'error': 'User not found'}, status=404)
+
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(pair_key=pair_key)
+            conversation.users.add(request.user, user)
+    except IntegrityError:
+        conversation = Conversation.objects.only('id').get(pair_key=pair_key)
+
+    return JsonResponse({'success': True, 'conversation_id': conversation.id})
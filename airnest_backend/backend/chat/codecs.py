@@ -0,0 +1,98 @@
+"""
+WebSocket 帧编码
+
+默认使用 JSON 文本帧。客户端在握手时提供子协议 airnest.msgpack.v1 时改用 MessagePack 二进制帧：
+- UUID 字段编码为 16 字节 bin
+- 时间字段编码为 MessagePack Timestamp 扩展类型（-1），JS 端解码为 Date
+帧结构与 JSON 相同：{"type": ..., "payload": {...}}；客户端上行帧也可以用 MessagePack 发送。
+
+群发时由 encode_once 把帧一次性编码成 JSON，放进 channel layer 事件里，
+JSON 连接原样发送，不再逐连接 json.dumps。MessagePack 只在接收端按需编码：
+msgpack_from_text 以 JSON 文本为键做进程内缓存，同一进程内多个 MessagePack 连接收到
+同一事件时只编码一次，没有 MessagePack 连接时完全不编码，channel layer 上也只传一份数据。
+
+msgpack 在 requirements.txt 中声明为必需依赖。
+"""
+
+import json
+import uuid
+from datetime import datetime
+from functools import lru_cache
+
+import msgpack
+
+SUBPROTOCOL_MSGPACK = 'airnest.msgpack.v1'
+
+UUID_KEYS = {'id', 'conversation_id', 'created_by_id', 'sent_to_id', 'user_id', 'message_id'}
+TIME_KEYS = {'created_at', 'read_at'}
+
+
+def choose_subprotocol(scope):
+    """从客户端提供的子协议中选出服务端支持的一个"""
+    if SUBPROTOCOL_MSGPACK in scope.get('subprotocols', []):
+        return SUBPROTOCOL_MSGPACK
+    return None
+
+
+def _compact(value, key=None):
+    if isinstance(value, dict):
+        return {k: _compact(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_compact(v) for v in value]
+    if isinstance(value, str):
+        if key in UUID_KEYS:
+            try:
+                return uuid.UUID(value).bytes
+            except ValueError:
+                return value
+        if key in TIME_KEYS:
+            try:
+                return msgpack.Timestamp.from_datetime(datetime.fromisoformat(value))
+            except ValueError:
+                return value
+    return value
+
+
+def _expand(value, key=None):
+    if isinstance(value, dict):
+        return {k: _expand(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    if isinstance(value, bytes) and key in UUID_KEYS and len(value) == 16:
+        return str(uuid.UUID(bytes=value))
+    return value
+
+
+def encode_json(frame):
+    return json.dumps(frame)
+
+
+def encode_msgpack(frame):
+    return msgpack.packb(_compact(frame), use_bin_type=True)
+
+
+def decode(text_data=None, bytes_data=None):
+    """解码客户端上行帧，二进制帧按 MessagePack 处理"""
+    if bytes_data is not None:
+        try:
+            return _expand(msgpack.unpackb(bytes_data, raw=False))
+        except msgpack.UnpackException as e:
+            # 截断的帧（OutOfData）不是 ValueError，统一成调用方处理的异常
+            raise ValueError(str(e)) from e
+    return json.loads(text_data)
+
+
+def encode_once(frame):
+    """
+    群发前一次性编码
+
+    Returns:
+        dict: {'text': JSON 字符串}，可直接放进 channel layer 事件
+    """
+    return {'text': encode_json(frame)}
+
+
+@lru_cache(maxsize=256)
+def msgpack_from_text(text):
+    """把群发事件里的 JSON 帧转成 MessagePack；同一事件的多个连接共用一次编码"""
+    return encode_msgpack(json.loads(text))
@@ -1,12 +1,65 @@
+import asyncio
 import json
-from asgiref.sync import sync_to_async
+import time
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.exceptions import StopConsumer
+from channels.generic.http import AsyncHttpConsumer
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.utils.timezone import now
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from . import codecs, history, notifications, persistence, presence, read_state
+from .models import Conversation, ConversationMessage
+
+
+def _load_member_ids(user, conversation_id):
+    try:
+        conversation = user.conversations.get(pk=conversation_id)
+    except (Conversation.DoesNotExist, ValidationError):
+        return set()
+    return {str(user_id) for user_id in conversation.users.values_list('id', flat=True)}
+
+
+def _load_since(conversation_id, message_id, pending):
+    try:
+        return history.messages_since(conversation_id, message_id, pending=pending)
+    except (ConversationMessage.DoesNotExist, ValidationError):
+        return None, False
+
 
-from .models import ConversationMessage
+class FrameConsumerMixin:
+    """按握手时协商的子协议收发帧：JSON 文本帧或 MessagePack 二进制帧"""
 
+    binary = False
+
+    async def accept_negotiated(self):
+        subprotocol = codecs.choose_subprotocol(self.scope)
+        self.binary = subprotocol == codecs.SUBPROTOCOL_MSGPACK
+        await self.accept(subprotocol=subprotocol)
+
+    async def send_frame(self, frame):
+        """只发给当前连接的帧"""
+        if self.binary:
+            await self.send(bytes_data=codecs.encode_msgpack(frame))
+        else:
+            await self.send(text_data=codecs.encode_json(frame))
+
+    async def send_encoded(self, event):
+        """群发事件里已经编码好的帧：JSON 原样发送，MessagePack 连接按需转换"""
+        if self.binary:
+            await self.send(bytes_data=codecs.msgpack_from_text(event['text']))
+        else:
+            await self.send(text_data=event['text'])
+
+
+class ChatConsumer(FrameConsumerMixin, AsyncWebsocketConsumer):
+    present = False
+    last_heartbeat = 0.0
+    typing_until = 0.0  # 本连接的 typing 节流截止时间
+    typing_active = False
 
-class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
         self.room_group_name = f'chat_{self.conversation_id}'
@@ -16,57 +69,365 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close(code=4401)
             return
 
+        self.member_ids = await self.load_member_ids(user)
+        if str(user.id) not in self.member_ids:
+            await self.close(code=4403)
+            return
+
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept_negotiated()
+
+        # 断线重连：ws/<id>/?since=<最后收到的消息ID> 先补发错过的消息
+        since = (parse_qs(self.scope.get('query_string', b'').decode()).get('since') or [None])[0]
+        if since:
+            await self.replay_since(since)
+
+        await self.send_frame({
+            'type': presence.PRESENCE_SNAPSHOT,
+            'payload': {
+                'conversation_id': str(self.conversation_id),
+                'online': await presence.online_user_ids(self.conversation_id, self.member_ids),
+                'expires_in': presence.PRESENCE_TTL,
+            },
+        })
+        await self.handle_heartbeat()
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if not self.present:
+            return
+        user_id = self.scope['user'].id
+        await self.stop_typing()
+        if await presence.leave(self.conversation_id, user_id):
+            await self.broadcast('presence_update', presence.PRESENCE, presence.presence_payload(
+                self.conversation_id, user_id, False
+            ))
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = codecs.decode(text_data, bytes_data)
+        except ValueError:
+            return
         payload = data.get('data') or {}
+        event = data.get('event')
+        if event == 'read':
+            await self.handle_read(payload)
+            return
+        if event == 'heartbeat':
+            await self.handle_heartbeat()
+            return
+        if event == 'typing':
+            await self.handle_typing(payload)
+            return
+
         body = payload.get('body', '').strip()
         if not body:
             return
 
         client_id = payload.get('clientId')  # 前端乐观 UI 用
-        sent_to_id = payload.get('sent_to_id')
+        sender_id = str(self.scope['user'].id)
+        sent_to_id = str(payload.get('sent_to_id') or '')
+        if sent_to_id not in self.member_ids or sent_to_id == sender_id:
+            # 只允许发给会话中的另一方
+            others = sorted(self.member_ids - {sender_id})
+            if not others:
+                return
+            sent_to_id = others[0]
 
-        msg = await self.save_message(
+        # 服务端分配 id 和时间后立即广播，写库交给写后缓冲批量完成
+        buffer = persistence.get_buffer()
+        msg = buffer.new_message(
             conversation_id=self.conversation_id,
             body=body,
             sent_to_id=sent_to_id,
+            created_by_id=sender_id,
         )
+        if not buffer.add(msg):
+            await self.send_frame({'type': 'message.failed', 'payload': {'clientId': client_id}})
+            return
+        # 前端收到 message.created 时会清除发送者的输入提示，这里只重置状态不再单独广播
+        await self.stop_typing(broadcast=False)
 
+        message_payload = history.message_payload(msg, client_id)  # clientId 用于前端去重
+        # 只编码一次，所有成员连接发送同样的字节
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
-                'payload': {
-                    'id': str(msg.id),
-                    'conversation_id': str(msg.conversation_id),
-                    'body': msg.body,
-                    'created_by_id': str(msg.created_by_id),
-                    'sent_to_id': str(msg.sent_to_id),
-                    'created_at': msg.created_at.isoformat(),
-                    'clientId': client_id,  # 用于前端去重
-                }
+                'message_id': str(msg.id),  # SSE 通道用作事件 id
+                **codecs.encode_once({'type': 'message.created', 'payload': message_payload}),
             }
         )
 
-    async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message.created',
-            'payload': event['payload'],
-        }))
+        # 双方的用户通知通道（其他设备 / 标签页）各推一条，同一帧里带上接收方的未读增量
+        await notifications.notify_users(
+            self.channel_layer, self.member_ids, notifications.MESSAGE_CREATED,
+            {**message_payload, 'unread_delta': 1},
+        )
 
-    @sync_to_async
-    def save_message(self, conversation_id, body, sent_to_id):
+    async def handle_read(self, payload):
+        """已读确认：{"event": "read", "data": {"message_id": "..."}}"""
+        message_id = payload.get('message_id')
+        if message_id and message_id == getattr(self, 'last_read_ack', None):
+            return
         user = self.scope['user']
-        return ConversationMessage.objects.create(
-            conversation_id=conversation_id,
-            body=body,
-            sent_to_id=sent_to_id,
-            created_by=user,
-            created_at=now(),
+        # 刚广播、尚未落库的消息只在本进程缓冲区里
+        pending = persistence.get_buffer().pending_for(self.conversation_id) if message_id else []
+        state = await self.mark_read(user.id, message_id, pending)
+        if state is None:
+            return
+        self.last_read_ack = message_id
+
+        # 已读回执发给会话内的连接，最新未读数发给自己的通知通道
+        receipt = {
+            'conversation_id': str(self.conversation_id),
+            'user_id': str(user.id),
+            'message_id': str(state.last_read_message_id) if state.last_read_message_id else None,
+            'read_at': state.last_read_at.isoformat(),
+        }
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'read_receipt',
+                **codecs.encode_once({'type': 'message.read', 'payload': receipt}),
+            }
+        )
+        await notifications.notify_users(
+            self.channel_layer, [user.id], notifications.UNREAD_UPDATED,
+            {'conversation_id': str(self.conversation_id), 'unread_count': state.unread_count},
+        )
+
+    async def handle_heartbeat(self):
+        """心跳续期在线状态：{"event": "heartbeat"}；只在刚上线时广播"""
+        now = time.monotonic()
+        if self.present and now - self.last_heartbeat < presence.HEARTBEAT_MIN_INTERVAL:
+            return
+        self.last_heartbeat = now
+        user_id = self.scope['user'].id
+        came_online = await presence.touch(self.conversation_id, user_id, registered=self.present)
+        self.present = True
+        if came_online:
+            await self.broadcast('presence_update', presence.PRESENCE, presence.presence_payload(
+                self.conversation_id, user_id, True
+            ))
+
+    async def handle_typing(self, payload):
+        """正在输入：{"event": "typing", "data": {"typing": true|false}}，每次按键都可以发"""
+        if payload.get('typing', True) is False:
+            await self.stop_typing()
+            return
+
+        now = time.monotonic()
+        if now < self.typing_until:
+            return
+        self.typing_until = now + presence.TYPING_THROTTLE
+        user_id = self.scope['user'].id
+        # 同一用户的其他连接刚广播过时不再重复；只有本连接广播过开始，停止时才由本连接广播
+        if await presence.claim_typing(self.conversation_id, user_id):
+            self.typing_active = True
+            await self.broadcast('typing_update', presence.TYPING, presence.typing_payload(
+                self.conversation_id, user_id, True
+            ))
+
+    async def stop_typing(self, broadcast=True):
+        if not self.typing_active:
+            return
+        self.typing_active = False
+        self.typing_until = 0.0
+        user_id = self.scope['user'].id
+        await presence.release_typing(self.conversation_id, user_id)
+        if broadcast:
+            await self.broadcast('typing_update', presence.TYPING, presence.typing_payload(
+                self.conversation_id, user_id, False
+            ))
+
+    async def broadcast(self, handler, frame_type, payload):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': handler, **codecs.encode_once({'type': frame_type, 'payload': payload})},
+        )
+
+    async def replay_since(self, message_id):
+        pending = persistence.get_buffer().pending_for(self.conversation_id)
+        messages, has_more = await self.load_since(message_id, pending)
+        if messages is None:
+            await self.send_frame({'type': 'replay.unavailable'})
+            return
+        for msg in messages:
+            await self.send_frame({'type': 'message.created', 'payload': history.message_payload(msg)})
+        # 错过的消息太多时提示前端重新拉取历史
+        await self.send_frame({'type': 'replay.done', 'has_more': has_more})
+
+    async def chat_message(self, event):
+        await self.send_encoded(event)
+
+    async def read_receipt(self, event):
+        await self.send_encoded(event)
+
+    async def presence_update(self, event):
+        await self.send_encoded(event)
+
+    async def typing_update(self, event):
+        await self.send_encoded(event)
+
+    @database_sync_to_async
+    def mark_read(self, user_id, message_id, pending):
+        try:
+            return read_state.mark_read(self.conversation_id, user_id, message_id, pending)
+        except ValidationError:
+            return None
+
+    @database_sync_to_async
+    def load_member_ids(self, user):
+        return _load_member_ids(user, self.conversation_id)
+
+    @database_sync_to_async
+    def load_since(self, message_id, pending):
+        return _load_since(self.conversation_id, message_id, pending)
+
+
+class ChatEventStreamConsumer(AsyncHttpConsumer):
+    """
+    WebSocket 被拦截时的降级通道（Server-Sent Events）
+
+    GET /api/chat/<id>/events/ 订阅与 ChatConsumer 相同的 chat_<id> 组，
+    每条 data 都是与 WebSocket 相同的 JSON 帧。消息事件带 id，浏览器断线重连时
+    自动携带 Last-Event-ID 补发错过的消息；首次连接也可以用 ?last_event_id= 指定。
+    """
+
+    KEEPALIVE_INTERVAL = 15  # 秒，防止代理因空闲断开
+
+    group_name = None
+    keepalive = None
+
+    async def http_request(self, message):
+        # 与父类不同：handle 返回后响应保持打开，继续接收 channel layer 事件，直到客户端断开
+        if 'body' in message:
+            self.body.append(message['body'])
+        if message.get('more_body'):
+            return
+        if not await self.handle(b''.join(self.body)):
+            await self.disconnect()
+            raise StopConsumer()
+
+    async def handle(self, body):
+        """
+        Returns:
+            bool: 事件流是否已打开
+        """
+        self.conversation_id = str(self.scope['url_route']['kwargs']['conversation_id'])
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.send_error(401, 'Authentication required')
+            return False
+
+        member_ids = await database_sync_to_async(_load_member_ids)(user, self.conversation_id)
+        if str(user.id) not in member_ids:
+            await self.send_error(403, 'Not a member of this conversation')
+            return False
+
+        self.replayed = set()
+        self.group_name = f'chat_{self.conversation_id}'
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.send_headers(headers=[
+            (b'Content-Type', b'text/event-stream'),
+            (b'Cache-Control', b'no-cache'),
+            (b'X-Accel-Buffering', b'no'),
+            *self.cors_headers(),
+        ])
+        await self.send_body(b'retry: 3000\n\n', more_body=True)
+
+        last_event_id = dict(self.scope.get('headers', [])).get(b'last-event-id', b'').decode()
+        if not last_event_id:
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            last_event_id = (query.get('last_event_id') or [''])[0]
+        if last_event_id:
+            await self.replay_since(last_event_id)
+
+        self.keepalive = asyncio.ensure_future(self.send_keepalive())
+        return True
+
+    def cors_headers(self):
+        # CorsMiddleware 不作用于 Channels 的 HTTP consumer；前端跨域用 EventSource(withCredentials) 连接
+        origin = dict(self.scope.get('headers', [])).get(b'origin', b'').decode()
+        if origin not in settings.CORS_ALLOWED_ORIGINS:
+            return [(b'Vary', b'Origin')]
+        return [
+            (b'Access-Control-Allow-Origin', origin.encode()),
+            (b'Access-Control-Allow-Credentials', b'true'),
+            (b'Vary', b'Origin'),
+        ]
+
+    async def send_error(self, status, message):
+        await self.send_response(
+            status,
+            json.dumps({'error': message}).encode(),
+            headers=[(b'Content-Type', b'application/json'), *self.cors_headers()],
         )
+
+    async def send_event(self, text, event_id=None):
+        event = f'id: {event_id}\n' if event_id else ''
+        await self.send_body(f'{event}data: {text}\n\n'.encode(), more_body=True)
+
+    async def send_keepalive(self):
+        while True:
+            await asyncio.sleep(self.KEEPALIVE_INTERVAL)
+            await self.send_body(b': ping\n\n', more_body=True)
+
+    async def replay_since(self, message_id):
+        pending = persistence.get_buffer().pending_for(self.conversation_id)
+        messages, has_more = await database_sync_to_async(_load_since)(self.conversation_id, message_id, pending)
+        if messages is None:
+            await self.send_event(codecs.encode_json({'type': 'replay.unavailable'}))
+            return
+        for msg in messages:
+            self.replayed.add(str(msg.id))
+            frame = {'type': 'message.created', 'payload': history.message_payload(msg)}
+            await self.send_event(codecs.encode_json(frame), msg.id)
+        await self.send_event(codecs.encode_json({'type': 'replay.done', 'has_more': has_more}))
+
+    async def disconnect(self):
+        if self.keepalive is not None:
+            self.keepalive.cancel()
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def chat_message(self, event):
+        # 补发期间已入组，同一条消息可能既被补发又收到广播
+        if event.get('message_id') in self.replayed:
+            return
+        await self.send_event(event['text'], event.get('message_id'))
+
+    async def read_receipt(self, event):
+        await self.send_event(event['text'])
+
+    async def presence_update(self, event):
+        await self.send_event(event['text'])
+
+    async def typing_update(self, event):
+        await self.send_event(event['text'])
+
+
+class NotificationConsumer(FrameConsumerMixin, AsyncWebsocketConsumer):
+    """每个用户一个连接，接收其所有会话及预订相关的事件"""
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.group_name = notifications.user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept_negotiated()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # 只下行推送，忽略客户端发来的内容
+        pass
+
+    async def notify(self, event):
+        await self.send_encoded(event)
@@ -0,0 +1,96 @@
+"""
+会话历史消息读取
+
+- page_before: 从最新消息往前翻页，before 游标指向上一页最早的一条
+- messages_since: 断线重连后补取某条消息之后的新消息
+
+两者都按 (-created_at, id) 定位，走 (conversation, created_at) 索引；
+返回的列表统一按时间正序，方便前端直接追加渲染。
+"""
+
+from airnest_backend.pagination import after_created_desc, before_created_desc, created_desc_cursor
+
+from .models import ConversationMessage
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_SIZE_MAX = 100
+REPLAY_LIMIT = 200
+
+
+def _messages(conversation_id):
+    return ConversationMessage.objects.filter(
+        conversation_id=conversation_id
+    ).select_related('sent_to', 'created_by')
+
+
+def page_before(conversation_id, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Returns:
+        tuple: (按时间正序的消息列表, 更早一页的游标或 None)
+
+    Raises:
+        InvalidCursor: 游标格式不正确
+    """
+    messages = _messages(conversation_id).order_by('-created_at', 'id')
+    if cursor:
+        messages = after_created_desc(messages, cursor)
+
+    page = list(messages[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    before = created_desc_cursor(page[-1]) if has_more else None
+    page.reverse()
+    return page, before
+
+
+def messages_since(conversation_id, message_id, limit=REPLAY_LIMIT, pending=()):
+    """
+    Args:
+        pending: 还在写缓冲区里、尚未落库的消息（按时间正序），一并参与补发
+
+    Returns:
+        tuple: (按时间正序的消息列表, 是否还有更多)
+
+    Raises:
+        ConversationMessage.DoesNotExist: message_id 不属于该会话
+    """
+    pending = list(pending)
+    for index, message in enumerate(pending):
+        if str(message.id) == str(message_id):
+            newer = pending[index + 1:]
+            return newer[:limit], len(newer) > limit
+
+    anchor = ConversationMessage.objects.filter(
+        conversation_id=conversation_id
+    ).values('id', 'created_at').get(pk=message_id)
+
+    messages = before_created_desc(
+        _messages(conversation_id), anchor['created_at'], anchor['id']
+    ).order_by('created_at', '-id')
+    page = list(messages[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    seen = {message.id for message in page}
+    unsaved = [
+        message for message in pending
+        if message.created_at > anchor['created_at'] and message.id not in seen
+    ]
+    if unsaved and not has_more:
+        page = sorted(page + unsaved, key=lambda message: message.created_at)
+        has_more = len(page) > limit
+        page = page[:limit]
+    return page, has_more
+
+
+def message_payload(message, client_id=None):
+    """WebSocket 推送的消息格式"""
+    return {
+        'id': str(message.id),
+        'conversation_id': str(message.conversation_id),
+        'body': message.body,
+        'created_by_id': str(message.created_by_id),
+        'sent_to_id': str(message.sent_to_id),
+        'created_at': message.created_at.isoformat(),
+        'clientId': client_id,
+    }
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import persistence
+from chat.models import Conversation
+from useraccount.models import User
+
+
+def percentiles(samples):
+    """返回 (p50, p95, p99)，单位与输入相同"""
+    if not samples:
+        return (0.0, 0.0, 0.0)
+    if len(samples) == 1:
+        return (samples[0],) * 3
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test ChatConsumer in-process: connect simulated users through the real ASGI '
+        'application and report connect/delivery latency percentiles and throughput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Simulated users (paired into conversations)')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent by each user')
+        parser.add_argument('--interval', type=float, default=0.0, help='Pause between messages per user (seconds)')
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory', help='Channel layer backend')
+        parser.add_argument('--redis-url', default='redis://127.0.0.1:6379/15', help='Redis used by --layer redis')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for deliveries')
+
+    def handle(self, *args, **options):
+        users_count = options['users'] - options['users'] % 2
+        if users_count < 2:
+            raise CommandError('--users must be at least 2')
+
+        if options['layer'] == 'redis':
+            layers = {'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [options['redis_url']], 'capacity': 10000},
+            }}
+        else:
+            layers = {'default': {
+                'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                'CONFIG': {'capacity': 10000},
+            }}
+
+        users, conversations = self._setup(users_count)
+        try:
+            with override_settings(CHANNEL_LAYERS=layers):
+                # 切换 channel layer 后再加载 ASGI 应用，与 Daphne 使用的是同一个 application
+                from airnest_backend.asgi import application
+                result = asyncio.run(self._run(application, users, conversations, options))
+        finally:
+            Conversation.objects.filter(pk__in=[c.pk for c in conversations]).delete()
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+        self._report(result, options)
+
+    def _setup(self, users_count):
+        suffix = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(
+                name=f'loadtest-{i}', email=f'loadtest-{suffix}-{i}@example.invalid', password=None
+            )
+            for i in range(users_count)
+        ]
+        conversations = []
+        for a, b in zip(users[0::2], users[1::2]):
+            conversation = Conversation.objects.create(pair_key=Conversation.make_pair_key(a.id, b.id))
+            conversation.users.add(a, b)
+            conversations.append(conversation)
+        return users, conversations
+
+    async def _run(self, application, users, conversations, options):
+        sent_at = {}
+        delivery_latencies = []
+        connect_latencies = []
+        expected = len(users) * options['messages']
+        delivered = asyncio.Event()
+
+        clients = []
+        for conversation, (a, b) in zip(conversations, zip(users[0::2], users[1::2])):
+            for user, peer in ((a, b), (b, a)):
+                token = str(AccessToken.for_user(user))
+                communicator = WebsocketCommunicator(application, f'/ws/{conversation.id}/?token={token}')
+                started = time.perf_counter()
+                connected, _ = await communicator.connect(timeout=10)
+                if not connected:
+                    raise CommandError(f'Connection for {user.email} was rejected')
+                connect_latencies.append((time.perf_counter() - started) * 1000)
+                clients.append((communicator, user, peer))
+
+        async def reader(communicator, user):
+            while len(delivery_latencies) < expected:
+                try:
+                    frame = json.loads(await communicator.receive_from(timeout=options['timeout']))
+                except asyncio.TimeoutError:
+                    return
+                if frame.get('type') != 'message.created':
+                    continue
+                payload = frame['payload']
+                # 只统计对方收到的时间，自己的回显不算送达
+                if payload['created_by_id'] == str(user.id):
+                    continue
+                started = sent_at.pop(payload['clientId'], None)
+                if started is not None:
+                    delivery_latencies.append((time.perf_counter() - started) * 1000)
+                    if len(delivery_latencies) >= expected:
+                        delivered.set()
+
+        async def writer(communicator, user, peer):
+            for i in range(options['messages']):
+                client_id = uuid.uuid4().hex
+                sent_at[client_id] = time.perf_counter()
+                await communicator.send_to(text_data=json.dumps({
+                    'event': 'chat_message',
+                    'data': {'body': f'load test {i}', 'sent_to_id': str(peer.id), 'clientId': client_id},
+                }))
+                if options['interval']:
+                    await asyncio.sleep(options['interval'])
+
+        readers = [asyncio.ensure_future(reader(c, u)) for c, u, _ in clients]
+        started = time.perf_counter()
+        await asyncio.gather(*(writer(c, u, p) for c, u, p in clients))
+        try:
+            await asyncio.wait_for(delivered.wait(), timeout=options['timeout'])
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+
+        for task in readers:
+            task.cancel()
+        for communicator, _, _ in clients:
+            await communicator.disconnect()
+        # 写后缓冲里剩余的消息写完再清理测试数据
+        await persistence.get_buffer().drain()
+        layer = get_channel_layer()
+        if hasattr(layer, 'close_pools'):
+            await layer.close_pools()
+
+        return {
+            'connections': len(clients),
+            'expected': expected,
+            'delivered': len(delivery_latencies),
+            'elapsed': elapsed,
+            'connect_latencies': connect_latencies,
+            'delivery_latencies': delivery_latencies,
+        }
+
+    def _report(self, result, options):
+        connect = percentiles(result['connect_latencies'])
+        delivery = percentiles(result['delivery_latencies'])
+        throughput = result['delivered'] / result['elapsed'] if result['elapsed'] else 0
+
+        self.stdout.write(f"Channel layer: {options['layer']}")
+        self.stdout.write(f"Connections: {result['connections']}")
+        self.stdout.write('Connect latency ms: p50 %.1f / p95 %.1f / p99 %.1f' % connect)
+        self.stdout.write(f"Delivered: {result['delivered']} / {result['expected']} in {result['elapsed']:.2f}s")
+        self.stdout.write('Delivery latency ms: p50 %.1f / p95 %.1f / p99 %.1f' % delivery)
+        style = self.style.SUCCESS if result['delivered'] == result['expected'] else self.style.WARNING
+        self.stdout.write(style(f'Throughput: {throughput:,.0f} msg/s'))
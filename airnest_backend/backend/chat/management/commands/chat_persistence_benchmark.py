@@ -0,0 +1,69 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+
+from chat.models import Conversation, ConversationMessage
+from chat.persistence import MessageWriteBuffer
+from useraccount.models import User
+
+
+class Command(BaseCommand):
+    help = 'Compare per-message inserts with the write-behind buffer (messages per second)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Messages written per run')
+        parser.add_argument('--batch-size', type=int, default=100, help='Write buffer batch size')
+        parser.add_argument('--flush-interval', type=float, default=0.2, help='Write buffer flush interval (seconds)')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        sender = User.objects.create_user(name='bench-sender', email=f'bench-sender-{suffix}@example.invalid', password=None)
+        receiver = User.objects.create_user(name='bench-receiver', email=f'bench-receiver-{suffix}@example.invalid', password=None)
+        conversation = Conversation.objects.create()
+        conversation.users.add(sender, receiver)
+
+        try:
+            count = options['messages']
+            before = asyncio.run(self._per_message(conversation.id, sender.id, receiver.id, count))
+            after = asyncio.run(self._buffered(
+                conversation.id, sender.id, receiver.id, count,
+                options['batch_size'], options['flush_interval'],
+            ))
+            stored = ConversationMessage.objects.filter(conversation=conversation).count()
+        finally:
+            conversation.delete()
+            sender.delete()
+            receiver.delete()
+
+        self.stdout.write(f'Per-message create: {count / before:,.0f} msg/s ({before:.2f}s)')
+        self.stdout.write(f'Write-behind buffer: {count / after:,.0f} msg/s ({after:.2f}s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Speedup x{before / after:.1f}, {stored} of {count * 2} messages stored'
+        ))
+
+    async def _per_message(self, conversation_id, sender_id, receiver_id, count):
+        # 与原来 ChatConsumer.receive 相同：每条消息一次线程切换加一次单行插入
+        create = sync_to_async(ConversationMessage.objects.create)
+        started = time.perf_counter()
+        for i in range(count):
+            await create(
+                conversation_id=conversation_id, body=f'message {i}',
+                sent_to_id=receiver_id, created_by_id=sender_id,
+            )
+        return time.perf_counter() - started
+
+    async def _buffered(self, conversation_id, sender_id, receiver_id, count, batch_size, flush_interval):
+        buffer = MessageWriteBuffer(max_batch_size=batch_size, flush_interval=flush_interval)
+        started = time.perf_counter()
+        for i in range(count):
+            buffer.add(buffer.new_message(
+                conversation_id=conversation_id, body=f'message {i}',
+                sent_to_id=receiver_id, created_by_id=sender_id,
+            ))
+            # 模拟 consumer 每处理一条消息都会让出事件循环
+            await asyncio.sleep(0)
+        await buffer.drain()
+        return time.perf_counter() - started
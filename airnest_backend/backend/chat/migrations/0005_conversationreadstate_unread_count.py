@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+
+def backfill_unread_counts(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMessage = apps.get_model('chat', 'ConversationMessage')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+
+    for conversation in Conversation.objects.prefetch_related('users').iterator(chunk_size=500):
+        for user in conversation.users.all():
+            state, _ = ConversationReadState.objects.get_or_create(conversation=conversation, user=user)
+            messages = ConversationMessage.objects.filter(conversation=conversation).exclude(created_by=user)
+            if state.last_read_at:
+                messages = messages.filter(created_at__gt=state.last_read_at)
+            state.unread_count = messages.count()
+            state.save(update_fields=['unread_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_conversationmessage_conv_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversationreadstate',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='last_read_message_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='unread_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
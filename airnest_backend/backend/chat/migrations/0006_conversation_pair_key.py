@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def backfill_pair_keys(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+
+    seen = set()
+    # 已存在重复会话时保留最早创建的那个，其余不设置 pair_key
+    for conversation in Conversation.objects.prefetch_related('users').order_by('created_at').iterator(chunk_size=500):
+        user_ids = [str(user.id) for user in conversation.users.all()]
+        if len(user_ids) != 2:
+            continue
+        pair_key = ':'.join(sorted(user_ids))
+        if pair_key in seen:
+            continue
+        seen.add(pair_key)
+        Conversation.objects.filter(pk=conversation.pk).update(pair_key=pair_key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_conversationreadstate_unread_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='pair_key',
+            field=models.CharField(blank=True, editable=False, max_length=73, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_pair_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+
+def merge_duplicate_conversations(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMessage = apps.get_model('chat', 'ConversationMessage')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+
+    # 0006 为每对用户保留了最早的会话，其余重复会话的 pair_key 为空，这里把它们合并进保留的会话
+    keepers = dict(Conversation.objects.exclude(pair_key=None).values_list('pair_key', 'pk'))
+    merged = set()
+    duplicates = Conversation.objects.filter(pair_key=None).prefetch_related('users').order_by('created_at')
+    for conversation in duplicates.iterator(chunk_size=500):
+        user_ids = [str(user.id) for user in conversation.users.all()]
+        if len(user_ids) != 2:
+            continue
+        pair_key = ':'.join(sorted(user_ids))
+        keeper_id = keepers.get(pair_key)
+        if keeper_id is None:
+            Conversation.objects.filter(pk=conversation.pk).update(pair_key=pair_key)
+            keepers[pair_key] = conversation.pk
+            continue
+
+        ConversationMessage.objects.filter(conversation_id=conversation.pk).update(conversation_id=keeper_id)
+        for state in ConversationReadState.objects.filter(conversation_id=conversation.pk):
+            kept = ConversationReadState.objects.filter(conversation_id=keeper_id, user_id=state.user_id).first()
+            if kept is None:
+                state.conversation_id = keeper_id
+                state.save(update_fields=['conversation'])
+                continue
+            # 两边的已读位置取较晚的一个
+            if state.last_read_at and (kept.last_read_at is None or state.last_read_at > kept.last_read_at):
+                kept.last_read_at = state.last_read_at
+                kept.last_read_message_id = state.last_read_message_id
+                kept.save(update_fields=['last_read_at', 'last_read_message_id'])
+            state.delete()
+        conversation.delete()
+        merged.add(keeper_id)
+
+    # 消息合并后按已读位置重新计算未读数
+    for state in ConversationReadState.objects.filter(conversation_id__in=merged):
+        unread = ConversationMessage.objects.filter(conversation_id=state.conversation_id).exclude(
+            created_by_id=state.user_id
+        )
+        if state.last_read_at:
+            unread = unread.filter(created_at__gt=state.last_read_at)
+        state.unread_count = unread.count()
+        state.save(update_fields=['unread_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_conversationmessage_created_at_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_conversations, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 
 from django.db import models
+from django.utils import timezone
 
 from useraccount.models import User
 
@@ -8,9 +9,15 @@ from useraccount.models import User
 class Conversation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     users = models.ManyToManyField(User, related_name='conversations')
+    # 1:1 会话的参与者对（排序后的两个用户ID），唯一索引保证同一对用户只有一个会话
+    pair_key = models.CharField(max_length=73, unique=True, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    @staticmethod
+    def make_pair_key(user_a_id, user_b_id):
+        return ':'.join(sorted([str(user_a_id), str(user_b_id)]))
+
 
 class ConversationMessage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -18,4 +25,22 @@ class ConversationMessage(models.Model):
     body = models.TextField()
     sent_to = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    # 不用 auto_now_add：写后缓冲在广播时已分配 created_at，落库时必须保留该值
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # 历史消息分页、断线重连补发、收件箱最后一条消息
+            models.Index(fields=['conversation', 'created_at'], name='chat_message_conv_created_idx'),
+        ]
+
+class ConversationReadState(models.Model):
+    """每个用户在每个会话中读到的位置和未读数，由 chat.read_state 维护"""
+    conversation = models.ForeignKey(Conversation, related_name='read_states', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='conversation_read_states', on_delete=models.CASCADE)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    last_read_message_id = models.UUIDField(null=True, blank=True)
+    unread_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['conversation', 'user']
@@ -0,0 +1,66 @@
+"""
+按用户推送的通知
+
+每个用户一个 channel layer 组（user_<id>），NotificationConsumer 订阅该组，
+一个连接即可收到该用户所有会话的新消息、未读数变化以及预订事件。
+
+前端收到的帧为 {'type': <事件名>, 'payload': {...}}，channel layer 事件里携带的是
+chat.codecs 预先编码好的 JSON / MessagePack 帧。
+
+新消息总是推给会话双方的用户组：message.created 的 payload 带 unread_delta，
+只对 payload.sent_to_id 对应的用户生效，不再另发 unread.updated。
+打开了该会话的连接还会从会话组（chat_<id>）收到同一条消息，
+客户端按 payload.id（消息 id）去重，并以 unread.updated 里的 unread_count 为准校正未读数。
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from . import codecs
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_CREATED = 'message.created'
+UNREAD_UPDATED = 'unread.updated'
+RESERVATION_CREATED = 'reservation.created'
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def _event(event, payload):
+    # 一次编码，用户的多个连接直接发送同样的内容
+    return {'type': 'notify', **codecs.encode_once({'type': event, 'payload': payload})}
+
+
+async def notify_users(channel_layer, user_ids, event, payload):
+    """在事件循环中推送（consumer 内使用）"""
+    message = _event(event, payload)
+    for user_id in user_ids:
+        await channel_layer.group_send(user_group(user_id), message)
+
+
+def notify_user(user_id, event, payload):
+    """在同步代码中推送（HTTP 视图内使用），失败不影响主流程"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(user_group(user_id), _event(event, payload))
+    except Exception:
+        logger.warning('Failed to push %s to user %s', event, user_id, exc_info=True)
+
+
+def reservation_payload(reservation, role):
+    return {
+        'role': role,  # 'host' 或 'guest'
+        'reservation_id': str(reservation.id),
+        'property_id': str(reservation.property_id),
+        'property_title': reservation.property.title,
+        'check_in': reservation.check_in.isoformat(),
+        'check_out': reservation.check_out.isoformat(),
+        'guests': reservation.guests,
+    }
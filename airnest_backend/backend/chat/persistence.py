@@ -0,0 +1,201 @@
+"""
+聊天消息的写后缓冲（write-behind）
+
+ChatConsumer 收到消息后由服务端分配 id 和 created_at，立即广播，
+消息本身先放进进程级缓冲区，达到条数上限或时间间隔后用一次 bulk_create 写库。
+
+- 缓冲区属于进程（按事件循环区分），与单个连接无关，连接断开不影响写入
+- created_at 在进程内严格递增，保证同一进程发出的消息顺序稳定
+- 同一事务内为接收方累加未读数（chat.read_state）
+- 批量写遇到数据错误时逐条写入，把坏数据隔离出来，其余消息照常落库
+- 数据库不可用时整批保留，在事件循环里按退避间隔重试（不占用 database_sync_to_async 的共享线程）
+- 缓冲区有上限，写不进去时拒绝新消息并记录错误，发送方收到 message.failed
+- 尚未落库的消息可通过 pending_for 查到，供断线重连补发使用
+- 进程退出时同步写出剩余消息
+"""
+
+import asyncio
+import atexit
+import logging
+import uuid
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import read_state
+from .models import ConversationMessage
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 100
+FLUSH_INTERVAL = 0.2  # 秒
+MAX_PENDING = 10000  # 数据库长时间不可用时缓冲区的上限
+RETRY_BACKOFF = 0.5  # 秒，按连续失败次数线性增加
+MAX_RETRY_DELAY = 10  # 秒
+
+
+def write_batch(messages):
+    """
+    写入一批消息
+
+    不在这里等待重试：调用方在事件循环里退避后再调用
+
+    Returns:
+        list: 写入失败、需要保留到下次再试的消息
+    """
+    try:
+        with transaction.atomic():
+            ConversationMessage.objects.bulk_create(messages)
+            read_state.apply_new_messages(messages)
+        return []
+    except IntegrityError:
+        # 数据本身有问题（比如外键无效），逐条写入把它隔离出来
+        pass
+    except Exception:
+        # 数据库暂时不可用，整批保留，不做逐条写入
+        logger.warning('Bulk insert of %d chat messages failed', len(messages), exc_info=True)
+        return list(messages)
+
+    # 逐条写入，隔离出有问题的消息
+    failed = []
+    for message in messages:
+        try:
+            if ConversationMessage.objects.filter(pk=message.id).exists():
+                # 之前的批量写入实际已提交，未读数也已累加过，不能再算一次
+                continue
+            with transaction.atomic():
+                ConversationMessage.objects.bulk_create([message])
+                read_state.apply_new_messages([message])
+        except IntegrityError:
+            logger.error('Dropping chat message %s after integrity error', message.id, exc_info=True)
+        except Exception:
+            failed.append(message)
+    return failed
+
+
+class MessageWriteBuffer:
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self._lock = asyncio.Lock()
+        self._timer = None
+        self._tasks = set()
+        self._last_created_at = None
+        self._failures = 0  # 连续写入失败次数，决定下次重试的等待时间
+
+    def next_created_at(self):
+        created_at = timezone.now()
+        if self._last_created_at is not None and created_at <= self._last_created_at:
+            created_at = self._last_created_at + timedelta(microseconds=1)
+        self._last_created_at = created_at
+        return created_at
+
+    def new_message(self, conversation_id, body, sent_to_id, created_by_id):
+        """创建一条尚未落库的消息，id 和 created_at 由服务端分配"""
+        return ConversationMessage(
+            id=uuid.uuid4(),
+            conversation_id=conversation_id,
+            body=body,
+            sent_to_id=sent_to_id,
+            created_by_id=created_by_id,
+            created_at=self.next_created_at(),
+        )
+
+    def add(self, message):
+        """
+        Returns:
+            bool: 是否已接收；缓冲区已满（数据库长时间不可用）时返回 False
+        """
+        if len(self.pending) >= MAX_PENDING:
+            logger.error('Chat write buffer full (%d messages), rejecting message %s', len(self.pending), message.id)
+            return False
+        self.pending.append(message)
+        if self._failures:
+            # 正在退避，等已安排的重试
+            self._schedule()
+        elif len(self.pending) >= self.max_batch_size:
+            self._spawn(self.flush())
+        else:
+            self._schedule()
+        return True
+
+    def _spawn(self, coro):
+        # 保留任务引用，避免未完成的任务被回收
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = self._spawn(self._flush_later())
+
+    def _delay(self):
+        if not self._failures:
+            return self.flush_interval
+        return min(MAX_RETRY_DELAY, RETRY_BACKOFF * self._failures)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._delay())
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            while self.pending:
+                batch = self.pending[:self.max_batch_size]
+                failed = await database_sync_to_async(write_batch)(batch)
+                written = {message.id for message in batch} - {message.id for message in failed}
+                # 写入期间可能又有新消息进来，只移除本批已落库的
+                self.pending = [message for message in self.pending if message.id not in written]
+                if failed:
+                    # 数据库暂时不可用，保留消息，退避后再试
+                    self._failures += 1
+                    self._schedule()
+                    break
+                self._failures = 0
+
+    async def drain(self):
+        """等待进行中的写入完成并立即写出剩余消息"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        await self.flush()
+
+    def pending_for(self, conversation_id):
+        conversation_id = str(conversation_id)
+        return [message for message in self.pending if str(message.conversation_id) == conversation_id]
+
+    def flush_sync(self):
+        """进程退出时在当前线程直接写出剩余消息"""
+        if self.pending:
+            failed = write_batch(list(self.pending))
+            if failed:
+                logger.error('Lost %d unsaved chat messages on shutdown', len(failed))
+            self.pending = []
+
+
+_buffers = {}
+
+
+def get_buffer():
+    """当前事件循环对应的缓冲区"""
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = _buffers[loop] = MessageWriteBuffer()
+    return buffer
+
+
+@atexit.register
+def _flush_all():
+    for buffer in list(_buffers.values()):
+        try:
+            buffer.flush_sync()
+        except Exception:
+            logger.exception('Failed to flush chat messages on shutdown')
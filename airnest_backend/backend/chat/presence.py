@@ -0,0 +1,110 @@
+"""
+会话内的在线状态与"正在输入"提示
+
+在线状态：
+- 存在共享缓存里，每个 (会话, 用户) 一个计数键，值为该用户在会话中的连接数，整体带 TTL
+- 连接登记 / 离开只用 add / incr / decr 原子操作，多个连接、多个进程同时上下线不会互相覆盖
+- 客户端定期发送 heartbeat 续期（touch 只刷新 TTL）；同一连接在 HEARTBEAT_MIN_INTERVAL 内的多次心跳只写一次缓存
+- 只有计数从 0 变为 1、从 1 变为 0 时才向会话广播，续期不产生 channel layer 消息
+- 进程异常退出时没有离线广播，计数不会减回去，键在所有连接停止续期后经 TTL 自然过期；
+  广播里带 expires_in 供前端自行超时
+
+正在输入：
+- 每次按键都可以发 typing，连接本地先节流，再用 cache.add 在 (会话, 用户) 维度合并，
+  多个连接 / 多个进程在 TYPING_THROTTLE 内最多广播一次"开始输入"
+- 停止输入（或发出消息）时只在之前广播过开始的情况下广播一次"停止输入"
+"""
+
+from django.core.cache import cache
+
+PRESENCE_TTL = 60  # 秒，两次心跳之间允许的最长间隔
+HEARTBEAT_MIN_INTERVAL = 15  # 秒，同一连接的心跳最多这么久写一次缓存
+TYPING_THROTTLE = 3  # 秒，同一用户"开始输入"的最短广播间隔
+TYPING_TIMEOUT = 6  # 秒，前端在没有新的 typing 事件后自动隐藏提示
+
+PRESENCE = 'presence'
+PRESENCE_SNAPSHOT = 'presence.snapshot'
+TYPING = 'typing'
+
+
+def _presence_key(conversation_id, user_id):
+    return f'chat_presence:{conversation_id}:{user_id}'
+
+
+def _typing_key(conversation_id, user_id):
+    return f'chat_typing:{conversation_id}:{user_id}'
+
+
+async def touch(conversation_id, user_id, registered):
+    """
+    登记 / 续期一个连接
+
+    Args:
+        registered: 该连接之前已登记过（续期）
+
+    Returns:
+        bool: 该用户此前在会话中没有存活的连接（即刚刚上线）
+    """
+    key = _presence_key(conversation_id, user_id)
+    if registered and await cache.atouch(key, PRESENCE_TTL):
+        return False
+    # 新连接，或键已过期（所有连接都太久没有心跳）时重新登记
+    if await cache.aadd(key, 1, PRESENCE_TTL):
+        return True
+    try:
+        count = await cache.aincr(key)
+    except ValueError:
+        # 刚好在 add 和 incr 之间过期
+        await cache.aadd(key, 1, PRESENCE_TTL)
+        return True
+    await cache.atouch(key, PRESENCE_TTL)
+    return count == 1
+
+
+async def leave(conversation_id, user_id):
+    """
+    注销一个连接
+
+    Returns:
+        bool: 该用户已没有存活的连接（即刚刚离线）
+    """
+    try:
+        count = await cache.adecr(_presence_key(conversation_id, user_id))
+    except ValueError:
+        return True
+    # 计数为 0 的键保留到 TTL 过期，避免删除时与同时上线的连接竞争
+    return count <= 0
+
+
+async def online_user_ids(conversation_id, user_ids):
+    """会话成员中当前在线的用户"""
+    keys = {_presence_key(conversation_id, user_id): str(user_id) for user_id in user_ids}
+    found = await cache.aget_many(list(keys))
+    return sorted(keys[key] for key, count in found.items() if count > 0)
+
+
+async def claim_typing(conversation_id, user_id):
+    """窗口内第一次"开始输入"返回 True，需要广播；其余的被合并掉"""
+    return await cache.aadd(_typing_key(conversation_id, user_id), 1, TYPING_THROTTLE)
+
+
+async def release_typing(conversation_id, user_id):
+    await cache.adelete(_typing_key(conversation_id, user_id))
+
+
+def presence_payload(conversation_id, user_id, online):
+    return {
+        'conversation_id': str(conversation_id),
+        'user_id': str(user_id),
+        'online': online,
+        'expires_in': PRESENCE_TTL if online else 0,
+    }
+
+
+def typing_payload(conversation_id, user_id, typing):
+    return {
+        'conversation_id': str(conversation_id),
+        'user_id': str(user_id),
+        'typing': typing,
+        'expires_in': TYPING_TIMEOUT if typing else 0,
+    }
@@ -0,0 +1,95 @@
+"""
+会话已读位置与未读计数
+
+ConversationReadState 每个 (会话, 用户) 一行：
+- unread_count 在消息批量落库时按接收方增量更新（F 表达式，原子）
+- 已读确认时更新 last_read_at / last_read_message_id，并重新计算未读数
+只有 last_read_at 之后的消息才会计入未读，因此已读确认先于消息落库到达时也不会多算。
+已读确认在行锁内重新计数，与并发的增量更新互斥；确认的消息必须属于该会话。
+读取未读数只需按主键/唯一索引取一行，不再对消息表做 COUNT。
+"""
+
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import ConversationMessage, ConversationReadState
+
+
+def apply_new_messages(messages):
+    """消息落库后调用（应与写入处于同一事务），为接收方累加未读数"""
+    by_recipient = defaultdict(list)
+    for message in messages:
+        if message.sent_to_id != message.created_by_id:
+            by_recipient[(message.conversation_id, message.sent_to_id)].append(message.created_at)
+    if not by_recipient:
+        return
+
+    ConversationReadState.objects.bulk_create(
+        [
+            ConversationReadState(conversation_id=conversation_id, user_id=user_id)
+            for conversation_id, user_id in by_recipient
+        ],
+        ignore_conflicts=True,
+    )
+    for (conversation_id, user_id), created_ats in by_recipient.items():
+        # 只累加晚于已读位置的消息
+        increment = sum(
+            (
+                Case(
+                    When(Q(last_read_at__isnull=True) | Q(last_read_at__lt=created_at), then=Value(1)),
+                    default=Value(0),
+                )
+                for created_at in created_ats
+            ),
+            Value(0),
+        )
+        ConversationReadState.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+            unread_count=F('unread_count') + increment
+        )
+
+
+def mark_read(conversation_id, user_id, message_id=None, pending=()):
+    """
+    标记已读到某条消息；不传 message_id 时视为读到当前时刻
+
+    message_id 必须属于该会话：已落库的消息从数据库取 created_at，
+    还在本进程写后缓冲里的消息从 pending 中取，都找不到时抛出 ValidationError。
+
+    Returns:
+        ConversationReadState
+    """
+    read_at = timezone.now()
+    if message_id:
+        created_at = ConversationMessage.objects.filter(
+            conversation_id=conversation_id, pk=message_id
+        ).values_list('created_at', flat=True).first()
+        if created_at is None:
+            created_at = next((m.created_at for m in pending if str(m.id) == str(message_id)), None)
+        if created_at is None:
+            raise ValidationError('Message does not belong to this conversation')
+        read_at = created_at
+
+    with transaction.atomic():
+        ConversationReadState.objects.bulk_create(
+            [ConversationReadState(conversation_id=conversation_id, user_id=user_id)], ignore_conflicts=True
+        )
+        # 锁住这一行：并发的已读确认和 apply_new_messages 的增量按顺序生效，重新计数不会覆盖别人的结果
+        state = ConversationReadState.objects.select_for_update().get(
+            conversation_id=conversation_id, user_id=user_id
+        )
+        if state.last_read_at and state.last_read_at >= read_at:
+            # 已读位置只前进不后退
+            return state
+        state.last_read_at = read_at
+        state.last_read_message_id = message_id or None
+
+        # 已读位置之后来自对方的消息通常很少，走 (conversation, created_at) 索引
+        state.unread_count = ConversationMessage.objects.filter(
+            conversation_id=conversation_id, created_at__gt=read_at
+        ).exclude(created_by_id=user_id).count()
+        state.save(update_fields=['last_read_at', 'last_read_message_id', 'unread_count'])
+    return state
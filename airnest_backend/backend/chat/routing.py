@@ -1,7 +1,18 @@
 from django.urls import path
 
 from . import consumers
+from .token_auth import CookieOrTokenAuthMiddleware
 
 websocket_urlpatterns = [
+    # 需放在会话路由之前，否则会被当成 conversation_id
+    path('ws/notifications/', consumers.NotificationConsumer.as_asgi()),
     path('ws/<str:conversation_id>/', consumers.ChatConsumer.as_asgi()),
-]
\ No newline at end of file
+]
+
+# SSE 降级通道；其余 HTTP 请求仍交给 Django
+http_urlpatterns = [
+    path(
+        'api/chat/<uuid:conversation_id>/events/',
+        CookieOrTokenAuthMiddleware(consumers.ChatEventStreamConsumer.as_asgi()),
+    ),
+]
@@ -6,11 +6,19 @@ from useraccount.serializers import UserSerializer
 
 
 class ConversationListSerializer(serializers.ModelSerializer):
+    """收件箱条目，last_message_* 与 unread_count 来自 chat.api.inbox_queryset 的注解"""
     users = UserSerializer(many=True, read_only=True)
+    last_message_at = serializers.DateTimeField(read_only=True)
+    last_message_preview = serializers.CharField(read_only=True)
+    last_message_sender_id = serializers.UUIDField(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Conversation
-        fields = ('id', 'users', 'modified_at',)
+        fields = (
+            'id', 'users', 'modified_at',
+            'last_message_at', 'last_message_preview', 'last_message_sender_id', 'unread_count',
+        )
 
 
 class ConversationDetailSerializer(serializers.ModelSerializer):
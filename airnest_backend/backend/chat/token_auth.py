@@ -4,21 +4,23 @@ from urllib.parse import parse_qs
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-from rest_framework_simplejwt.tokens import AccessToken
 
-from useraccount.models import User
+from useraccount.authentication import acached_user, load_user, user_id_from_token
 
 
-@database_sync_to_async
-def get_user_from_token(token_key: str):
+async def get_user_from_token(token_key: str):
+    # token 校验只耗 CPU；用户优先从进程内缓存取，未命中才查库
     try:
-        token = AccessToken(token_key)
-        user_id = token.payload.get('user_id')
-        if not user_id:
-            return AnonymousUser()
-        return User.objects.get(pk=user_id)
+        user_id = user_id_from_token(token_key)
     except Exception:
         return AnonymousUser()
+    if not user_id:
+        return AnonymousUser()
+
+    user = await acached_user(user_id)
+    if user is None:
+        user = await database_sync_to_async(load_user)(user_id)
+    return user or AnonymousUser()
 
 
 def _get_cookie(scope, name: str) -> str | None:
@@ -4,6 +4,7 @@ from . import api
 
 urlpatterns = [
     path('', api.conversations_list, name='api_conversations_list'),
+    path('unread/', api.unread_counts, name='api_conversations_unread'),
     path('start/<uuid:user_id>/', api.conversations_start, name='api_conversations_start'),
     path('<uuid:pk>/', api.conversations_detail, name='api_conversations_detail'),
 ]
\ No newline at end of file
@@ -8,7 +8,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import DraftProperty, DraftPropertyImage, UploadSession
+from .models import DraftProperty, DraftPropertyImage, StoredMedia, UploadSession
 
 
 @admin.register(DraftProperty)
@@ -218,6 +218,10 @@ class UploadSessionAdmin(admin.ModelAdmin):
         ('上传统计', {
             'fields': ('total_files', 'uploaded_files', 'failed_files', 'progress_display')
         }),
+        ('分片上传', {
+            'fields': ('object_key', 'upload_id', 'content_type', 'file_size', 'part_size', 'part_count', 'etag'),
+            'classes': ('collapse',)
+        }),
         ('时间信息', {
             'fields': ('created_at', 'updated_at', 'expires_at', 'is_expired')
         }),
@@ -266,3 +270,13 @@ class UploadSessionAdmin(admin.ModelAdmin):
             text=text
         )
     is_expired.short_description = '状态'
+
+
+@admin.register(StoredMedia)
+class StoredMediaAdmin(admin.ModelAdmin):
+    """按内容寻址存储对象管理界面"""
+    
+    list_display = ['content_hash', 'object_key', 'ref_count', 'updated_at']
+    list_filter = ['updated_at']
+    search_fields = ['content_hash', 'object_key']
+    readonly_fields = ['content_hash', 'object_key', 'ref_count', 'created_at', 'updated_at']
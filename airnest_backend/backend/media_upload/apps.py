@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MediaUploadConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'media_upload'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,31 @@
+"""
+按内容寻址对象的引用计数
+
+图片行（PropertyImage / DraftPropertyImage）保存时根据对象键得到 content_hash，
+新建时引用数加一，删除时减一。引用数为 0 的 StoredMedia 由清理任务在宽限期后删除。
+上传签名命中已有对象时调用 touch 刷新 updated_at，客户端随后引用它之前不会被清理。
+"""
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import StoredMedia
+
+
+def acquire(content_hash, object_key, count=1):
+    StoredMedia.objects.get_or_create(content_hash=content_hash, defaults={'object_key': object_key})
+    StoredMedia.objects.filter(pk=content_hash).update(
+        ref_count=F('ref_count') + count, updated_at=timezone.now()
+    )
+
+
+def release(content_hash, count=1):
+    StoredMedia.objects.filter(pk=content_hash, ref_count__gte=count).update(
+        ref_count=F('ref_count') - count, updated_at=timezone.now()
+    )
+
+
+def touch(content_hash, object_key):
+    updated = StoredMedia.objects.filter(pk=content_hash).update(updated_at=timezone.now())
+    if not updated:
+        StoredMedia.objects.get_or_create(content_hash=content_hash, defaults={'object_key': object_key})
@@ -0,0 +1,41 @@
+"""
+management 命令共用：指向本地 S3 兼容服务（MinIO、moto_server 等）的 R2UploadService
+"""
+
+import boto3
+from botocore.exceptions import ClientError
+from django.core.management.base import CommandError
+
+from media_upload.services import R2UploadService
+
+
+def add_local_s3_arguments(parser, default_endpoint='http://127.0.0.1:9000'):
+    parser.add_argument('--endpoint-url', default=default_endpoint, help='S3-compatible endpoint')
+    parser.add_argument('--bucket', default='airnest-bench', help='Bucket to use (created if missing)')
+    parser.add_argument('--access-key', default='minioadmin')
+    parser.add_argument('--secret-key', default='minioadmin')
+
+
+def local_service(options):
+    service = R2UploadService()
+    service.s3_client = boto3.client(
+        's3',
+        endpoint_url=options['endpoint_url'],
+        aws_access_key_id=options['access_key'],
+        aws_secret_access_key=options['secret_key'],
+        region_name='us-east-1',
+        config=boto3.session.Config(
+            signature_version='s3v4',
+            max_pool_connections=R2UploadService.MAX_CONCURRENT_HEADS
+        ),
+    )
+    service.bucket_name = options['bucket']
+
+    try:
+        service.s3_client.head_bucket(Bucket=service.bucket_name)
+    except ClientError:
+        try:
+            service.s3_client.create_bucket(Bucket=service.bucket_name)
+        except ClientError as e:
+            raise CommandError(f'Cannot create bucket {service.bucket_name}: {e}')
+    return service
@@ -0,0 +1,156 @@
+from datetime import timedelta
+
+from botocore.exceptions import ClientError
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from media_upload.models import DraftPropertyImage, StoredMedia, UploadSession
+from media_upload.services import r2_upload_service
+from property.models import PropertyImage
+
+from ._local_s3 import add_local_s3_arguments, local_service
+
+# 只清理直传图片使用的前缀，头像、静态文件等由 Django storage 管理的对象不在范围内
+DEFAULT_PREFIXES = ['property-images/', 'properties/', 'content/']
+DELETE_BATCH_SIZE = 1000  # delete_objects 单次上限
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete R2 objects under the upload prefixes that no PropertyImage, DraftPropertyImage, '
+        'image variant or recently completed multipart upload references, once they are older than a grace '
+        'period; content-addressed objects also need a StoredMedia row idle for the grace period. '
+        'Also aborts expired multipart uploads'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report orphans without deleting anything')
+        parser.add_argument('--grace-hours', type=float, default=48, help='Keep unreferenced objects younger than this')
+        parser.add_argument('--prefix', action='append', dest='prefixes', help=f'Key prefix to scan (default: {DEFAULT_PREFIXES})')
+        add_local_s3_arguments(parser, default_endpoint=None)
+
+    def handle(self, *args, **options):
+        # 指定 --endpoint-url 时针对本地 S3 兼容服务运行，否则使用配置的 R2
+        service = local_service(options) if options['endpoint_url'] else r2_upload_service
+        try:
+            service._check_configuration()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        aborted = self._abort_expired_multipart(service, dry_run)
+        # 扫描期间变体可能被重新生成（如发布时重建图片行），删除前按该时间点重新检查
+        self.started_at = timezone.now()
+        referenced = self._referenced_keys(cutoff)
+        self.stdout.write(f'{len(referenced)} referenced keys')
+
+        scanned = orphans = orphan_bytes = deleted = 0
+        batch = []
+        for prefix in options['prefixes'] or DEFAULT_PREFIXES:
+            for obj in self._iter_objects(service, prefix):
+                scanned += 1
+                if obj['Key'] in referenced or obj['LastModified'] >= cutoff:
+                    continue
+                orphans += 1
+                orphan_bytes += obj['Size']
+                if dry_run:
+                    self.stdout.write(f'  would delete {obj["Key"]}')
+                    continue
+                batch.append(obj['Key'])
+                if len(batch) == DELETE_BATCH_SIZE:
+                    deleted += self._delete_batch(service, batch, cutoff)
+                    batch = []
+        if batch:
+            deleted += self._delete_batch(service, batch, cutoff)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        count = orphans if dry_run else deleted
+        self.stdout.write(f'Scanned {scanned} objects, {orphans} orphans ({orphan_bytes / (1024 * 1024):.1f}MB)')
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {count} objects; {"would abort" if dry_run else "aborted"} {aborted} expired multipart uploads'
+        ))
+
+    def _referenced_keys(self, cutoff):
+        keys = set(PropertyImage.objects.exclude(object_key='').values_list('object_key', flat=True).iterator())
+        # 软删除草稿的图片不再算引用
+        keys.update(
+            DraftPropertyImage.objects.exclude(draft_property__status='deleted')
+            .values_list('object_key', flat=True).iterator()
+        )
+        keys.update(self._variant_keys(PropertyImage.objects.all()))
+        keys.update(self._completed_multipart(cutoff).values_list('object_key', flat=True).iterator())
+        keys.update(self._live_content(cutoff).values_list('object_key', flat=True).iterator())
+        return keys
+
+    def _variant_keys(self, images):
+        keys = set()
+        for variants in images.exclude(variants={}).values_list('variants', flat=True).iterator():
+            keys.update(variant['key'] for variant in variants.values() if 'key' in variant)
+        return keys
+
+    def _completed_multipart(self, cutoff):
+        # 刚合并、还没来得及被引用的对象在宽限期内保留；之后只有被图片行引用才算
+        return UploadSession.objects.filter(status='completed', updated_at__gte=cutoff).exclude(upload_id='')
+
+    def _live_content(self, cutoff):
+        # 按内容寻址的对象：还有引用，或宽限期内被引用过 / 被去重命中过，都不能删
+        return StoredMedia.objects.filter(Q(ref_count__gt=0) | Q(updated_at__gte=cutoff))
+
+    def _referenced_now(self, keys, cutoff):
+        referenced = set(PropertyImage.objects.filter(object_key__in=keys).values_list('object_key', flat=True))
+        referenced.update(
+            DraftPropertyImage.objects.filter(object_key__in=keys).exclude(draft_property__status='deleted')
+            .values_list('object_key', flat=True)
+        )
+        referenced.update(
+            self._completed_multipart(cutoff).filter(object_key__in=keys).values_list('object_key', flat=True)
+        )
+        # 扫描开始后写入过变体的图片
+        touched = self._variant_keys(PropertyImage.objects.filter(updated_at__gte=self.started_at))
+        referenced.update(key for key in keys if key in touched)
+        referenced.update(self._live_content(cutoff).filter(object_key__in=keys).values_list('object_key', flat=True))
+        return referenced
+
+    def _iter_objects(self, service, prefix):
+        paginator = service.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=service.bucket_name, Prefix=prefix):
+            yield from page.get('Contents', [])
+
+    def _delete_batch(self, service, keys, cutoff):
+        # 引用集合是开始时的快照；删除前再查一次，避免误删期间被重新引用（如按内容去重命中）的旧对象
+        referenced = self._referenced_now(keys, cutoff)
+        keys = [key for key in keys if key not in referenced]
+        if not keys:
+            return 0
+        try:
+            response = service.s3_client.delete_objects(
+                Bucket=service.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+            )
+        except ClientError as e:
+            self.stderr.write(f'Batch delete of {len(keys)} objects failed: {e}')
+            return 0
+
+        errors = response.get('Errors', [])
+        for error in errors:
+            self.stderr.write(f'  {error["Key"]}: {error.get("Code")} {error.get("Message", "")}')
+        failed = {error['Key'] for error in errors}
+        removed = [key for key in keys if key not in failed]
+        # 按内容寻址的对象删除后，对应的 StoredMedia 记录也不再需要
+        StoredMedia.objects.filter(object_key__in=removed, ref_count=0, updated_at__lt=cutoff).delete()
+        return len(removed)
+
+    def _abort_expired_multipart(self, service, dry_run):
+        sessions = UploadSession.objects.filter(status='uploading', expires_at__lt=timezone.now()).exclude(upload_id='')
+        if dry_run:
+            return sessions.count()
+        aborted = 0
+        for session in sessions.iterator():
+            service.abort_multipart_upload(session.object_key, session.upload_id)
+            session.status = 'expired'
+            session.save(update_fields=['status', 'updated_at'])
+            aborted += 1
+        return aborted
@@ -0,0 +1,73 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ._local_s3 import add_local_s3_arguments, local_service
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare serial verify-then-get_file_info (two HEADs per object) with the concurrent '
+        'single-HEAD path against a local S3-compatible server (MinIO, moto_server, ...)'
+    )
+
+    def add_arguments(self, parser):
+        add_local_s3_arguments(parser)
+        parser.add_argument('--objects', type=int, default=20, help='Objects verified per request')
+        parser.add_argument('--missing', type=int, default=2, help='How many of them do not exist')
+        parser.add_argument('--rounds', type=int, default=5, help='Verification rounds per strategy')
+        parser.add_argument(
+            '--rtt-ms', type=float, default=0.0,
+            help='Extra latency added to every HEAD to simulate the round trip to R2'
+        )
+
+    def handle(self, *args, **options):
+        service = local_service(options)
+
+        if options['rtt_ms']:
+            delay = options['rtt_ms'] / 1000
+            service.s3_client.meta.events.register(
+                'before-send.s3.HeadObject', lambda **kwargs: time.sleep(delay)
+            )
+
+        keys = self._setup(service, options['objects'], options['missing'])
+        try:
+            serial = self._time(options['rounds'], lambda: self._serial(service, keys))
+            concurrent = self._time(options['rounds'], lambda: service.get_files_info(keys))
+            # 两种方式的结果必须一致
+            expected = {key for key, info in self._serial(service, keys).items() if info}
+            actual = {key for key, info in service.get_files_info(keys).items() if info}
+        finally:
+            for key in keys:
+                service.delete_file(key)
+
+        if expected != actual:
+            raise CommandError('Concurrent verification returned different results')
+
+        self.stdout.write(f'Objects per request: {len(keys)} ({len(keys) - len(actual)} missing), rounds: {options["rounds"]}')
+        self.stdout.write(f'Serial, two HEADs per object: {serial * 1000:.1f} ms per request')
+        self.stdout.write(f'Concurrent, one HEAD per object: {concurrent * 1000:.1f} ms per request')
+        self.stdout.write(self.style.SUCCESS(f'Speedup x{serial / concurrent:.1f}'))
+
+    def _setup(self, service, count, missing):
+        client = service.s3_client
+        prefix = f'verify-bench/{uuid.uuid4().hex[:8]}'
+        keys = [f'{prefix}/{i}.jpg' for i in range(count)]
+        for key in keys[:max(count - missing, 0)]:
+            client.put_object(Bucket=service.bucket_name, Key=key, Body=b'\xff\xd8' + b'0' * 1024, ContentType='image/jpeg')
+        return keys
+
+    def _serial(self, service, keys):
+        # 与原来的 verify_upload 相同：先判断是否存在，存在再取一次文件信息
+        results = {}
+        for key in keys:
+            results[key] = service.get_file_info(key) if service.verify_upload_success(key) else None
+        return results
+
+    def _time(self, rounds, fn):
+        fn()  # 预热连接池
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - started) / rounds
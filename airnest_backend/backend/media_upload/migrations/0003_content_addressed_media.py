@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_upload', '0002_uploadsession_multipart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredMedia',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('object_key', models.CharField(max_length=500)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='stored_media_refs_idx')],
+            },
+        ),
+        # 同一对象可被多个草稿引用，去掉唯一约束（Meta 中已有 object_key 普通索引）
+        migrations.AlterField(
+            model_name='draftpropertyimage',
+            name='object_key',
+            field=models.CharField(max_length=500),
+        ),
+        migrations.AddField(
+            model_name='draftpropertyimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
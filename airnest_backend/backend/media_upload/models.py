@@ -5,7 +5,8 @@
 """
 
 import uuid
-from django.db import models
+from collections import Counter
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
@@ -129,6 +130,72 @@ class DraftProperty(models.Model):
         
         self.save()
     
+    def attach_images(self, images_data):
+        """
+        批量添加图片
+        
+        一次查询过滤掉草稿中已有的对象键，bulk_create 插入，主图和完成状态各处理一次，
+        全部在同一个事务内完成；不再逐张 save（每张都会触发主图更新和完成状态重算）。
+        同一批中有多张 is_main 时以最后一张为准，与逐张保存的结果一致。
+        
+        Args:
+            images_data: 图片信息列表，缺少必需字段或对象键重复的条目被跳过
+        
+        Returns:
+            list: 新建的 DraftPropertyImage
+        """
+        from . import dedup
+        from .services import content_hash_from_key
+        
+        required_fields = ['object_key', 'file_url', 'file_size', 'content_type']
+        valid = [
+            img_data for img_data in images_data
+            if isinstance(img_data, dict) and all(field in img_data for field in required_fields)
+        ]
+        
+        with transaction.atomic():
+            seen = set(
+                self.images.filter(
+                    object_key__in=[img_data['object_key'] for img_data in valid]
+                ).values_list('object_key', flat=True)
+            )
+            images = []
+            for img_data in valid:
+                if img_data['object_key'] in seen:
+                    continue
+                seen.add(img_data['object_key'])
+                images.append(DraftPropertyImage(
+                    draft_property=self,
+                    object_key=img_data['object_key'],
+                    content_hash=content_hash_from_key(img_data['object_key']),
+                    file_url=img_data['file_url'],
+                    file_size=img_data['file_size'],
+                    content_type=img_data['content_type'],
+                    etag=img_data.get('etag', ''),
+                    order=img_data.get('order', 0),
+                    is_main=bool(img_data.get('is_main', False)),
+                    alt_text=img_data.get('alt_text', '')
+                ))
+            if not images:
+                return []
+            
+            main_images = [image for image in images if image.is_main]
+            if main_images:
+                for image in main_images[:-1]:
+                    image.is_main = False
+                self.images.filter(is_main=True).update(is_main=False)
+            
+            DraftPropertyImage.objects.bulk_create(images)
+            
+            # bulk_create 不触发信号，按内容哈希合并后更新引用计数
+            for content_hash, count in Counter(image.content_hash for image in images if image.content_hash).items():
+                object_key = next(image.object_key for image in images if image.content_hash == content_hash)
+                dedup.acquire(content_hash, object_key, count=count)
+            
+            self.update_completion_status()
+        
+        return images
+    
     @staticmethod
     def clean_expired_drafts(user, days=30):
         """清理过期的草稿 (静态方法)"""
@@ -154,7 +221,8 @@ class DraftPropertyImage(models.Model):
     draft_property = models.ForeignKey(DraftProperty, on_delete=models.CASCADE, related_name='images')
     
     # R2存储信息
-    object_key = models.CharField(max_length=500, unique=True)  # R2对象键
+    object_key = models.CharField(max_length=500)  # R2对象键，按内容去重后可被多张图片共用
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # 内容 SHA-256，按内容寻址时有值
     file_url = models.URLField(max_length=500)  # 公开访问URL
     file_size = models.BigIntegerField()  # 文件大小(字节)
     content_type = models.CharField(max_length=100)  # MIME类型
@@ -217,7 +285,8 @@ class UploadSession(models.Model):
     """
     上传会话模型
     
-    跟踪批量上传的状态和进度
+    跟踪批量上传的状态和进度；分片上传（multipart）时每个会话对应一个对象，
+    已上传的分片以存储端 ListParts 为准，断线后可据此续传
     """
     
     STATUS_CHOICES = [
@@ -246,6 +315,15 @@ class UploadSession(models.Model):
     uploaded_files = models.IntegerField(default=0)
     failed_files = models.IntegerField(default=0)
     
+    # 分片上传信息
+    object_key = models.CharField(max_length=500, blank=True)
+    upload_id = models.CharField(max_length=1024, blank=True)  # R2 multipart UploadId
+    content_type = models.CharField(max_length=100, blank=True)
+    file_size = models.BigIntegerField(default=0)
+    part_size = models.BigIntegerField(default=0)
+    part_count = models.IntegerField(default=0)
+    etag = models.CharField(max_length=100, blank=True)  # 完成后的对象 ETag
+    
     # 时间信息
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -264,6 +342,10 @@ class UploadSession(models.Model):
     def __str__(self):
         return f"Upload Session {self.id} ({self.status})"
     
+    @property
+    def is_multipart(self):
+        return bool(self.upload_id)
+    
     @property
     def is_expired(self):
         """检查会话是否过期"""
@@ -297,3 +379,27 @@ class UploadSession(models.Model):
             self.status = 'uploading'
         
         self.save()
+
+
+class StoredMedia(models.Model):
+    """
+    按内容寻址存储的媒体对象
+    
+    相同内容（SHA-256）只存一份，ref_count 为引用它的 PropertyImage / DraftPropertyImage 行数，
+    由 media_upload.signals 维护；降为 0 的对象在宽限期后可以回收
+    """
+    
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    object_key = models.CharField(max_length=500)
+    ref_count = models.IntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='stored_media_refs_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.object_key} ({self.ref_count} refs)"
@@ -4,8 +4,12 @@ Cloudflare R2 预签名上传服务
 提供安全的直传功能，支持图片上传到 Cloudflare R2 存储
 """
 
+import base64
 import boto3
+import math
+import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 from django.conf import settings
@@ -33,6 +37,26 @@ class R2UploadService:
     # 预签名URL有效期 (15分钟)
     PRESIGNED_URL_EXPIRY = 15 * 60
     
+    # 按内容寻址的对象键前缀：content/<哈希前两位>/<sha256><扩展名>
+    CONTENT_PREFIX = 'content'
+    
+    # 批量验证时并发 HEAD 请求数（同时也是客户端连接池大小）
+    MAX_CONCURRENT_HEADS = 10
+    
+    # 分片上传：大图与视频，前端并行上传各分片
+    MULTIPART_ALLOWED_TYPES = {
+        **ALLOWED_IMAGE_TYPES,
+        'video/mp4': '.mp4',
+        'video/quicktime': '.mov',
+        'video/webm': '.webm',
+    }
+    MULTIPART_MAX_FILE_SIZE = 5 * 1024 * 1024 * 1024  # 5GB
+    MULTIPART_PART_SIZE = 8 * 1024 * 1024  # 默认分片大小 8MB
+    MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024  # S3/R2 要求除最后一片外不小于 5MB
+    MULTIPART_MAX_PARTS = 10000
+    # 分片URL有效期更长，便于断线后继续使用；过期后可重新签发
+    MULTIPART_URL_EXPIRY = 60 * 60
+    
     def __init__(self):
         """初始化R2客户端"""
         self.s3_client = None
@@ -51,7 +75,10 @@ class R2UploadService:
                 aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
                 aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
                 region_name=getattr(settings, 'AWS_S3_REGION_NAME', 'auto'),
-                config=boto3.session.Config(signature_version='s3v4')
+                config=boto3.session.Config(
+                    signature_version='s3v4',
+                    max_pool_connections=self.MAX_CONCURRENT_HEADS
+                )
             )
             self.bucket_name = settings.AWS_STORAGE_BUCKET_NAME
     
@@ -72,7 +99,7 @@ class R2UploadService:
             完整的对象键路径
         """
         # 获取文件扩展名
-        extension = self.ALLOWED_IMAGE_TYPES.get(file_type, '.jpg')
+        extension = self.MULTIPART_ALLOWED_TYPES.get(file_type, '.jpg')
         
         # 生成唯一标识符
         unique_id = str(uuid.uuid4())
@@ -85,6 +112,22 @@ class R2UploadService:
         filename = f"{unique_id}_{timestamp}{extension}"
         return f"{prefix}/{date_path}/{filename}"
     
+    def normalize_content_hash(self, content_hash: str) -> str:
+        """
+        校验前端计算的 SHA-256（十六进制）
+        
+        Raises:
+            ValidationError: 格式不正确
+        """
+        if not isinstance(content_hash, str) or not re.fullmatch(r'[0-9a-fA-F]{64}', content_hash):
+            raise ValidationError("content_hash 必须是64位十六进制的 SHA-256")
+        return content_hash.lower()
+    
+    def content_key(self, content_hash: str, file_type: str) -> str:
+        """按内容生成对象键，相同内容总是得到同一个键"""
+        extension = self.MULTIPART_ALLOWED_TYPES.get(file_type, '.jpg')
+        return f"{self.CONTENT_PREFIX}/{content_hash[:2]}/{content_hash}{extension}"
+    
     def validate_upload_request(self, file_type: str, file_size: int) -> None:
         """
         验证上传请求
@@ -113,15 +156,21 @@ class R2UploadService:
         self, 
         file_type: str, 
         file_size: int,
-        prefix: str = 'property-images'
-    ) -> Dict[str, str]:
+        prefix: str = 'property-images',
+        content_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         生成预签名上传URL
         
+        提供 content_hash 时使用按内容寻址的对象键：同样内容已经存在时直接返回已有对象
+        （deduplicated 为 true，upload_url 为 None），前端跳过上传；否则签名中带上
+        x-amz-checksum-sha256，存储端会拒绝与哈希不符的内容。
+        
         Args:
             file_type: 文件MIME类型
             file_size: 文件大小(字节)  
-            prefix: 存储路径前缀
+            prefix: 存储路径前缀（按内容寻址时不使用）
+            content_hash: 可选，文件内容的 SHA-256（十六进制）
             
         Returns:
             包含上传URL和对象键的字典
@@ -136,31 +185,59 @@ class R2UploadService:
         # 验证请求
         self.validate_upload_request(file_type, file_size)
         
-        # 生成唯一对象键
-        object_key = self.generate_unique_key(file_type, prefix)
+        params = {
+            'Bucket': self.bucket_name,
+            'ContentType': file_type
+        }
+        required_headers = {'Content-Type': file_type}
+        
+        if content_hash:
+            content_hash = self.normalize_content_hash(content_hash)
+            object_key = self.content_key(content_hash, file_type)
+            
+            # 键由内容决定，且上传时校验了哈希，已存在的对象就是同一份内容
+            existing = self.get_file_info(object_key)
+            if existing is not None:
+                # 刷新 StoredMedia.updated_at，客户端引用之前清理任务在宽限期内不会删掉它
+                from .dedup import touch
+                touch(content_hash, object_key)
+                return {
+                    'upload_url': None,
+                    'deduplicated': True,
+                    'object_key': object_key,
+                    'file_url': existing['file_url'],
+                    'content_hash': content_hash,
+                    'content_type': existing['content_type'] or file_type,
+                    'size': existing['size']
+                }
+            
+            checksum = base64.b64encode(bytes.fromhex(content_hash)).decode()
+            params['ChecksumSHA256'] = checksum
+            required_headers['x-amz-checksum-sha256'] = checksum
+        else:
+            # 生成唯一对象键
+            object_key = self.generate_unique_key(file_type, prefix)
+        
+        params['Key'] = object_key
         
         try:
             # 生成预签名PUT URL (R2支持PUT而不是POST)
             presigned_url = self.s3_client.generate_presigned_url(
                 'put_object',
-                Params={
-                    'Bucket': self.bucket_name,
-                    'Key': object_key,
-                    'ContentType': file_type
-                },
+                Params=params,
                 ExpiresIn=self.PRESIGNED_URL_EXPIRY
             )
             
             # 构造完整的文件URL（用于前端预览和后端保存）
-            if hasattr(settings, 'AWS_S3_CUSTOM_DOMAIN') and settings.AWS_S3_CUSTOM_DOMAIN:
-                file_url = f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{object_key}"
-            else:
-                file_url = f"{settings.AWS_S3_ENDPOINT_URL}/{self.bucket_name}/{object_key}"
+            file_url = self.build_file_url(object_key)
             
             return {
                 'upload_url': presigned_url,
+                'deduplicated': False,
                 'object_key': object_key,
                 'file_url': file_url,
+                'content_hash': content_hash or None,
+                'required_headers': required_headers,
                 'expires_in': self.PRESIGNED_URL_EXPIRY,
                 'max_file_size': self.MAX_FILE_SIZE,
                 'content_type': file_type
@@ -194,6 +271,7 @@ class R2UploadService:
             try:
                 file_type = request.get('file_type')
                 file_size = request.get('file_size')
+                content_hash = request.get('content_hash')
                 
                 if not file_type or not file_size:
                     results.append({
@@ -205,7 +283,8 @@ class R2UploadService:
                 presigned_data = self.generate_presigned_upload_url(
                     file_type=file_type,
                     file_size=file_size,
-                    prefix=prefix
+                    prefix=prefix,
+                    content_hash=content_hash
                 )
                 
                 results.append({
@@ -226,6 +305,12 @@ class R2UploadService:
         
         return results
     
+    def build_file_url(self, object_key: str) -> str:
+        """构造公开访问URL"""
+        if hasattr(settings, 'AWS_S3_CUSTOM_DOMAIN') and settings.AWS_S3_CUSTOM_DOMAIN:
+            return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{object_key}"
+        return f"{settings.AWS_S3_ENDPOINT_URL}/{self.bucket_name}/{object_key}"
+    
     def verify_upload_success(self, object_key: str) -> bool:
         """
         验证文件是否已成功上传到R2
@@ -257,15 +342,9 @@ class R2UploadService:
             self._check_configuration()
             response = self.s3_client.head_object(Bucket=self.bucket_name, Key=object_key)
             
-            # 构造公开访问URL
-            if hasattr(settings, 'AWS_S3_CUSTOM_DOMAIN') and settings.AWS_S3_CUSTOM_DOMAIN:
-                file_url = f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{object_key}"
-            else:
-                file_url = f"{settings.AWS_S3_ENDPOINT_URL}/{self.bucket_name}/{object_key}"
-            
             return {
                 'object_key': object_key,
-                'file_url': file_url,
+                'file_url': self.build_file_url(object_key),
                 'size': response.get('ContentLength', 0),
                 'content_type': response.get('ContentType', ''),
                 'last_modified': response.get('LastModified'),
@@ -277,6 +356,209 @@ class R2UploadService:
         except ValueError:
             return None
     
+    def get_files_info(self, object_keys: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        批量获取文件信息：每个对象只发一次 HEAD，并发执行
+        
+        存在性与文件信息来自同一个 HEAD 响应，不再先 verify_upload_success 再 get_file_info。
+        boto3 client 是线程安全的，线程数受 MAX_CONCURRENT_HEADS 限制。
+        
+        Args:
+            object_keys: 对象键列表
+            
+        Returns:
+            {对象键: 文件信息字典或None}，None 表示文件不存在或无法访问
+        """
+        object_keys = list(dict.fromkeys(object_keys))
+        if len(object_keys) <= 1:
+            return {key: self.get_file_info(key) for key in object_keys}
+        
+        workers = min(self.MAX_CONCURRENT_HEADS, len(object_keys))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(object_keys, executor.map(self.get_file_info, object_keys)))
+    
+    def plan_parts(self, file_size: int) -> Tuple[int, int]:
+        """
+        计算分片大小和分片数
+        
+        Returns:
+            (part_size, part_count)
+        """
+        part_size = max(self.MULTIPART_PART_SIZE, math.ceil(file_size / self.MULTIPART_MAX_PARTS))
+        return part_size, max(1, math.ceil(file_size / part_size))
+    
+    def create_multipart_upload(
+        self,
+        file_type: str,
+        file_size: int,
+        prefix: str = 'property-images'
+    ) -> Dict[str, Any]:
+        """
+        创建分片上传
+        
+        Args:
+            file_type: 文件MIME类型
+            file_size: 文件大小(字节)
+            prefix: 存储路径前缀
+            
+        Returns:
+            包含 upload_id、对象键、分片规划的字典
+            
+        Raises:
+            ValidationError: 验证失败或R2服务错误
+        """
+        self._check_configuration()
+        
+        if file_type not in self.MULTIPART_ALLOWED_TYPES:
+            allowed_types = ', '.join(self.MULTIPART_ALLOWED_TYPES.keys())
+            raise ValidationError(f"不支持的文件类型。支持的类型: {allowed_types}")
+        if file_size <= 0:
+            raise ValidationError("文件大小必须大于0")
+        if file_size > self.MULTIPART_MAX_FILE_SIZE:
+            max_size_gb = self.MULTIPART_MAX_FILE_SIZE / (1024 * 1024 * 1024)
+            raise ValidationError(f"文件大小超出限制。最大允许: {max_size_gb}GB")
+        
+        object_key = self.generate_unique_key(file_type, prefix)
+        part_size, part_count = self.plan_parts(file_size)
+        
+        try:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=object_key,
+                ContentType=file_type
+            )
+        except ClientError as e:
+            raise ValidationError(f"创建分片上传失败: {str(e)}")
+        
+        return {
+            'upload_id': response['UploadId'],
+            'object_key': object_key,
+            'file_url': self.build_file_url(object_key),
+            'part_size': part_size,
+            'part_count': part_count,
+            'content_type': file_type
+        }
+    
+    def presign_upload_parts(self, object_key: str, upload_id: str, part_numbers: List[int]) -> List[Dict[str, Any]]:
+        """
+        为分片签发上传URL（本地签名，不访问R2）
+        
+        Returns:
+            [{'part_number': n, 'upload_url': ...}, ...]
+        """
+        self._check_configuration()
+        return [
+            {
+                'part_number': part_number,
+                'upload_url': self.s3_client.generate_presigned_url(
+                    'upload_part',
+                    Params={
+                        'Bucket': self.bucket_name,
+                        'Key': object_key,
+                        'UploadId': upload_id,
+                        'PartNumber': part_number
+                    },
+                    ExpiresIn=self.MULTIPART_URL_EXPIRY
+                )
+            }
+            for part_number in part_numbers
+        ]
+    
+    def list_uploaded_parts(self, object_key: str, upload_id: str) -> List[Dict[str, Any]]:
+        """
+        列出已上传的分片（断线续传以此为准）
+        
+        Raises:
+            ValidationError: 上传不存在（已完成、已取消或已过期）
+        """
+        self._check_configuration()
+        parts = []
+        marker = 0
+        try:
+            while True:
+                response = self.s3_client.list_parts(
+                    Bucket=self.bucket_name,
+                    Key=object_key,
+                    UploadId=upload_id,
+                    PartNumberMarker=marker
+                )
+                for part in response.get('Parts', []):
+                    parts.append({
+                        'part_number': part['PartNumber'],
+                        'etag': part['ETag'],
+                        'size': part['Size']
+                    })
+                if not response.get('IsTruncated'):
+                    break
+                marker = response['NextPartNumberMarker']
+        except ClientError as e:
+            raise ValidationError(f"获取分片列表失败: {str(e)}")
+        return parts
+    
+    def complete_multipart_upload(self, object_key: str, upload_id: str, part_count: int,
+                                  part_size: int, file_size: int) -> Dict[str, Any]:
+        """
+        合并分片
+        
+        分片 ETag 取自 ListParts，不依赖前端上报（浏览器默认读不到跨域响应的 ETag 头）；
+        预签名 URL 不限制分片大小，合并前按创建时声明的 part_size / file_size 校验
+        
+        Raises:
+            ValidationError: 分片不完整（code='incomplete'，可续传）、
+                分片大小与声明不符（code='size_mismatch'）或R2服务错误
+        """
+        parts = self.list_uploaded_parts(object_key, upload_id)
+        uploaded = {part['part_number'] for part in parts}
+        missing = [n for n in range(1, part_count + 1) if n not in uploaded]
+        if missing:
+            raise ValidationError(f"还有 {len(missing)} 个分片未上传", code='incomplete')
+        
+        parts = [part for part in parts if part['part_number'] <= part_count]
+        wrong_size = [
+            part['part_number'] for part in parts
+            if part['part_number'] < part_count and part['size'] != part_size
+        ]
+        total_size = sum(part['size'] for part in parts)
+        if wrong_size or total_size != file_size:
+            raise ValidationError(
+                f"分片大小与声明不符（总大小 {total_size}，应为 {file_size}）", code='size_mismatch'
+            )
+        
+        try:
+            response = self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=object_key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    'Parts': [
+                        {'PartNumber': part['part_number'], 'ETag': part['etag']}
+                        for part in parts
+                    ]
+                }
+            )
+        except ClientError as e:
+            raise ValidationError(f"合并分片失败: {str(e)}")
+        
+        return {
+            'object_key': object_key,
+            'file_url': self.build_file_url(object_key),
+            'size': total_size,
+            'etag': response.get('ETag', '').strip('"')
+        }
+    
+    def abort_multipart_upload(self, object_key: str, upload_id: str) -> bool:
+        """取消分片上传，释放已上传分片占用的存储"""
+        try:
+            self._check_configuration()
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=object_key,
+                UploadId=upload_id
+            )
+            return True
+        except (ClientError, ValueError):
+            return False
+    
     def delete_file(self, object_key: str) -> bool:
         """
         删除R2中的文件
@@ -295,5 +577,13 @@ class R2UploadService:
             return False
 
 
+def content_hash_from_key(object_key: str) -> str:
+    """从按内容寻址的对象键中取出 SHA-256，其他键返回空字符串"""
+    match = re.match(
+        rf'^{R2UploadService.CONTENT_PREFIX}/[0-9a-f]{{2}}/([0-9a-f]{{64}})\.[a-z0-9]+$', object_key or ''
+    )
+    return match.group(1) if match else ''
+
+
 # 全局服务实例
 r2_upload_service = R2UploadService()
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+图片行的内容哈希与引用计数
+
+- 保存前根据按内容寻址的对象键补上 content_hash
+- 新建 / 删除时增减 StoredMedia.ref_count（queryset.delete 与级联删除同样会触发）
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from property.models import PropertyImage
+
+from . import dedup
+from .models import DraftPropertyImage
+from .services import content_hash_from_key
+
+
+@receiver(pre_save, sender=PropertyImage)
+@receiver(pre_save, sender=DraftPropertyImage)
+def image_pre_save(sender, instance, raw=False, **kwargs):
+    if not instance.content_hash:
+        instance.content_hash = content_hash_from_key(instance.object_key)
+
+
+@receiver(post_save, sender=PropertyImage)
+@receiver(post_save, sender=DraftPropertyImage)
+def image_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.content_hash:
+        dedup.acquire(instance.content_hash, instance.object_key)
+
+
+@receiver(post_delete, sender=PropertyImage)
+@receiver(post_delete, sender=DraftPropertyImage)
+def image_deleted(sender, instance, **kwargs):
+    if instance.content_hash:
+        dedup.release(instance.content_hash)
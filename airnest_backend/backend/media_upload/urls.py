@@ -23,6 +23,19 @@ urlpatterns = [
     # 删除已上传文件
     path('delete-file/', views.delete_uploaded_file, name='delete_uploaded_file'),
     
+    # ================== 分片上传 API ==================
+    # 创建分片上传
+    path('multipart/', views.create_multipart_upload, name='create_multipart_upload'),
+    
+    # 查询进度 (GET) / 取消上传 (DELETE)
+    path('multipart/<uuid:session_id>/', views.multipart_upload_detail, name='multipart_upload_detail'),
+    
+    # 重新签发分片URL
+    path('multipart/<uuid:session_id>/parts/', views.presign_multipart_parts, name='presign_multipart_parts'),
+    
+    # 合并分片
+    path('multipart/<uuid:session_id>/complete/', views.complete_multipart_upload, name='complete_multipart_upload'),
+    
     # ================== 草稿房源管理 API ==================
     # 草稿房源列表和创建 (GET列表, POST创建)
     path('draft-properties/', views.draft_properties_list_create, name='draft_properties_list_create'),
@@ -10,8 +10,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.core.exceptions import ValidationError
 from django.views.decorators.http import require_http_methods
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from datetime import timedelta
 from typing import Dict, List, Any
 import logging
 
@@ -31,14 +33,17 @@ def get_presigned_upload_url(request):
     {
         "file_type": "image/jpeg",
         "file_size": 1024000,
-        "prefix": "property-images"  // 可选，默认为 "property-images"
+        "prefix": "property-images",  // 可选，默认为 "property-images"
+        "content_hash": "9f86d0..."   // 可选，文件的 SHA-256；提供时按内容去重
     }
     
     Returns:
     {
         "success": true,
         "data": {
-            "upload_url": "https://...",
+            "upload_url": "https://...",  // 内容已存在时为 null，无需上传
+            "deduplicated": false,
+            "required_headers": {...},  // PUT 时需要带上的请求头
             "form_fields": {...},
             "object_key": "property-images/2025/01/18/uuid_timestamp.jpg",
             "file_url": "https://cdn.airnest.me/property-images/...",
@@ -51,6 +56,7 @@ def get_presigned_upload_url(request):
         # 获取请求数据
         file_type = request.data.get('file_type')
         file_size = request.data.get('file_size')
+        content_hash = request.data.get('content_hash')
         property_id = request.data.get('propertyId') or request.data.get('property_id')
         prefix = request.data.get('prefix')
         
@@ -77,12 +83,14 @@ def get_presigned_upload_url(request):
         presigned_data = r2_upload_service.generate_presigned_upload_url(
             file_type=file_type,
             file_size=file_size,
-            prefix=prefix
+            prefix=prefix,
+            content_hash=content_hash
         )
         
         # 记录成功日志
         logger.info(f"Generated presigned URL for user {request.user.id}, "
-                   f"file_type: {file_type}, size: {file_size}, prefix: {prefix}")
+                   f"file_type: {file_type}, size: {file_size}, prefix: {prefix}, "
+                   f"deduplicated: {presigned_data['deduplicated']}")
         
         return Response({
             'success': True,
@@ -117,7 +125,8 @@ def get_batch_presigned_upload_urls(request):
         "uploads": [
             {
                 "file_type": "image/jpeg",
-                "file_size": 1024000
+                "file_size": 1024000,
+                "content_hash": "9f86d0..."  // 可选
             },
             {
                 "file_type": "image/png", 
@@ -248,7 +257,10 @@ def verify_upload(request):
                 'error': '单次批量验证最多支持20个文件'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 验证每个文件的上传状态
+        # 每个文件一次 HEAD，并发验证
+        valid_keys = [key for key in object_keys if isinstance(key, str) and key.strip()]
+        files_info = r2_upload_service.get_files_info(valid_keys)
+        
         verification_results = []
         
         for object_key in object_keys:
@@ -261,16 +273,10 @@ def verify_upload(request):
                 })
                 continue
             
-            # 检查文件是否存在
-            uploaded = r2_upload_service.verify_upload_success(object_key)
-            file_info = None
-            
-            if uploaded:
-                file_info = r2_upload_service.get_file_info(object_key)
-            
+            file_info = files_info.get(object_key)
             verification_results.append({
                 'object_key': object_key,
-                'uploaded': uploaded,
+                'uploaded': file_info is not None,
                 'file_info': file_info
             })
         
@@ -297,12 +303,28 @@ def verify_upload(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _is_shared_object(object_key):
+    from property.models import PropertyImage
+    from .models import DraftPropertyImage, StoredMedia
+    
+    if object_key.startswith(f'{r2_upload_service.CONTENT_PREFIX}/'):
+        return True
+    return (
+        PropertyImage.objects.filter(object_key=object_key).exists()
+        or DraftPropertyImage.objects.filter(object_key=object_key).exists()
+        or StoredMedia.objects.filter(object_key=object_key, ref_count__gt=0).exists()
+    )
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_uploaded_file(request):
     """
     删除已上传的文件
     
+    只能删除尚未被任何图片引用的普通上传；content/ 下的共享对象和已被引用的对象返回 409，
+    由 gc_orphaned_media 在引用全部释放后清理
+    
     DELETE /api/media/delete-file/
     {
         "object_key": "property-images/2025/01/18/uuid_timestamp.jpg"
@@ -323,6 +345,13 @@ def delete_uploaded_file(request):
                 'error': '缺少必需字段: object_key'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # 按内容寻址的对象可能被多个房源共享，已被引用的对象也不能直接删除，统一交给清理任务
+        if _is_shared_object(object_key):
+            return Response({
+                'success': False,
+                'error': '文件正在被使用，不能删除'
+            }, status=status.HTTP_409_CONFLICT)
+        
         # 删除文件
         deleted = r2_upload_service.delete_file(object_key)
         
@@ -346,6 +375,354 @@ def delete_uploaded_file(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# ================== 分片上传 API ==================
+
+# 分片上传会话有效期：覆盖弱网下的断线续传
+MULTIPART_SESSION_TTL = timedelta(hours=24)
+
+
+def _multipart_session_data(session):
+    return {
+        'session_id': str(session.id),
+        'status': session.status,
+        'object_key': session.object_key,
+        'file_url': r2_upload_service.build_file_url(session.object_key),
+        'file_size': session.file_size,
+        'content_type': session.content_type,
+        'part_size': session.part_size,
+        'part_count': session.part_count,
+        'expires_at': session.expires_at,
+    }
+
+
+def _get_multipart_session(request, session_id):
+    from .models import UploadSession
+    
+    return UploadSession.objects.filter(
+        id=session_id, user=request.user
+    ).exclude(upload_id='').first()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def create_multipart_upload(request):
+    """
+    创建分片上传，返回所有分片的预签名URL，前端可并行上传
+    
+    POST /api/media/multipart/
+    {
+        "file_type": "video/mp4",
+        "file_size": 104857600,
+        "prefix": "property-images",  // 可选
+        "draft_property_id": "uuid"   // 可选
+    }
+    
+    Returns:
+    {
+        "success": true,
+        "data": {
+            "session_id": "uuid",
+            "object_key": "...",
+            "part_size": 8388608,
+            "part_count": 13,
+            "parts": [{"part_number": 1, "upload_url": "https://..."}, ...],
+            "expires_in": 3600
+        }
+    }
+    """
+    from .models import DraftProperty, UploadSession
+    
+    try:
+        file_type = request.data.get('file_type')
+        file_size = request.data.get('file_size')
+        property_id = request.data.get('propertyId') or request.data.get('property_id')
+        draft_property_id = request.data.get('draft_property_id')
+        prefix = request.data.get('prefix')
+        
+        if property_id:
+            prefix = f'properties/{property_id}/images'
+        elif not prefix:
+            prefix = 'property-images'
+        
+        if not file_type:
+            return Response({
+                'success': False,
+                'error': '缺少必需字段: file_type'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not file_size or not isinstance(file_size, int):
+            return Response({
+                'success': False,
+                'error': '缺少必需字段: file_size (必须为整数)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        draft = None
+        if draft_property_id:
+            draft = DraftProperty.objects.filter(id=draft_property_id, user=request.user).first()
+            if draft is None:
+                return Response({
+                    'success': False,
+                    'error': '草稿房源不存在'
+                }, status=status.HTTP_404_NOT_FOUND)
+        
+        upload = r2_upload_service.create_multipart_upload(
+            file_type=file_type,
+            file_size=file_size,
+            prefix=prefix
+        )
+        
+        session = UploadSession.objects.create(
+            user=request.user,
+            draft_property=draft,
+            status='uploading',
+            total_files=1,
+            object_key=upload['object_key'],
+            upload_id=upload['upload_id'],
+            content_type=file_type,
+            file_size=file_size,
+            part_size=upload['part_size'],
+            part_count=upload['part_count'],
+            expires_at=timezone.now() + MULTIPART_SESSION_TTL
+        )
+        
+        parts = r2_upload_service.presign_upload_parts(
+            session.object_key, session.upload_id, range(1, session.part_count + 1)
+        )
+        
+        logger.info(f"Created multipart upload {session.id} for user {request.user.id}, "
+                   f"file_type: {file_type}, size: {file_size}, parts: {session.part_count}")
+        
+        return Response({
+            'success': True,
+            'data': {
+                **_multipart_session_data(session),
+                'parts': parts,
+                'expires_in': r2_upload_service.MULTIPART_URL_EXPIRY
+            }
+        }, status=status.HTTP_201_CREATED)
+        
+    except ValidationError as e:
+        logger.warning(f"Validation error for user {request.user.id}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+        
+    except Exception as e:
+        logger.error(f"Unexpected error creating multipart upload for user {request.user.id}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': '创建分片上传时发生服务器错误'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def multipart_upload_detail(request, session_id):
+    """
+    GET: 查询上传进度，返回已上传和缺失的分片（断线后据此续传）
+    DELETE: 取消上传
+    
+    GET /api/media/multipart/{session_id}/
+    DELETE /api/media/multipart/{session_id}/
+    """
+    try:
+        session = _get_multipart_session(request, session_id)
+        if session is None:
+            return Response({
+                'success': False,
+                'error': '上传会话不存在'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        if request.method == 'DELETE':
+            if session.status == 'uploading':
+                r2_upload_service.abort_multipart_upload(session.object_key, session.upload_id)
+                session.status = 'failed'
+                session.failed_files = 1
+                session.save(update_fields=['status', 'failed_files', 'updated_at'])
+            return Response({
+                'success': True,
+                'message': '分片上传已取消'
+            }, status=status.HTTP_200_OK)
+        
+        data = _multipart_session_data(session)
+        if session.status == 'uploading':
+            parts = r2_upload_service.list_uploaded_parts(session.object_key, session.upload_id)
+            uploaded = {part['part_number'] for part in parts}
+            data['uploaded_parts'] = parts
+            data['missing_parts'] = [n for n in range(1, session.part_count + 1) if n not in uploaded]
+        
+        return Response({
+            'success': True,
+            'data': data
+        }, status=status.HTTP_200_OK)
+        
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_409_CONFLICT)
+        
+    except Exception as e:
+        logger.error(f"Error handling multipart upload {session_id} for user {request.user.id}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': '处理分片上传时发生服务器错误'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def presign_multipart_parts(request, session_id):
+    """
+    重新签发分片上传URL（URL过期或断线续传）
+    
+    POST /api/media/multipart/{session_id}/parts/
+    {
+        "part_numbers": [3, 4]  // 可选，省略时签发所有尚未上传的分片
+    }
+    """
+    try:
+        session = _get_multipart_session(request, session_id)
+        if session is None:
+            return Response({
+                'success': False,
+                'error': '上传会话不存在'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        if session.status != 'uploading' or session.is_expired:
+            return Response({
+                'success': False,
+                'error': '上传会话已结束或已过期'
+            }, status=status.HTTP_409_CONFLICT)
+        
+        part_numbers = request.data.get('part_numbers')
+        if part_numbers is None:
+            uploaded = {
+                part['part_number']
+                for part in r2_upload_service.list_uploaded_parts(session.object_key, session.upload_id)
+            }
+            part_numbers = [n for n in range(1, session.part_count + 1) if n not in uploaded]
+        elif not isinstance(part_numbers, list) or not all(
+            isinstance(n, int) and 1 <= n <= session.part_count for n in part_numbers
+        ):
+            return Response({
+                'success': False,
+                'error': f'part_numbers 必须是 1 到 {session.part_count} 之间的整数列表'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'data': {
+                'parts': r2_upload_service.presign_upload_parts(
+                    session.object_key, session.upload_id, part_numbers
+                ),
+                'expires_in': r2_upload_service.MULTIPART_URL_EXPIRY
+            }
+        }, status=status.HTTP_200_OK)
+        
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_409_CONFLICT)
+        
+    except Exception as e:
+        logger.error(f"Error presigning parts for upload {session_id} for user {request.user.id}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': '签发分片上传URL时发生服务器错误'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@csrf_exempt
+def complete_multipart_upload(request, session_id):
+    """
+    所有分片上传完成后合并为一个对象
+    
+    POST /api/media/multipart/{session_id}/complete/
+    
+    Returns:
+    {
+        "success": true,
+        "data": {
+            "object_key": "...",
+            "file_url": "https://cdn.airnest.me/...",
+            "size": 104857600,
+            "etag": "..."
+        }
+    }
+    """
+    try:
+        session = _get_multipart_session(request, session_id)
+        if session is None:
+            return Response({
+                'success': False,
+                'error': '上传会话不存在'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # 重复提交时直接返回结果
+        if session.status == 'completed':
+            return Response({
+                'success': True,
+                'data': {
+                    'object_key': session.object_key,
+                    'file_url': r2_upload_service.build_file_url(session.object_key),
+                    'size': session.file_size,
+                    'etag': session.etag
+                }
+            }, status=status.HTTP_200_OK)
+        
+        if session.status != 'uploading' or session.is_expired:
+            return Response({
+                'success': False,
+                'error': '上传会话已结束或已过期'
+            }, status=status.HTTP_409_CONFLICT)
+        
+        try:
+            result = r2_upload_service.complete_multipart_upload(
+                session.object_key, session.upload_id, session.part_count,
+                session.part_size, session.file_size
+            )
+        except ValidationError as e:
+            if e.code == 'size_mismatch':
+                # 上传内容与创建会话时声明的大小不符，不能合并，释放已上传的分片
+                r2_upload_service.abort_multipart_upload(session.object_key, session.upload_id)
+                session.status = 'failed'
+                session.save(update_fields=['status', 'updated_at'])
+                logger.warning(f"Aborted multipart upload {session.id} for user {request.user.id}: {e.message}")
+            raise
+        
+        session.status = 'completed'
+        session.uploaded_files = 1
+        session.etag = result['etag']
+        session.save(update_fields=['status', 'uploaded_files', 'etag', 'updated_at'])
+        
+        logger.info(f"Completed multipart upload {session.id} for user {request.user.id}")
+        
+        return Response({
+            'success': True,
+            'data': result
+        }, status=status.HTTP_200_OK)
+        
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_409_CONFLICT)
+        
+    except Exception as e:
+        logger.error(f"Error completing multipart upload {session_id} for user {request.user.id}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': '合并分片时发生服务器错误'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # ================== 草稿房源管理 API ==================
 
 @api_view(['GET', 'POST'])
@@ -732,7 +1109,7 @@ def add_draft_property_images(request):
         ]
     }
     """
-    from .models import DraftProperty, DraftPropertyImage
+    from .models import DraftProperty
     
     try:
         draft_property_id = request.data.get('draft_property_id')
@@ -759,36 +1136,18 @@ def add_draft_property_images(request):
                 'error': '图片列表不能为空'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        created_images = []
+        images = draft.attach_images(images_data)
         
-        for img_data in images_data:
-            required_fields = ['object_key', 'file_url', 'file_size', 'content_type']
-            if not all(field in img_data for field in required_fields):
-                continue
-            
-            # 检查对象键是否已存在
-            if DraftPropertyImage.objects.filter(object_key=img_data['object_key']).exists():
-                continue
-            
-            image = DraftPropertyImage.objects.create(
-                draft_property=draft,
-                object_key=img_data['object_key'],
-                file_url=img_data['file_url'],
-                file_size=img_data['file_size'],
-                content_type=img_data['content_type'],
-                etag=img_data.get('etag', ''),
-                order=img_data.get('order', 0),
-                is_main=img_data.get('is_main', False),
-                alt_text=img_data.get('alt_text', '')
-            )
-            
-            created_images.append({
+        created_images = [
+            {
                 'id': str(image.id),
                 'object_key': image.object_key,
                 'file_url': image.file_url,
                 'order': image.order,
                 'is_main': image.is_main
-            })
+            }
+            for image in images
+        ]
         
         return Response({
             'success': True,
@@ -1,8 +1,9 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from useraccount.authentication import CachedJWTAuthentication
 from .cache_utils import (
     property_list_cache, property_detail_cache, review_cache, 
     user_private_data, static_data_cache, no_cache,
@@ -12,11 +13,20 @@ from .cache_utils import (
 
 from datetime import datetime, timedelta
 import pytz
-from .models import Property, PropertyImage, Reservation, Wishlist, PropertyReview, ReviewTag, ReviewTagAssignment, PropertyReviewSummary, ALLOWED_PROPERTY_TAG_IDS
+from .models import Property, PropertyImage, Reservation, Wishlist, PropertyReview, ReviewTag, ReviewTagAssignment, PropertyReviewSummary, PropertyReviewStats, ALLOWED_PROPERTY_TAG_IDS
 import json
+import uuid
 from .serializers import PropertySerializer, PropertyLandlordSerializer, PropertyImageSerializer, PropertyReviewSerializer, PropertyReviewListSerializer, ReviewTagSerializer, PropertyWithReviewStatsSerializer
 from .forms import PropertyForm
-from django.db import models
+from . import ical, review_insights, review_search, review_stats, review_summaries, review_tags
+from chat import notifications
+from airnest_backend.pagination import InvalidCursor, after_created_desc, created_desc_cursor, parse_page_size
+from django.db import models, transaction
+from django.db.models import Prefetch
+from django.utils.http import http_date
+
+REVIEW_PAGE_SIZE_MAX = 50
+REVIEW_INSIGHTS_MAX_IDS = 50
 
 @api_view(['GET'])
 @authentication_classes([])
@@ -144,7 +154,7 @@ def property_list(request):
     return JsonResponse(serializer.data, safe=False)
 
 @api_view(['GET', 'PATCH'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([])
 def property_detail(request,pk):
     try:
@@ -221,7 +231,7 @@ def property_detail(request,pk):
         return JsonResponse({'error': str(e), 'success': False}, status=400)
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @user_private_data()  # 用户私有数据，禁止缓存
 def my_properties(request):
@@ -230,7 +240,7 @@ def my_properties(request):
     return JsonResponse(serializer.data, safe=False)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def create_property(request):
@@ -266,7 +276,7 @@ def create_property(request):
 
 # 该api用来创建预订，需要传入房源id、入住日期、退房日期、客人数量、时区
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def create_reservation(request, pk):
@@ -381,6 +391,16 @@ def create_reservation(request, pk):
         )
         
         print(f"成功创建预订: ID={reservation.id}, 入住={reservation.check_in}, 退房={reservation.check_out}, 总价={reservation.total_price}")
+
+        # 通知房东和预订人的通知通道
+        notifications.notify_user(
+            property.landlord_id, notifications.RESERVATION_CREATED,
+            notifications.reservation_payload(reservation, 'host'),
+        )
+        notifications.notify_user(
+            request.user.id, notifications.RESERVATION_CREATED,
+            notifications.reservation_payload(reservation, 'guest'),
+        )
         return JsonResponse({'success': True})
     except Property.DoesNotExist:
         return JsonResponse({'error': 'Property not found'}, status=404)
@@ -439,8 +459,28 @@ def get_booked_dates(request, pk):
     except Property.DoesNotExist:
         return JsonResponse({'error': 'Property not found'}, status=404)
 
+@require_GET  # 普通 Django 视图：日历客户端会带 Accept: text/calendar，绕开 DRF 内容协商
+def property_calendar_feed(request, pk):
+    """导出房源预订的 iCalendar 订阅源，供外部日历工具轮询"""
+    try:
+        property = Property.objects.only('id', 'title', 'timezone').get(pk=pk)
+    except Property.DoesNotExist:
+        return JsonResponse({'error': 'Property not found'}, status=404)
+
+    calendar = ical.get_calendar(property)
+
+    if ical.etag_matches(request, calendar['etag']):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(calendar['body'], content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = f'inline; filename="{property.id}.ics"'
+
+    response['ETag'] = calendar['etag']
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
+
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @user_private_data()  # 用户私有数据，禁止缓存
 def get_user_reservations(request):
@@ -479,7 +519,7 @@ def get_user_reservations(request):
         return JsonResponse({'error': str(e)}, status=400)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def toggle_favorite(request, pk):
@@ -497,7 +537,7 @@ def toggle_favorite(request, pk):
         return JsonResponse({'error': 'Property not found'}, status=404)
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @user_private_data()  # 用户私有数据，禁止缓存
 def get_wishlist(request):
@@ -544,7 +584,7 @@ def get_timezone_list(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def update_property_images_order(request, property_id):
@@ -598,7 +638,7 @@ def update_property_images_order(request, property_id):
         return JsonResponse({'error': str(e)}, status=400)
 
 @api_view(['DELETE'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def delete_property_image(request, property_id, image_id):
     """删除房源图片"""
@@ -654,7 +694,7 @@ def delete_property_image(request, property_id, image_id):
 def get_review_tags(request):
     """获取所有可用的评论标签"""
     try:
-        tags = ReviewTag.objects.filter(is_active=True).order_by('category', 'order')
+        tags = review_tags.list_active_tags()
         serializer = ReviewTagSerializer(tags, many=True)
         return JsonResponse(serializer.data, safe=False)
     except Exception as e:
@@ -662,55 +702,92 @@ def get_review_tags(request):
 
 
 @api_view(['GET', 'POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticatedOrReadOnly])  # GET 允许匿名，POST 需要认证
 @csrf_exempt  # 对于 API 请求，禁用 CSRF 检查，使用 JWT 认证
 def property_reviews(request, pk):
-    """获取房源评论列表或创建新评论"""
+    """
+    获取房源评论列表或创建新评论
+
+    GET 支持 ?q= 全文检索（property.review_search，'simple' 配置，不做词干处理；
+    中文没有分词，只能匹配被标点隔开的完整片段）
+    """
     try:
         property_obj = Property.objects.get(pk=pk)
         
         if request.method == 'GET':
-            # 获取评论列表
+            # 获取评论列表：一次查询带出用户，标签统一预取
             reviews = PropertyReview.objects.filter(
                 property_ref=property_obj, 
                 is_hidden=False
-            ).order_by('-created_at')
+            ).select_related('user').prefetch_related(
+                Prefetch('tags', queryset=ReviewTag.objects.only(
+                    'id', 'tag_key', 'name_en', 'name_zh', 'name_fr', 'color', 'category'
+                ))
+            ).defer('search_vector').order_by('-created_at', 'id')
             
-            # 分页处理
-            page = int(request.GET.get('page', 1))
-            page_size = int(request.GET.get('page_size', 10))
-            start = (page - 1) * page_size
-            end = start + page_size
+            page_size = parse_page_size(request.GET.get('page_size'), default=10, maximum=REVIEW_PAGE_SIZE_MAX)
+            cursor = request.GET.get('cursor')
+            q = request.GET.get('q', '').strip()
+            page = None
             
-            reviews_page = reviews[start:end]
-            total_count = reviews.count()
+            if q and cursor:
+                return JsonResponse({'error': 'cursor is not supported with q, use page'}, status=400)
+            
+            # 总数和最后修改时间都来自聚合行，不再 COUNT(*)
+            stats = review_stats.get_stats(property_obj.id)
+            total_count = stats.review_count
+            
+            conditional_response = check_conditional_request(request, stats.updated_at)
+            if conditional_response:
+                conditional_response['Cache-Control'] = 'public, max-age=600'
+                conditional_response['Vary'] = 'Accept-Language'
+                return conditional_response
+            
+            if q:
+                # 全文检索：按相关度排序，只能按页码翻页
+                reviews = review_search.search(reviews, q)
+                total_count = reviews.count()
+            
+            start = 0
+            if cursor:
+                try:
+                    reviews = after_created_desc(reviews, cursor)
+                except InvalidCursor:
+                    return JsonResponse({'error': 'Invalid cursor'}, status=400)
+            else:
+                # 兼容旧的页码分页
+                try:
+                    page = max(1, int(request.GET.get('page', 1)))
+                except ValueError:
+                    page = 1
+                start = (page - 1) * page_size
+            
+            # 多取一条判断是否还有下一页
+            reviews_page = list(reviews[start:start + page_size + 1])
+            has_next = len(reviews_page) > page_size
+            reviews_page = reviews_page[:page_size]
             
             serializer = PropertyReviewListSerializer(reviews_page, many=True)
+            review_data = serializer.data
+            if q:
+                for item, review in zip(review_data, reviews_page):
+                    item['rank'] = review.rank
+                    item['title_snippet'] = review_search.render_snippet(review.title_snippet)
+                    item['content_snippet'] = review_search.render_snippet(review.content_snippet)
             
             response = JsonResponse({
-                'reviews': serializer.data,
+                'reviews': review_data,
                 'total_count': total_count,
                 'page': page,
                 'page_size': page_size,
-                'has_next': end < total_count
+                'has_next': has_next,
+                'next_cursor': created_desc_cursor(reviews_page[-1]) if has_next and not q else None,
             })
             # 评论列表可以短期缓存10分钟，支持多语言
             response['Cache-Control'] = 'public, max-age=600'
             response['Vary'] = 'Accept-Language'
-            
-            # 检查条件请求和添加Last-Modified头 - 基于最新评论的时间
-            latest_review = reviews.first()
-            if latest_review:
-                # 检查条件请求，如果内容未修改则返回304
-                conditional_response = check_conditional_request(request, latest_review.created_at)
-                if conditional_response:
-                    conditional_response['Cache-Control'] = 'public, max-age=600'
-                    conditional_response['Vary'] = 'Accept-Language'
-                    return conditional_response
-                    
-                from django.utils.http import http_date
-                response['Last-Modified'] = http_date(latest_review.created_at.timestamp())
+            response['Last-Modified'] = http_date(stats.updated_at.timestamp())
             
             return response
         
@@ -743,16 +820,16 @@ def property_reviews(request, pk):
             serializer = PropertyReviewSerializer(data=request.data)
             if serializer.is_valid():
                 latest_reservation = completed_reservations.order_by('-check_out').first()
-                review = serializer.save(
-                    property_ref=property_obj,
-                    user=request.user,
-                    reservation=latest_reservation if latest_reservation else None,
-                    is_verified=bool(latest_reservation)
-                )
-                # Mark all AI review summaries for this property as stale
-                PropertyReviewSummary.objects.filter(
-                    property_ref=property_obj
-                ).update(is_stale=True)
+                # 评论写入与聚合增量（signals）在同一事务内，并发的 rebuild 不会重复计入
+                with transaction.atomic():
+                    review = serializer.save(
+                        property_ref=property_obj,
+                        user=request.user,
+                        reservation=latest_reservation if latest_reservation else None,
+                        is_verified=bool(latest_reservation)
+                    )
+                    # Mark all AI review summaries for this property as stale and queue regeneration
+                    review_summaries.mark_stale(property_obj.id)
 
                 response_serializer = PropertyReviewListSerializer(review)
                 return JsonResponse(response_serializer.data, status=201)
@@ -768,39 +845,32 @@ def property_reviews(request, pk):
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([])
-@review_with_last_modified(max_age=600)  # 评论统计数据，10分钟缓存，支持多语言和Last-Modified
 def property_review_stats(request, pk):
-    """获取房源评论统计信息"""
+    """获取房源评论统计信息（读取预聚合的 PropertyReviewStats）"""
     try:
-        property_obj = Property.objects.get(pk=pk)
-        
-        # 获取语言环境
-        locale = 'en'
-        accept_language = request.headers.get('Accept-Language', 'en')
-        if 'zh' in accept_language:
-            locale = 'zh'
-        elif 'fr' in accept_language:
-            locale = 'fr'
-        
-        
-        # 检查是否有计算过的统计信息
         try:
-            average_rating = property_obj.average_rating
-            total_reviews = property_obj.total_reviews
-            positive_review_rate = property_obj.positive_review_rate
-        except Exception as e:
-            average_rating = None
-            total_reviews = 0
-            positive_review_rate = None
-            
-        stats = {
-            'average_rating': average_rating,
-            'total_reviews': total_reviews,
-            'positive_review_rate': positive_review_rate,
-        }
-        
-        return JsonResponse(stats)
-    
+            stats = PropertyReviewStats.objects.get(pk=pk)
+        except PropertyReviewStats.DoesNotExist:
+            if not Property.objects.filter(pk=pk).exists():
+                raise Property.DoesNotExist
+            stats = review_stats.rebuild(pk)
+
+        # 检查条件请求，如果聚合未变化则返回304
+        conditional_response = check_conditional_request(request, stats.updated_at)
+        if conditional_response:
+            conditional_response['Cache-Control'] = 'public, max-age=600'
+            conditional_response['Vary'] = 'Accept-Language'
+            return conditional_response
+
+        response = JsonResponse(
+            review_insights.serialize_stats(stats, review_insights.locale_from_request(request))
+        )
+        # 评论统计数据，10分钟缓存，支持多语言
+        response['Cache-Control'] = 'public, max-age=600'
+        response['Vary'] = 'Accept-Language'
+        response['Last-Modified'] = http_date(stats.updated_at.timestamp())
+        return response
+
     except Property.DoesNotExist:
         return JsonResponse({'error': 'Property not found'}, status=404)
     except Exception as e:
@@ -808,7 +878,7 @@ def property_review_stats(request, pk):
 
 
 @api_view(['PUT', 'DELETE'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def manage_review(request, review_id):
     """更新或删除用户的评论"""
@@ -822,21 +892,14 @@ def manage_review(request, review_id):
             # 更新评论
             serializer = PropertyReviewSerializer(review, data=request.data, partial=True)
             if serializer.is_valid():
-                # 如果更新了标签，需要重新关联
-                if 'tag_keys' in request.data:
-                    # 清除现有标签关联
-                    ReviewTagAssignment.objects.filter(review=review).delete()
+                with transaction.atomic():
+                    # 如果更新了标签，只按差集增删关联
+                    if 'tag_keys' in request.data:
+                        tag_keys = serializer.validated_data.pop('tag_keys', [])
+                        review_tags.update_tags(review, tag_keys)
                     
-                    # 重新关联标签
-                    tag_keys = serializer.validated_data.pop('tag_keys', [])
-                    for tag_key in tag_keys:
-                        try:
-                            tag = ReviewTag.objects.get(tag_key=tag_key, is_active=True)
-                            ReviewTagAssignment.objects.create(review=review, tag=tag)
-                        except ReviewTag.DoesNotExist:
-                            pass
-                
-                serializer.save()
+                    serializer.save()
+                    review_summaries.mark_stale(review.property_ref_id)
                 response_serializer = PropertyReviewListSerializer(review)
                 return JsonResponse(response_serializer.data)
             else:
@@ -844,7 +907,9 @@ def manage_review(request, review_id):
         
         elif request.method == 'DELETE':
             # 删除评论
-            review.delete()
+            with transaction.atomic():
+                review.delete()
+                review_summaries.mark_stale(review.property_ref_id)
             return JsonResponse({'message': '评论已删除'})
     
     except PropertyReview.DoesNotExist:
@@ -861,7 +926,7 @@ def properties_with_reviews(request):
     """获取带评论统计的房源列表（更新版的property_list）"""
     try:
         # 只显示已发布的房源
-        properties = Property.objects.filter(status='published')
+        properties = Property.objects.filter(status='published').select_related('review_stats', 'landlord')
         
         # 应用原有的过滤逻辑
         location = request.GET.get('location', '')
@@ -981,7 +1046,7 @@ def properties_with_reviews(request):
 def property_with_reviews(request, pk):
     """获取单个房源的详细信息，包含评论统计"""
     try:
-        property_obj = Property.objects.get(pk=pk)
+        property_obj = Property.objects.select_related('review_stats', 'landlord').get(pk=pk)
         serializer = PropertyWithReviewStatsSerializer(
             property_obj, 
             context={'request': request}
@@ -994,7 +1059,7 @@ def property_with_reviews(request, pk):
 
 # R2直传相关API - 创建草稿房源
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def create_draft_property(request):
@@ -1055,7 +1120,7 @@ def _clean_property_tags(v):
 
 # R2直传相关API - 发布草稿房源
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def publish_property(request, pk):
@@ -1136,6 +1201,35 @@ def publish_property(request, pk):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([])
+def review_insights_batch(request):
+    """
+    批量获取多个房源的评论统计和 AI 摘要，供列表页卡片使用
+
+    GET ?ids=<uuid>,<uuid>,...&locale=en
+    """
+    raw_ids = [value.strip() for value in request.GET.get('ids', '').split(',') if value.strip()]
+    if not raw_ids:
+        return JsonResponse({'error': 'ids is required'}, status=400)
+    if len(raw_ids) > REVIEW_INSIGHTS_MAX_IDS:
+        return JsonResponse({'error': f'At most {REVIEW_INSIGHTS_MAX_IDS} ids per request'}, status=400)
+
+    try:
+        property_ids = [str(uuid.UUID(value)) for value in raw_ids]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid property id'}, status=400)
+
+    locale = request.GET.get('locale') or review_insights.locale_from_request(request)
+    results = review_insights.get_insights(property_ids, locale)
+
+    response = JsonResponse({'locale': review_insights.normalize_locale(locale), 'results': results})
+    response['Cache-Control'] = 'public, max-age=300'
+    response['Vary'] = 'Accept-Language'
+    return response
+
+
 @api_view(['GET', 'PUT'])
 @authentication_classes([])
 @permission_classes([])
@@ -1151,16 +1245,7 @@ def ai_review_summary(request, pk):
             summary = PropertyReviewSummary.objects.get(
                 property_ref_id=pk, locale=locale
             )
-            return JsonResponse({
-                'highlights': summary.highlights,
-                'concerns': summary.concerns,
-                'best_for': summary.best_for,
-                'summary_text': summary.summary_text,
-                'reviews_count_at_generation': summary.reviews_count_at_generation,
-                'is_stale': summary.is_stale,
-                'generated_at': summary.generated_at.isoformat(),
-                'model_version': summary.model_version,
-            })
+            return JsonResponse(review_insights.serialize_summary(summary))
         except PropertyReviewSummary.DoesNotExist:
             return JsonResponse({'error': 'No summary found'}, status=404)
 
@@ -1180,6 +1265,8 @@ def ai_review_summary(request, pk):
                     'model_version': data.get('model_version', ''),
                 },
             )
+            # BFF 已经生成了新摘要，排队中的任务不再需要
+            review_summaries.cancel(pk, locale)
             return JsonResponse({'status': 'ok', 'id': str(summary.id)})
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
@@ -0,0 +1,254 @@
+"""
+房源 iCalendar 导出
+
+把房源的预订按房源时区生成 VEVENT（DTSTART;TZID=...），整份日历缓存在 Django cache 中。
+日历里附带该时区的 VTIMEZONE 定义（RFC 5545 3.6.5），覆盖所有预订所在的年份。
+每次预订写入都会推进该房源的版本号，并在缓存仍然有效时增量替换/删除
+对应的 VEVENT；轮询方通过强 ETag 拿到 304。
+"""
+
+import hashlib
+import random
+from datetime import datetime
+from functools import lru_cache
+
+import pytz
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Reservation
+
+ICAL_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # 7天，版本号失效后会被重建
+ICAL_PRODID = '-//AirNest//Property Calendar//EN'
+ICAL_UID_DOMAIN = 'airnest.me'
+
+
+def _entry_key(property_id):
+    # v3：事件带 TZID 并附带 VTIMEZONE，旧格式的缓存条目不再使用
+    return f'ical:v3:property:{property_id}'
+
+
+def _version_key(property_id):
+    return f'ical:property:{property_id}:version'
+
+
+def _escape(text):
+    """转义 TEXT 类型的属性值 (RFC 5545 3.3.11)"""
+    return (
+        str(text)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """按 75 个字节折行 (RFC 5545 3.1)"""
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+
+    parts = []
+    limit = 75
+    while raw:
+        cut = min(limit, len(raw))
+        # 不要把多字节字符拆开
+        while cut < len(raw) and (raw[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(raw[:cut].decode('utf-8'))
+        raw = raw[cut:]
+        limit = 74  # 续行以空格开头
+    return '\r\n '.join(parts)
+
+
+def _format_local(dt, tz):
+    return dt.astimezone(tz).strftime('%Y%m%dT%H%M%S')
+
+
+def _format_utc(dt):
+    return dt.astimezone(pytz.UTC).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _format_offset(offset):
+    seconds = int(offset.total_seconds())
+    sign = '+' if seconds >= 0 else '-'
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f'{sign}{hours:02d}{minutes:02d}' + (f'{seconds:02d}' if seconds else '')
+
+
+def _observance(kind, local_start, offset_from, offset_to, name):
+    return [
+        f'BEGIN:{kind}',
+        f'DTSTART:{local_start:%Y%m%dT%H%M%S}',
+        f'TZOFFSETFROM:{_format_offset(offset_from)}',
+        f'TZOFFSETTO:{_format_offset(offset_to)}',
+        f'TZNAME:{name}',
+        f'END:{kind}',
+    ]
+
+
+@lru_cache(maxsize=128)
+def build_vtimezone(timezone_name, first_year, last_year):
+    """
+    生成时区定义，包含 first_year 年初生效的规则以及此后到 last_year 年底的每次切换
+
+    Returns:
+        tuple: VTIMEZONE 的各行
+    """
+    tz = pytz.timezone(timezone_name)
+    lines = ['BEGIN:VTIMEZONE', f'TZID:{timezone_name}']
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        # 固定偏移的时区（UTC、Etc/GMT+8 等）
+        probe = datetime(first_year, 1, 1)
+        offset = tz.utcoffset(probe)
+        lines += _observance('STANDARD', datetime(1970, 1, 1), offset, offset, tz.tzname(probe))
+    else:
+        # pytz 的切换表：UTC 切换时刻与 (偏移, 夏令时偏移, 缩写)
+        infos = tz._transition_info
+        start, end = datetime(first_year, 1, 1), datetime(last_year + 1, 1, 1)
+        in_effect = max((i for i, at in enumerate(transitions) if at < start), default=0)
+        for i in [in_effect] + [i for i, at in enumerate(transitions) if start <= at < end]:
+            offset, dst, name = infos[i]
+            if i == 0:
+                lines += _observance('STANDARD', datetime(1970, 1, 1), offset, offset, name)
+                continue
+            offset_from = infos[i - 1][0]
+            # DTSTART 是切换前的当地时间
+            lines += _observance(
+                'DAYLIGHT' if dst else 'STANDARD', transitions[i] + offset_from, offset_from, offset, name
+            )
+    lines.append('END:VTIMEZONE')
+    return tuple(lines)
+
+
+def build_event(reservation, timezone_name):
+    """
+    生成单个预订的 VEVENT
+
+    Returns:
+        tuple: (排序键, VEVENT 文本)
+    """
+    tz = pytz.timezone(timezone_name)
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{reservation.id}@{ICAL_UID_DOMAIN}',
+        f'DTSTAMP:{_format_utc(reservation.created_at)}',
+        f'DTSTART;TZID={timezone_name}:{_format_local(reservation.check_in, tz)}',
+        f'DTEND;TZID={timezone_name}:{_format_local(reservation.check_out, tz)}',
+        'SUMMARY:Reserved',
+        'TRANSP:OPAQUE',
+        'END:VEVENT',
+    ]
+    return reservation.check_in.isoformat(), '\r\n'.join(_fold(line) for line in lines)
+
+
+def _render(entry):
+    """根据缓存条目中的事件片段拼出完整日历，并计算强 ETag"""
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{ICAL_PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(entry["title"])}',
+        f'X-WR-TIMEZONE:{entry["timezone"]}',
+    ]
+    # 排序键是入住时间的 ISO 字符串，前四位即年份；前后各多留一年，跨年的预订也能落在定义范围内
+    years = [int(sort_key[:4]) for sort_key, _ in entry['events'].values()] or [timezone.now().year]
+    header += build_vtimezone(entry['timezone'], min(years) - 1, max(years) + 1)
+    events = [text for _, text in sorted(entry['events'].values())]
+    body = '\r\n'.join([_fold(line) for line in header] + events + ['END:VCALENDAR']) + '\r\n'
+
+    entry['body'] = body
+    entry['etag'] = '"%s"' % hashlib.sha256(body.encode('utf-8')).hexdigest()[:40]
+    return entry
+
+
+def _current_version(property_id):
+    version = cache.get(_version_key(property_id))
+    if version is None:
+        # 随机起点，避免版本键被淘汰后与旧条目的版本号撞上
+        cache.add(_version_key(property_id), random.getrandbits(62), None)
+        version = cache.get(_version_key(property_id))
+    return version
+
+
+def get_calendar(property_obj):
+    """
+    获取房源日历，缓存有效时不访问数据库
+
+    Returns:
+        dict: 包含 body 和 etag 的缓存条目
+    """
+    cached = cache.get_many([_entry_key(property_obj.id), _version_key(property_obj.id)])
+    entry = cached.get(_entry_key(property_obj.id))
+    version = cached.get(_version_key(property_obj.id))
+
+    if (
+        entry is not None
+        and version is not None
+        and entry['version'] == version
+        and entry['timezone'] == property_obj.timezone
+        and entry['title'] == property_obj.title
+    ):
+        return entry
+
+    # 先取版本号再查库：查询期间如有新预订写入，版本号会前进，本次结果下次即被视为过期
+    version = _current_version(property_obj.id)
+    reservations = Reservation.objects.filter(property=property_obj).only(
+        'id', 'check_in', 'check_out', 'created_at'
+    )
+    entry = {
+        'version': version,
+        'timezone': property_obj.timezone,
+        'title': property_obj.title,
+        'events': {
+            str(reservation.id): build_event(reservation, property_obj.timezone)
+            for reservation in reservations
+        },
+    }
+    _render(entry)
+    cache.set(_entry_key(property_obj.id), entry, ICAL_CACHE_TIMEOUT)
+    return entry
+
+
+def apply_reservation_change(reservation, deleted=False):
+    """
+    预订写入后推进版本号；若缓存的日历正好是上一版本，则只增量更新这一条事件，
+    否则保持过期，等下一次请求时重建
+    """
+    property_id = reservation.property_id
+    _current_version(property_id)
+    try:
+        new_version = cache.incr(_version_key(property_id))
+    except ValueError:
+        return
+
+    entry = cache.get(_entry_key(property_id))
+    if entry is None or entry['version'] != new_version - 1:
+        return
+
+    if deleted:
+        entry['events'].pop(str(reservation.id), None)
+    else:
+        entry['events'][str(reservation.id)] = build_event(reservation, entry['timezone'])
+
+    entry['version'] = new_version
+    _render(entry)
+    cache.set(_entry_key(property_id), entry, ICAL_CACHE_TIMEOUT)
+
+
+def etag_matches(request, etag):
+    """检查 If-None-Match 是否命中当前 ETag"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    # If-None-Match 使用弱比较
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
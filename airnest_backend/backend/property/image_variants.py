@@ -0,0 +1,146 @@
+"""
+房源图片响应式尺寸的后台生成
+
+PropertyImage 创建时 variants_status 为 pending，由 process_image_variants 命令领取：
+- 下载原图、上传变体是 I/O，放在线程池里
+- 解码和 WebP 编码是 CPU 密集的 PIL 操作（storage_utils.render_variants），放在进程池里，不受 GIL 限制
+变体按 storage_utils.get_optimized_image_sizes 的 thumbnail / medium / large / xlarge 生成，
+与原图放在同一目录（<原图键去掉扩展名><后缀>.webp），结果记录在 PropertyImage.variants。
+按内容去重的图片（同一 content_hash）已有变体时直接复用，不再下载和编码。
+"""
+
+import logging
+import os
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from media_upload.services import r2_upload_service
+
+from .models import PropertyImage
+from .storage_utils import render_variants
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+# 领取后超过该时间仍未完成，视为 worker 已退出，允许重新领取
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# 变体键包含原图的唯一键，内容不会变化
+VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def variant_key(object_key, suffix, ext='webp'):
+    base, _ = os.path.splitext(object_key)
+    return f'{base}{suffix}.{ext}'
+
+
+def claim_images(limit):
+    """领取待处理的图片；SKIP LOCKED 让多个 worker 可以同时运行"""
+    now = timezone.now()
+    with transaction.atomic():
+        images = list(
+            PropertyImage.objects.select_for_update(skip_locked=True).filter(
+                Q(variants_status=PropertyImage.VARIANTS_PENDING)
+                | Q(variants_status=PropertyImage.VARIANTS_PROCESSING, updated_at__lt=now - CLAIM_TIMEOUT)
+            ).exclude(object_key='').order_by('updated_at').only('id', 'object_key', 'content_hash')[:limit]
+        )
+        PropertyImage.objects.filter(pk__in=[image.pk for image in images]).update(
+            variants_status=PropertyImage.VARIANTS_PROCESSING,
+            variants_attempts=F('variants_attempts') + 1,
+            updated_at=now,
+        )
+    return images
+
+
+def _download(object_key):
+    response = r2_upload_service.s3_client.get_object(Bucket=r2_upload_service.bucket_name, Key=object_key)
+    return response['Body'].read()
+
+
+def _upload(key, content):
+    r2_upload_service.s3_client.put_object(
+        Bucket=r2_upload_service.bucket_name,
+        Key=key,
+        Body=content,
+        ContentType='image/webp',
+        CacheControl=VARIANT_CACHE_CONTROL,
+    )
+
+
+def process_image(image, cpu_pool):
+    """
+    在 I/O 线程中执行单张图片：下载 → 进程池渲染 → 上传 → 记录
+
+    Returns:
+        str: 'ready' / 'reused' / 'failed' / 'retry'
+    """
+    try:
+        if image.content_hash:
+            # 同一内容的变体键相同，其他图片已生成过就直接复用
+            existing = PropertyImage.objects.filter(
+                content_hash=image.content_hash, variants_status=PropertyImage.VARIANTS_READY
+            ).exclude(pk=image.pk).values_list('variants', flat=True).first()
+            if existing:
+                PropertyImage.objects.filter(pk=image.pk).update(
+                    variants=existing, variants_status=PropertyImage.VARIANTS_READY, updated_at=timezone.now()
+                )
+                return 'reused'
+
+        data = _download(image.object_key)
+        (width, height), rendered = cpu_pool.submit(render_variants, data).result()
+
+        variants = {'original': {'width': width, 'height': height}}
+        for name, suffix, variant_width, variant_height, content in rendered:
+            key = variant_key(image.object_key, suffix)
+            _upload(key, content)
+            variants[name] = {
+                'key': key,
+                'url': r2_upload_service.build_file_url(key),
+                'width': variant_width,
+                'height': variant_height,
+            }
+
+        PropertyImage.objects.filter(pk=image.pk).update(
+            variants=variants, variants_status=PropertyImage.VARIANTS_READY, updated_at=timezone.now()
+        )
+        return 'ready'
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        # 无法解码的图片（如未安装 HEIC 解码器）重试也没有意义
+        logger.warning('Cannot render variants for image %s: %s', image.pk, e)
+        _fail(image, permanent=True)
+        return 'failed'
+    except Exception as e:
+        logger.warning('Variant generation failed for image %s: %s', image.pk, e, exc_info=True)
+        return 'failed' if _fail(image) else 'retry'
+    finally:
+        # 线程各自持有数据库连接，用完关闭
+        connections.close_all()
+
+
+def _fail(image, permanent=False):
+    """Returns: 是否已放弃"""
+    image.refresh_from_db(fields=['variants_attempts'])
+    give_up = permanent or image.variants_attempts >= MAX_ATTEMPTS
+    PropertyImage.objects.filter(pk=image.pk).update(
+        variants_status=PropertyImage.VARIANTS_FAILED if give_up else PropertyImage.VARIANTS_PENDING,
+        updated_at=timezone.now(),
+    )
+    return give_up
+
+
+def process_pending(cpu_pool, io_pool, limit=20):
+    """
+    领取并处理一批图片；进程池和线程池由调用方创建并复用
+
+    Returns:
+        dict: {结果: 数量}
+    """
+    r2_upload_service._check_configuration()
+    images = claim_images(limit)
+    results = {}
+    for outcome in io_pool.map(lambda image: process_image(image, cpu_pool), images):
+        results[outcome] = results.get(outcome, 0) + 1
+    return results
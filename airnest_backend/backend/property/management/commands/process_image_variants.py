@@ -0,0 +1,38 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from property import image_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive WebP variants for uploaded property images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process pending images once and exit')
+        parser.add_argument('--batch-size', type=int, default=20, help='Images claimed per round')
+        parser.add_argument('--processes', type=int, default=None, help='Processes encoding images')
+        parser.add_argument('--io-workers', type=int, default=None, help='Threads downloading and uploading')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds to sleep when the queue is idle')
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or settings.IMAGE_VARIANT_PROCESSES
+        io_workers = options['io_workers'] or settings.IMAGE_VARIANT_IO_WORKERS
+        # spawn 启动的子进程只做图片编码，不会继承主进程的数据库连接
+        cpu_pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+        with cpu_pool, ThreadPoolExecutor(max_workers=io_workers) as io_pool:
+            while True:
+                results = image_variants.process_pending(cpu_pool, io_pool, limit=options['batch_size'])
+                if results:
+                    summary = ', '.join(f'{outcome}: {count}' for outcome, count in sorted(results.items()))
+                    self.stdout.write(self.style.SUCCESS(f'Processed image variants ({summary})'))
+
+                if options['once']:
+                    break
+                # 一批跑满时立即继续，否则等待下一轮
+                if sum(results.values()) < options['batch_size']:
+                    time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from property import review_summaries
+
+
+class Command(BaseCommand):
+    help = 'Regenerate stale AI review summaries from the debounced job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process due jobs once and exit')
+        parser.add_argument('--batch-size', type=int, default=20, help='Jobs claimed per round')
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent generator calls')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds to sleep when the queue is idle')
+
+    def handle(self, *args, **options):
+        try:
+            generator = review_summaries.get_generator()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'Using {generator.__class__.__name__}')
+
+        while True:
+            results = review_summaries.process_due(
+                limit=options['batch_size'], workers=options['workers'], generator=generator
+            )
+            if results:
+                summary = ', '.join(f'{outcome}: {count}' for outcome, count in sorted(results.items()))
+                self.stdout.write(self.style.SUCCESS(f'Processed review summary jobs ({summary})'))
+
+            if options['once']:
+                break
+            # 一批跑满时立即继续，否则等待下一轮
+            if sum(results.values()) < options['batch_size']:
+                time.sleep(options['interval'])
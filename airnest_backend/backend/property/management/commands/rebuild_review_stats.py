@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from property import review_stats
+from property.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-property review aggregates (PropertyReviewStats) from reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('property_ids', nargs='*', help='Only rebuild these properties')
+
+    def handle(self, *args, **options):
+        properties = Property.objects.all()
+        if options['property_ids']:
+            properties = properties.filter(pk__in=options['property_ids'])
+
+        count = 0
+        for property_id in properties.values_list('id', flat=True).iterator():
+            review_stats.rebuild(property_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt review stats for {count} properties'))
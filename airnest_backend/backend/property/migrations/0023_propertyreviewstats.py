@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0022_add_property_review_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyReviewStats',
+            fields=[
+                ('property_ref', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='review_stats',
+                    serialize=False,
+                    to='property.property',
+                )),
+                ('review_count', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_1_count', models.IntegerField(default=0)),
+                ('rating_2_count', models.IntegerField(default=0)),
+                ('rating_3_count', models.IntegerField(default=0)),
+                ('rating_4_count', models.IntegerField(default=0)),
+                ('rating_5_count', models.IntegerField(default=0)),
+                ('tag_counts', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0023_propertyreviewstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='propertyreview',
+            index=models.Index(fields=['property_ref', '-created_at', 'id'], name='review_property_created_idx'),
+        ),
+    ]
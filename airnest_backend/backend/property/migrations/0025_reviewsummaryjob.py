@@ -0,0 +1,43 @@
+import uuid
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0024_propertyreview_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummaryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('locale', models.CharField(default='en', max_length=10)),
+                ('status', models.CharField(
+                    choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')],
+                    default='pending',
+                    max_length=10,
+                )),
+                ('due_at', models.DateTimeField()),
+                ('requested_version', models.IntegerField(default=1)),
+                ('claimed_version', models.IntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('property_ref', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='review_summary_jobs',
+                    to='property.property',
+                )),
+            ],
+            options={
+                'unique_together': {('property_ref', 'locale')},
+                'indexes': [models.Index(fields=['status', 'due_at'], name='review_summary_job_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def backfill_search_vector(apps, schema_editor):
+    PropertyReview = apps.get_model('property', 'PropertyReview')
+    PropertyReview.objects.update(
+        search_vector=(
+            SearchVector('title', weight='A', config='english')
+            + SearchVector('content', weight='B', config='english')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0025_reviewsummaryjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertyreview',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='propertyreview',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='review_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0026_propertyreview_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertyimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        # 已有图片默认进入待处理，由 process_image_variants 补生成
+        migrations.AddField(
+            model_name='propertyimage',
+            name='variants_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='propertyimage',
+            name='variants_attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='propertyimage',
+            index=models.Index(fields=['variants_status', 'updated_at'], name='property_image_variants_idx'),
+        ),
+    ]
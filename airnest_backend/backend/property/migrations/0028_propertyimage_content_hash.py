@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0027_propertyimage_variants'),
+    ]
+
+    operations = [
+        # 同一对象可被多个房源引用，唯一约束改为普通索引
+        migrations.AlterField(
+            model_name='propertyimage',
+            name='object_key',
+            field=models.CharField(db_index=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='propertyimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
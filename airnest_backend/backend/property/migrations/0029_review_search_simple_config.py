@@ -0,0 +1,23 @@
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def rebuild_search_vector(apps, schema_editor):
+    PropertyReview = apps.get_model('property', 'PropertyReview')
+    PropertyReview.objects.update(
+        search_vector=(
+            SearchVector('title', weight='A', config='simple')
+            + SearchVector('content', weight='B', config='simple')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0028_propertyimage_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_vector, migrations.RunPython.noop),
+    ]
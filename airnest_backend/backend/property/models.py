@@ -4,6 +4,8 @@ from datetime import datetime
 from django.conf import settings
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from useraccount.models import User
 
 # 预定义的房源标签ID列表
@@ -93,11 +95,24 @@ class Property(models.Model):
     def __str__(self):
         return self.title
     
+    def _review_stats(self):
+        """预聚合的评论统计，尚未生成时返回 None"""
+        from django.core.exceptions import ObjectDoesNotExist
+
+        try:
+            return self.review_stats
+        except ObjectDoesNotExist:
+            return None
+
     @property
     def average_rating(self):
         """计算平均评分"""
         from django.db.models import Avg
         
+        stats = self._review_stats()
+        if stats is not None:
+            return stats.average_rating
+
         reviews = self.reviews.filter(is_hidden=False)
         if not reviews.exists():
             return None
@@ -108,11 +123,18 @@ class Property(models.Model):
     @property
     def total_reviews(self):
         """获取评论总数"""
+        stats = self._review_stats()
+        if stats is not None:
+            return stats.review_count
         return self.reviews.filter(is_hidden=False).count()
     
     @property
     def positive_review_rate(self):
         """计算好评率（4星及以上）"""
+        stats = self._review_stats()
+        if stats is not None:
+            return stats.positive_review_rate
+
         total = self.total_reviews
         if total == 0:
             return None
@@ -122,12 +144,24 @@ class Property(models.Model):
 
 
 class PropertyImage(models.Model):
+    VARIANTS_PENDING = 'pending'
+    VARIANTS_PROCESSING = 'processing'
+    VARIANTS_READY = 'ready'
+    VARIANTS_FAILED = 'failed'
+    VARIANTS_STATUS_CHOICES = [
+        (VARIANTS_PENDING, 'Pending'),
+        (VARIANTS_PROCESSING, 'Processing'),
+        (VARIANTS_READY, 'Ready'),
+        (VARIANTS_FAILED, 'Failed'),
+    ]
+
     # 基本关联
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     property_ref = models.ForeignKey(Property, related_name='images', on_delete=models.CASCADE, null=True, blank=True)
     
     # R2存储核心信息
-    object_key = models.CharField(max_length=500, unique=True, default='')
+    object_key = models.CharField(max_length=500, default='', db_index=True)  # 按内容去重后可被多张图片共用
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # 内容 SHA-256，按内容寻址时有值
     file_url = models.URLField(max_length=500, default='')
     file_size = models.BigIntegerField(default=0)
     content_type = models.CharField(max_length=100, default='image/jpeg')
@@ -138,6 +172,12 @@ class PropertyImage(models.Model):
     is_main = models.BooleanField(default=False)
     alt_text = models.CharField(max_length=255, blank=True)
     
+    # 响应式尺寸（property.image_variants 后台生成，与原图存放在同一目录）
+    # {'thumbnail': {'key', 'url', 'width', 'height'}, ..., 'original': {'width', 'height'}}
+    variants = models.JSONField(default=dict, blank=True)
+    variants_status = models.CharField(max_length=10, choices=VARIANTS_STATUS_CHOICES, default=VARIANTS_PENDING)
+    variants_attempts = models.IntegerField(default=0)
+    
     # 元数据
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_images', null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
@@ -145,6 +185,9 @@ class PropertyImage(models.Model):
     
     class Meta:
         ordering = ['order', 'uploaded_at']
+        indexes = [
+            models.Index(fields=['variants_status', 'updated_at'], name='property_image_variants_idx'),
+        ]
     
     def __str__(self):
         main_indicator = " (主图)" if self.is_main else ""
@@ -156,6 +199,19 @@ class PropertyImage(models.Model):
     def imageURL(self):
         return self.get_url()
     
+    def get_srcset(self):
+        """按宽度排列的 srcset，尚未生成变体时为空字符串"""
+        if not self.variants:
+            return ''
+        candidates = [
+            (variant['width'], variant['url'])
+            for name, variant in self.variants.items() if name != 'original'
+        ]
+        original = self.variants.get('original')
+        if original and self.file_url and original['width'] not in {width for width, _ in candidates}:
+            candidates.append((original['width'], self.file_url))
+        return ', '.join(f'{url} {width}w' for width, url in sorted(candidates))
+    
     @property
     def file_size_mb(self):
         """文件大小(MB)"""
@@ -239,10 +295,17 @@ class PropertyReview(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_verified = models.BooleanField(default=False)
     is_hidden = models.BooleanField(default=False)
+    # title + content 的全文检索向量，由 property.review_search 维护
+    search_vector = SearchVectorField(null=True, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         unique_together = ['property_ref', 'user']
+        indexes = [
+            # 评论列表按 (-created_at, id) 游标翻页
+            models.Index(fields=['property_ref', '-created_at', 'id'], name='review_property_created_idx'),
+            GinIndex(fields=['search_vector'], name='review_search_vector_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.name} - {self.property_ref.title} ({self.rating}星)"
@@ -282,4 +345,91 @@ class PropertyReviewSummary(models.Model):
         unique_together = ['property_ref', 'locale']
 
     def __str__(self):
-        return f"AI Summary for {self.property_ref.title} ({self.locale})"
\ No newline at end of file
+        return f"AI Summary for {self.property_ref.title} ({self.locale})"
+
+class ReviewSummaryJob(models.Model):
+    """Pending regeneration of an AI review summary, one row per property+locale."""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    property_ref = models.ForeignKey(
+        Property, related_name='review_summary_jobs', on_delete=models.CASCADE
+    )
+    locale = models.CharField(max_length=10, default='en')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    # 最早可以执行的时间，窗口内的多次入队合并成一次
+    due_at = models.DateTimeField()
+    # 每次入队递增；完成时若与领取时不同，说明执行期间又有新评论
+    requested_version = models.IntegerField(default=1)
+    claimed_version = models.IntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['property_ref', 'locale']
+        indexes = [
+            models.Index(fields=['status', 'due_at'], name='review_summary_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Summary job {self.property_ref_id} ({self.locale}, {self.status})"
+
+
+class PropertyReviewStats(models.Model):
+    """Per-property review aggregates, maintained incrementally by property.review_stats."""
+    property_ref = models.OneToOneField(
+        Property, primary_key=True, related_name='review_stats', on_delete=models.CASCADE
+    )
+
+    review_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+
+    # 1-5 星分布
+    rating_1_count = models.IntegerField(default=0)
+    rating_2_count = models.IntegerField(default=0)
+    rating_3_count = models.IntegerField(default=0)
+    rating_4_count = models.IntegerField(default=0)
+    rating_5_count = models.IntegerField(default=0)
+
+    # {tag_key: 使用次数}，只统计未隐藏的评论
+    tag_counts = models.JSONField(default=dict)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Review stats for {self.property_ref_id} ({self.review_count})"
+
+    @property
+    def rating_distribution(self):
+        return {str(star): getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 1)
+
+    @property
+    def positive_review_rate(self):
+        """好评率（4星及以上）"""
+        if not self.review_count:
+            return None
+        positive = self.rating_4_count + self.rating_5_count
+        return round((positive / self.review_count) * 100, 1)
+
+    def top_tags(self, limit=5):
+        """按使用次数排序的标签 [(tag_key, count), ...]"""
+        ranked = sorted(self.tag_counts.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
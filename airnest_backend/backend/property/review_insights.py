@@ -0,0 +1,127 @@
+"""
+房源评论洞察（评论统计 + AI 摘要）的批量读取
+
+列表页一次请求多个房源：先按 (房源, 语言) 从共享缓存 get_many，
+未命中的房源用两条集合查询补齐（PropertyReviewStats、PropertyReviewSummary），
+再 set_many 写回。统计或摘要变化时删除该房源所有语言的缓存。
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import review_stats, review_tags
+from .models import Property, PropertyReviewStats, PropertyReviewSummary
+
+SUPPORTED_LOCALES = ('en', 'zh', 'fr')
+INSIGHTS_CACHE_TIMEOUT = 60 * 10
+
+
+def _cache_key(property_id, locale):
+    return f'review_insights:{property_id}:{locale}'
+
+
+def normalize_locale(locale):
+    return locale if locale in SUPPORTED_LOCALES else 'en'
+
+
+def locale_from_request(request):
+    """根据 Accept-Language 判断语言"""
+    accept_language = request.headers.get('Accept-Language', 'en')
+    if 'zh' in accept_language:
+        return 'zh'
+    if 'fr' in accept_language:
+        return 'fr'
+    return 'en'
+
+
+def serialize_stats(stats, locale):
+    top_tags = []
+    for tag_key, count in stats.top_tags():
+        tag = review_tags.get_tag(tag_key)
+        top_tags.append({
+            'tag_key': tag_key,
+            'name': tag.get_localized_name(locale) if tag else tag_key,
+            'color': tag.color if tag else None,
+            'count': count,
+        })
+
+    return {
+        'average_rating': stats.average_rating,
+        'total_reviews': stats.review_count,
+        'positive_review_rate': stats.positive_review_rate,
+        'rating_distribution': stats.rating_distribution,
+        'top_tags': top_tags,
+    }
+
+
+def serialize_summary(summary):
+    return {
+        'highlights': summary.highlights,
+        'concerns': summary.concerns,
+        'best_for': summary.best_for,
+        'summary_text': summary.summary_text,
+        'reviews_count_at_generation': summary.reviews_count_at_generation,
+        'is_stale': summary.is_stale,
+        'generated_at': summary.generated_at.isoformat(),
+        'model_version': summary.model_version,
+    }
+
+
+def get_insights(property_ids, locale):
+    """
+    批量获取评论洞察
+
+    Returns:
+        dict: {房源ID字符串: {'stats': {...}, 'summary': {...} 或 None}}，不存在的房源不返回
+    """
+    locale = normalize_locale(locale)
+    property_ids = [str(property_id) for property_id in dict.fromkeys(property_ids)]
+    keys = {property_id: _cache_key(property_id, locale) for property_id in property_ids}
+
+    cached = cache.get_many(list(keys.values()))
+    results = {
+        property_id: cached[key] for property_id, key in keys.items() if key in cached
+    }
+    missing = [property_id for property_id in property_ids if property_id not in results]
+    if not missing:
+        return results
+
+    stats_by_id = {
+        str(stats.pk): stats for stats in PropertyReviewStats.objects.filter(pk__in=missing)
+    }
+    summaries = {
+        str(summary.property_ref_id): summary
+        for summary in PropertyReviewSummary.objects.filter(property_ref_id__in=missing, locale=locale)
+    }
+
+    # 还没有聚合行的房源（首次访问）补算一次，之后都走集合查询
+    no_stats = [property_id for property_id in missing if property_id not in stats_by_id]
+    if no_stats:
+        for property_id in Property.objects.filter(pk__in=no_stats).values_list('id', flat=True):
+            stats_by_id[str(property_id)] = review_stats.rebuild(property_id)
+
+    fresh = {}
+    for property_id in missing:
+        stats = stats_by_id.get(property_id)
+        if stats is None:
+            continue
+        summary = summaries.get(property_id)
+        fresh[property_id] = {
+            'stats': serialize_stats(stats, locale),
+            'summary': serialize_summary(summary) if summary else None,
+        }
+
+    cache.set_many(
+        {keys[property_id]: value for property_id, value in fresh.items()},
+        INSIGHTS_CACHE_TIMEOUT,
+    )
+    results.update(fresh)
+    return results
+
+
+def invalidate(property_id):
+    cache.delete_many([_cache_key(property_id, locale) for locale in SUPPORTED_LOCALES])
+
+
+def invalidate_on_commit(property_id):
+    transaction.on_commit(lambda: invalidate(property_id))
@@ -0,0 +1,64 @@
+"""
+房源评论全文检索
+
+PropertyReview.search_vector 保存 title(权重A) + content(权重B) 的 tsvector，
+评论写入后由 signals 更新，查询走 GIN 索引，按 ts_rank 排序并用 ts_headline 生成摘要片段。
+
+评论有英文、中文、法文，统一用 'simple' 配置：只做小写化，不做词干和停用词处理，
+避免按英文规则处理法文。中文没有空格分词，PostgreSQL 自带的解析器会把整句当成一个词，
+中文评论只能匹配到被标点隔开的完整片段；要真正支持中文检索需要 zhparser 之类的分词扩展。
+"""
+
+import html
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db.models import F
+
+from .models import PropertyReview
+
+SEARCH_CONFIG = 'simple'
+MAX_QUERY_LENGTH = 200
+
+# ts_headline 用控制字符做高亮标记，先整体转义再换成 <mark>，避免评论内容里的 HTML 被原样输出
+_START_SEL = '\x02'
+_STOP_SEL = '\x03'
+
+
+def search_vector_expression():
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(review_id):
+    PropertyReview.objects.filter(pk=review_id).update(search_vector=search_vector_expression())
+
+
+def search(queryset, q):
+    """
+    在评论查询集上做全文检索
+
+    Returns:
+        QuerySet: 带 rank、title_snippet、content_snippet 注解，按相关度排序
+    """
+    query = SearchQuery(q[:MAX_QUERY_LENGTH], search_type='websearch', config=SEARCH_CONFIG)
+    headline_options = {
+        'config': SEARCH_CONFIG,
+        'start_sel': _START_SEL,
+        'stop_sel': _STOP_SEL,
+    }
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query),
+        title_snippet=SearchHeadline('title', query, highlight_all=True, **headline_options),
+        content_snippet=SearchHeadline(
+            'content', query, max_words=35, min_words=15, max_fragments=2, **headline_options
+        ),
+    ).order_by('-rank', '-created_at', 'id')
+
+
+def render_snippet(snippet):
+    """转义片段，并把高亮标记换成 <mark>"""
+    if not snippet:
+        return snippet
+    return html.escape(snippet).replace(_START_SEL, '<mark>').replace(_STOP_SEL, '</mark>')
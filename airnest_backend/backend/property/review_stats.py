@@ -0,0 +1,183 @@
+"""
+房源评论聚合维护
+
+PropertyReviewStats 按增量方式更新：评论新增/修改/删除、标签关联变化时
+由 signals 调用 apply_delta。聚合行不存在时不在写路径上创建，
+由读取方调用 rebuild 做一次全量计算。
+
+并发：rebuild 先锁房源行（FOR NO KEY UPDATE，不与评论外键的 KEY SHARE 冲突）和聚合行，
+再做聚合，因此不会覆盖并发提交的增量；apply_delta 找不到聚合行时同样先锁房源行再确认一次，
+避免聚合与增量交错时漏掉正在提交的评论。
+评论的写入必须与 signals 触发的 apply_delta 处于同一事务（视图里用 transaction.atomic 包住），
+否则评论先提交、增量后加锁，中间执行的 rebuild 会把这条评论算两次。
+
+评分增量同时叠加到房东的评价聚合（useraccount.reputation）。
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from useraccount import reputation
+
+from .models import Property, PropertyReview, PropertyReviewStats, ReviewTagAssignment
+
+RATING_CHOICES = range(1, 6)
+
+
+def apply_delta(property_id, ratings=None, tags=None):
+    """
+    在聚合行上叠加增量
+
+    Args:
+        property_id: 房源ID
+        ratings: {星级: 变化量}
+        tags: {tag_key: 变化量}
+    """
+    ratings = {rating: n for rating, n in (ratings or {}).items() if n}
+    tags = {tag_key: n for tag_key, n in (tags or {}).items() if n}
+    if not ratings and not tags:
+        return None
+
+    with transaction.atomic():
+        if ratings:
+            landlord_id = Property.objects.filter(pk=property_id).values_list('landlord_id', flat=True).first()
+            reputation.apply_host_delta(
+                landlord_id,
+                review_delta=sum(ratings.values()),
+                rating_delta=sum(rating * n for rating, n in ratings.items()),
+            )
+
+        stats = PropertyReviewStats.objects.select_for_update().filter(pk=property_id).first()
+        if stats is None:
+            # 等进行中的 rebuild 提交后再确认；仍不存在时由之后的 rebuild 计入本次变化
+            _lock_property(property_id)
+            stats = PropertyReviewStats.objects.select_for_update().filter(pk=property_id).first()
+            if stats is None:
+                return None
+
+        for rating, n in ratings.items():
+            field = f'rating_{rating}_count'
+            setattr(stats, field, max(0, getattr(stats, field) + n))
+        histogram = {rating: getattr(stats, f'rating_{rating}_count') for rating in RATING_CHOICES}
+        stats.review_count = sum(histogram.values())
+        stats.rating_sum = sum(rating * n for rating, n in histogram.items())
+
+        tag_counts = dict(stats.tag_counts)
+        for tag_key, n in tags.items():
+            count = tag_counts.get(tag_key, 0) + n
+            if count > 0:
+                tag_counts[tag_key] = count
+            else:
+                tag_counts.pop(tag_key, None)
+        stats.tag_counts = tag_counts
+
+        stats.save()
+        return stats
+
+
+def _lock_property(property_id):
+    Property.objects.select_for_update(no_key=True).filter(pk=property_id).values_list('pk', flat=True).first()
+
+
+def rebuild(property_id):
+    """全量重新计算单个房源的评论聚合"""
+    with transaction.atomic():
+        # 先拿锁再聚合：之前的增量都已提交可见，之后的增量等本事务提交后在新值上叠加
+        _lock_property(property_id)
+        PropertyReviewStats.objects.select_for_update().filter(pk=property_id).first()
+
+        visible = PropertyReview.objects.filter(property_ref_id=property_id, is_hidden=False)
+        histogram = dict(
+            visible.values_list('rating').annotate(n=Count('id')).order_by()
+        )
+        tag_counts = dict(
+            ReviewTagAssignment.objects.filter(
+                review__property_ref_id=property_id, review__is_hidden=False
+            ).values_list('tag__tag_key').annotate(n=Count('id')).order_by()
+        )
+
+        defaults = {f'rating_{rating}_count': histogram.get(rating, 0) for rating in RATING_CHOICES}
+        defaults['review_count'] = sum(histogram.values())
+        defaults['rating_sum'] = sum(rating * n for rating, n in histogram.items())
+        defaults['tag_counts'] = tag_counts
+
+        stats, _ = PropertyReviewStats.objects.update_or_create(
+            property_ref_id=property_id, defaults=defaults
+        )
+    return stats
+
+
+def get_stats(property_id):
+    """主键读取聚合行，不存在时全量计算一次"""
+    try:
+        return PropertyReviewStats.objects.get(pk=property_id)
+    except PropertyReviewStats.DoesNotExist:
+        return rebuild(property_id)
+
+
+def review_tag_keys(review_id):
+    return list(
+        ReviewTagAssignment.objects.filter(review_id=review_id).values_list('tag__tag_key', flat=True)
+    )
+
+
+def review_saved(review, previous=None):
+    """
+    评论保存后更新聚合
+
+    Args:
+        review: 保存后的评论
+        previous: 保存前的 {'rating', 'is_hidden'}，新建评论为 None
+    """
+    ratings = Counter()
+    tags = Counter()
+
+    was_visible = previous is not None and not previous['is_hidden']
+    is_visible = not review.is_hidden
+
+    if was_visible:
+        ratings[previous['rating']] -= 1
+    if is_visible:
+        ratings[review.rating] += 1
+
+    # 可见性变化时，评论已有的标签也要跟着计入/移出
+    if previous is not None and was_visible != is_visible:
+        sign = 1 if is_visible else -1
+        for tag_key in review_tag_keys(review.pk):
+            tags[tag_key] += sign
+
+    if apply_delta(review.property_ref_id, ratings=ratings, tags=tags) is None and is_visible:
+        # 只改了标题/内容，聚合不变，但评论列表的 Last-Modified 仍需前进
+        PropertyReviewStats.objects.filter(pk=review.property_ref_id).update(updated_at=timezone.now())
+
+
+def review_deleted(review):
+    if not review.is_hidden:
+        apply_delta(review.property_ref_id, ratings={review.rating: -1})
+
+
+def _apply_tag_delta(property_id, is_hidden, tag_keys, sign):
+    if not tag_keys or is_hidden:
+        return
+    tags = Counter()
+    for tag_key in tag_keys:
+        tags[tag_key] += sign
+    apply_delta(property_id, tags=tags)
+
+
+def tags_changed(review_id, tag_keys, sign):
+    """评论的标签关联新增(sign=1)或删除(sign=-1)后更新聚合"""
+    if not tag_keys:
+        return
+    review = PropertyReview.objects.filter(pk=review_id).values('property_ref_id', 'is_hidden').first()
+    if review is None:
+        return
+    _apply_tag_delta(review['property_ref_id'], review['is_hidden'], tag_keys, sign)
+
+
+def review_tags_changed(review, tag_keys, sign):
+    """同 tags_changed，但直接使用已加载的评论对象"""
+    _apply_tag_delta(review.property_ref_id, review.is_hidden, tag_keys, sign)
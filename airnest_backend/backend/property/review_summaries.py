@@ -0,0 +1,212 @@
+"""
+AI 评论摘要后台重新生成队列
+
+新评论把房源已有的摘要标记为过期，并为每个语言入队一条 ReviewSummaryJob。
+同一 (房源, 语言) 只有一行任务：窗口期内的多次入队只会递增 requested_version，
+由 process_review_summaries 命令在 due_at 之后统一执行一次。执行期间又有新评论时，
+任务会在下一个窗口之后再跑一次，因此每个房源每个窗口最多生成一次。
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import review_insights, review_stats
+from .models import PropertyReview, PropertyReviewSummary, ReviewSummaryJob
+from .summary_generators import SummaryGenerationError
+
+logger = logging.getLogger(__name__)
+
+MIN_REVIEWS_FOR_SUMMARY = 3  # 与前端 BFF 保持一致
+MAX_REVIEWS_IN_PROMPT = 50
+MAX_ATTEMPTS = 5
+# 领取后超过该时间仍未完成，视为 worker 已退出，允许重新领取
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+
+def _window():
+    return timedelta(seconds=settings.REVIEW_SUMMARY_DEBOUNCE_SECONDS)
+
+
+def get_generator():
+    if not settings.REVIEW_SUMMARY_GENERATOR:
+        raise ImproperlyConfigured(
+            'No review summary generator configured: set OPENROUTER_API_KEY, or set '
+            'REVIEW_SUMMARY_GENERATOR explicitly (StubSummaryGenerator for local development)'
+        )
+    try:
+        return import_string(settings.REVIEW_SUMMARY_GENERATOR)()
+    except (ImportError, SummaryGenerationError) as e:
+        raise ImproperlyConfigured(f'Cannot load review summary generator: {e}') from e
+
+
+def enqueue(property_id, locales):
+    """为房源的若干语言入队（或合并进已有任务）"""
+    due_at = timezone.now() + _window()
+    for locale in locales:
+        if _bump(property_id, locale, due_at):
+            continue
+        try:
+            with transaction.atomic():
+                ReviewSummaryJob.objects.create(property_ref_id=property_id, locale=locale, due_at=due_at)
+        except IntegrityError:
+            # 并发入队时另一方已经建好了任务
+            _bump(property_id, locale, due_at)
+
+
+def _bump(property_id, locale, due_at):
+    failed = Q(status=ReviewSummaryJob.STATUS_FAILED)
+    return ReviewSummaryJob.objects.filter(property_ref_id=property_id, locale=locale).update(
+        requested_version=F('requested_version') + 1,
+        # 已放弃的任务重新开始计数；等待中的任务保留原 due_at，不会被持续推迟
+        status=Case(When(failed, then=Value(ReviewSummaryJob.STATUS_PENDING)), default=F('status')),
+        attempts=Case(When(failed, then=Value(0)), default=F('attempts')),
+        due_at=Case(When(failed, then=Value(due_at)), default=F('due_at')),
+        updated_at=timezone.now(),
+    )
+
+
+def mark_stale(property_id):
+    """评论变化后标记该房源所有摘要过期，并在事务提交后入队重新生成"""
+    locales = list(
+        PropertyReviewSummary.objects.filter(property_ref_id=property_id).values_list('locale', flat=True)
+    )
+    if not locales:
+        return
+    PropertyReviewSummary.objects.filter(property_ref_id=property_id).update(is_stale=True)
+    review_insights.invalidate_on_commit(property_id)
+    transaction.on_commit(lambda: enqueue(property_id, locales))
+
+
+def cancel(property_id, locale):
+    """摘要已由其他途径（BFF）刷新时，撤销还没开始的任务"""
+    ReviewSummaryJob.objects.filter(
+        property_ref_id=property_id, locale=locale, status=ReviewSummaryJob.STATUS_PENDING
+    ).delete()
+
+
+def claim_jobs(limit):
+    """领取到期任务；SKIP LOCKED 让多个 worker 可以同时运行"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            ReviewSummaryJob.objects.select_for_update(skip_locked=True).filter(
+                Q(status=ReviewSummaryJob.STATUS_PENDING, due_at__lte=now)
+                | Q(status=ReviewSummaryJob.STATUS_RUNNING, claimed_at__lt=now - CLAIM_TIMEOUT)
+            ).order_by('due_at')[:limit]
+        )
+        for job in jobs:
+            job.status = ReviewSummaryJob.STATUS_RUNNING
+            job.claimed_at = now
+            job.claimed_version = job.requested_version
+            job.attempts += 1
+            job.save(update_fields=['status', 'claimed_at', 'claimed_version', 'attempts', 'updated_at'])
+    return jobs
+
+
+def _load_reviews(property_id):
+    reviews = PropertyReview.objects.filter(
+        property_ref_id=property_id, is_hidden=False
+    ).order_by('-created_at').values('rating', 'title', 'content')[:MAX_REVIEWS_IN_PROMPT]
+    return list(reviews)
+
+
+def run_job(job, generator):
+    """
+    执行单个任务
+
+    Returns:
+        str: 'generated' / 'skipped' / 'failed'
+    """
+    # 任何异常都只影响本任务，按退避重试，不能中断同一批的其他任务
+    try:
+        total_count = review_stats.get_stats(job.property_ref_id).review_count
+        if total_count < MIN_REVIEWS_FOR_SUMMARY:
+            _finish(job)
+            return 'skipped'
+
+        insights = generator.generate(_load_reviews(job.property_ref_id), total_count, job.locale)
+        PropertyReviewSummary.objects.update_or_create(
+            property_ref_id=job.property_ref_id,
+            locale=job.locale,
+            defaults={
+                'highlights': insights['highlights'],
+                'concerns': insights['concerns'],
+                'best_for': insights['best_for'],
+                'summary_text': insights['summary_text'],
+                'reviews_count_at_generation': total_count,
+                'is_stale': False,
+                'model_version': insights['model_version'],
+            },
+        )
+        _finish(job)
+        return 'generated'
+    except Exception as e:
+        logger.warning('Review summary generation failed for %s (%s): %s', job.property_ref_id, job.locale, e,
+                       exc_info=not isinstance(e, SummaryGenerationError))
+        try:
+            _fail(job, e)
+        except Exception:
+            # 数据库不可用时任务保持 running，CLAIM_TIMEOUT 后会被重新领取
+            logger.exception('Could not record failure of review summary job %s', job.pk)
+        return 'failed'
+
+
+def _finish(job):
+    # 执行期间没有新的入队请求才删除；否则留到下一个窗口再跑
+    deleted, _ = ReviewSummaryJob.objects.filter(pk=job.pk, requested_version=job.claimed_version).delete()
+    if not deleted:
+        ReviewSummaryJob.objects.filter(pk=job.pk).update(
+            status=ReviewSummaryJob.STATUS_PENDING,
+            due_at=timezone.now() + _window(),
+            attempts=0,
+            last_error='',
+            updated_at=timezone.now(),
+        )
+
+
+def _fail(job, error):
+    status = ReviewSummaryJob.STATUS_FAILED if job.attempts >= MAX_ATTEMPTS else ReviewSummaryJob.STATUS_PENDING
+    # 指数退避，从一个窗口开始
+    backoff = _window() * (2 ** (job.attempts - 1))
+    ReviewSummaryJob.objects.filter(pk=job.pk).update(
+        status=status,
+        due_at=timezone.now() + backoff,
+        last_error=str(error)[:2000],
+        updated_at=timezone.now(),
+    )
+
+
+def _run_in_thread(job, generator):
+    try:
+        return run_job(job, generator)
+    finally:
+        # 线程各自持有数据库连接，用完关闭
+        connections.close_all()
+
+
+def process_due(limit=20, workers=None, generator=None):
+    """
+    领取并执行一批到期任务，最多 workers 个生成请求并发
+
+    Returns:
+        dict: {结果: 数量}
+    """
+    workers = workers or settings.REVIEW_SUMMARY_WORKERS
+    generator = generator or get_generator()
+    jobs = claim_jobs(limit)
+    results = {}
+    if not jobs:
+        return results
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for outcome in executor.map(lambda job: _run_in_thread(job, generator), jobs):
+            results[outcome] = results.get(outcome, 0) + 1
+    return results
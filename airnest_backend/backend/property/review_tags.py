@@ -0,0 +1,122 @@
+"""
+评论标签查找缓存与批量关联
+
+标签集合很少变化：每个进程保存一份 tag_key -> ReviewTag 的映射，
+通过共享缓存里的版本号判断是否需要重新加载，ReviewTag 写入时递增版本号。
+写评论时用一次 bulk_create 写入标签关联，更新时只处理差集。
+"""
+
+import random
+import threading
+
+from django.core.cache import cache
+
+from . import review_stats
+from .models import ReviewTag, ReviewTagAssignment
+
+VERSION_KEY = 'review_tags:version'
+
+_lock = threading.Lock()
+_snapshot = {'version': None, 'by_key': {}, 'by_id': {}}
+
+
+def _shared_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # 随机起点，避免版本键被淘汰后与进程内旧版本号撞上
+        cache.add(VERSION_KEY, random.getrandbits(62), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """ReviewTag 变更后调用，使所有进程的本地映射失效"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, random.getrandbits(62), None)
+
+
+def _load():
+    global _snapshot
+
+    version = _shared_version()
+    snapshot = _snapshot
+    if snapshot['version'] == version and version is not None:
+        return snapshot
+
+    with _lock:
+        if _snapshot['version'] == version and version is not None:
+            return _snapshot
+        tags = list(ReviewTag.objects.all())
+        _snapshot = {
+            'version': version,
+            'by_key': {tag.tag_key: tag for tag in tags},
+            'by_id': {tag.pk: tag for tag in tags},
+        }
+        return _snapshot
+
+
+def get_tag(tag_key):
+    return _load()['by_key'].get(tag_key)
+
+
+def get_tag_by_id(tag_id):
+    tag = _load()['by_id'].get(tag_id)
+    if tag is None:
+        # 同一事务内刚创建、版本号尚未递增的标签
+        tag = ReviewTag.objects.filter(pk=tag_id).first()
+    return tag
+
+
+def get_active_tags(tag_keys):
+    """按传入顺序返回存在且启用的标签，忽略未知 key 和重复 key"""
+    by_key = _load()['by_key']
+    tags = []
+    seen = set()
+    for tag_key in tag_keys or []:
+        tag = by_key.get(tag_key)
+        if tag is None or not tag.is_active or tag.pk in seen:
+            continue
+        seen.add(tag.pk)
+        tags.append(tag)
+    return tags
+
+
+def list_active_tags():
+    tags = [tag for tag in _load()['by_key'].values() if tag.is_active]
+    return sorted(tags, key=lambda tag: (tag.category, tag.order))
+
+
+def assign_tags(review, tag_keys):
+    """为新评论一次性写入全部标签关联"""
+    tags = get_active_tags(tag_keys)
+    if not tags:
+        return []
+
+    ReviewTagAssignment.objects.bulk_create(
+        [ReviewTagAssignment(review=review, tag=tag) for tag in tags]
+    )
+    # bulk_create 不触发 post_save，这里直接更新评论聚合
+    review_stats.review_tags_changed(review, [tag.tag_key for tag in tags], 1)
+    return tags
+
+
+def update_tags(review, tag_keys):
+    """按差集更新评论标签：只删除被移除的，只插入新增的"""
+    desired = {tag.pk: tag for tag in get_active_tags(tag_keys)}
+    current = set(
+        ReviewTagAssignment.objects.filter(review=review).values_list('tag_id', flat=True)
+    )
+
+    removed = current - desired.keys()
+    added = [tag for pk, tag in desired.items() if pk not in current]
+
+    if removed:
+        # 删除会触发 post_delete 信号，由信号扣减聚合
+        ReviewTagAssignment.objects.filter(review=review, tag_id__in=removed).delete()
+    if added:
+        ReviewTagAssignment.objects.bulk_create(
+            [ReviewTagAssignment(review=review, tag=tag) for tag in added]
+        )
+        review_stats.review_tags_changed(review, [tag.tag_key for tag in added], 1)
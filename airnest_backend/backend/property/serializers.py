@@ -1,17 +1,22 @@
 from rest_framework import serializers
 from .models import Property, PropertyImage, PropertyReview, ReviewTag, ReviewTagAssignment, ALLOWED_PROPERTY_TAG_IDS
 from useraccount.serializers import UserSerializer
+from . import review_tags
 
 class PropertyImageSerializer(serializers.ModelSerializer):
     imageURL = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = PropertyImage
-        fields = ['id', 'imageURL', 'order', 'is_main', 'alt_text']
+        fields = ['id', 'imageURL', 'srcset', 'order', 'is_main', 'alt_text']
 
     def get_imageURL(self, obj):
         return obj.get_url()
 
+    def get_srcset(self, obj):
+        return obj.get_srcset()
+
 def _validate_property_tags(v):
     if v is None:
         return []
@@ -108,13 +113,8 @@ class PropertyReviewSerializer(serializers.ModelSerializer):
         tag_keys = validated_data.pop('tag_keys', [])
         review = PropertyReview.objects.create(**validated_data)
         
-        # 关联标签
-        for tag_key in tag_keys:
-            try:
-                tag = ReviewTag.objects.get(tag_key=tag_key, is_active=True)
-                ReviewTagAssignment.objects.create(review=review, tag=tag)
-            except ReviewTag.DoesNotExist:
-                pass  # 忽略不存在的标签
+        # 关联标签（不存在或已停用的标签会被忽略）
+        review_tags.assign_tags(review, tag_keys)
         
         return review
 
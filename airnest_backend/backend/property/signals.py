@@ -0,0 +1,103 @@
+"""
+房源相关的模型信号
+
+- 预订写入后在事务提交时刷新 iCal 缓存
+- 评论及其标签关联变化时增量维护 PropertyReviewStats
+- 评论标题/内容变化时更新全文检索向量
+- ReviewTag 变化时让进程内的标签映射失效
+- 评论统计或 AI 摘要变化时清除批量评论洞察缓存
+"""
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import ical, review_insights, review_search, review_stats, review_tags
+from .models import (
+    PropertyReview, PropertyReviewStats, PropertyReviewSummary, Reservation, ReviewTag, ReviewTagAssignment,
+)
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: ical.apply_reservation_change(instance))
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: ical.apply_reservation_change(instance, deleted=True))
+
+
+@receiver(pre_save, sender=PropertyReview)
+def review_pre_save(sender, instance, raw=False, **kwargs):
+    # 记录保存前的评分、可见性和文本，post_save 据此计算增量、决定是否重建检索向量
+    instance._stats_previous = None
+    if raw or instance._state.adding:
+        return
+    instance._stats_previous = (
+        PropertyReview.objects.filter(pk=instance.pk).values('rating', 'is_hidden', 'title', 'content').first()
+    )
+
+
+@receiver(post_save, sender=PropertyReview)
+def review_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_stats_previous', None)
+    if not created and previous is None:
+        return
+    review_stats.review_saved(instance, previous)
+
+    if created or (previous['title'], previous['content']) != (instance.title, instance.content):
+        review_search.update_search_vector(instance.pk)
+
+
+@receiver(post_delete, sender=PropertyReview)
+def review_post_delete(sender, instance, **kwargs):
+    review_stats.review_deleted(instance)
+
+
+@receiver(post_save, sender=ReviewTagAssignment)
+def tag_assignment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    tag = review_tags.get_tag_by_id(instance.tag_id)
+    if tag is not None:
+        review_stats.tags_changed(instance.review_id, [tag.tag_key], 1)
+
+
+@receiver(post_delete, sender=ReviewTagAssignment)
+def tag_assignment_deleted(sender, instance, **kwargs):
+    # tags.remove()/clear()、按差集更新标签以及评论级联删除都会走到这里
+    tag = review_tags.get_tag_by_id(instance.tag_id)
+    if tag is not None:
+        review_stats.tags_changed(instance.review_id, [tag.tag_key], -1)
+
+
+@receiver(m2m_changed, sender=PropertyReview.tags.through)
+def review_tags_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # tags.add() 通过 bulk_create 写关联行，不触发 post_save，这里补上
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        # 从标签一侧添加（tag.<related>.add(review, ...)）：instance 是标签，pk_set 是评论
+        for review_id in pk_set:
+            review_stats.tags_changed(review_id, [instance.tag_key], 1)
+        return
+    tag_keys = [tag.tag_key for tag in map(review_tags.get_tag_by_id, pk_set) if tag is not None]
+    review_stats.review_tags_changed(instance, tag_keys, 1)
+
+
+@receiver(post_save, sender=ReviewTag)
+@receiver(post_delete, sender=ReviewTag)
+def review_tag_changed(sender, **kwargs):
+    transaction.on_commit(review_tags.bump_version)
+
+
+@receiver(post_save, sender=PropertyReviewStats)
+@receiver(post_save, sender=PropertyReviewSummary)
+@receiver(post_delete, sender=PropertyReviewSummary)
+def review_insights_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    review_insights.invalidate_on_commit(instance.property_ref_id)
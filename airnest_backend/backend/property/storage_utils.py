@@ -9,7 +9,7 @@ from io import BytesIO
 from datetime import datetime
 from django.conf import settings
 from django.core.files.base import ContentFile
-from PIL import Image
+from PIL import Image, ImageOps
 
 
 def generate_file_hash(content):
@@ -108,6 +108,37 @@ def process_image_variant(img, variant_config, timestamp):
     return filename, content
 
 
+RESPONSIVE_VARIANT_NAMES = ('thumbnail', 'medium', 'large', 'xlarge')
+
+
+def render_variants(data):
+    """
+    解码原图并编码各尺寸的 WebP
+    
+    在 property.image_variants 的进程池中执行，本模块不能依赖已初始化的 Django
+
+    Returns:
+        tuple: ((原图宽, 原图高), [(名称, 后缀, 宽, 高, 内容), ...])
+    """
+    img = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+    sizes = get_optimized_image_sizes()
+    rendered = []
+    last_width = None
+    for name in RESPONSIVE_VARIANT_NAMES:
+        config = sizes[name]
+        _, content = process_image_variant(img, config, 0)
+        width, height = Image.open(BytesIO(content)).size
+        # thumbnail 不会放大，原图较小时后面的尺寸与前一个相同，不再重复存储
+        if width == last_width:
+            break
+        last_width = width
+        rendered.append((name, config['suffix'], width, height, content))
+    return img.size, rendered
+
+
 def save_original_image(img, timestamp):
     """
     保存原始高清图片（仅当尺寸足够大时）
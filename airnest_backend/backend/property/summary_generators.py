@@ -0,0 +1,154 @@
+"""
+AI 评论摘要生成后端
+
+后台队列通过 settings.REVIEW_SUMMARY_GENERATOR 指定的类生成摘要。
+生成器只需实现 generate(reviews, total_count, locale)，返回
+{'highlights', 'concerns', 'best_for', 'summary_text', 'model_version'}，
+失败时抛出 SummaryGenerationError。
+"""
+
+import json
+from collections import Counter
+
+import requests
+from django.conf import settings
+
+LOCALE_NAMES = {
+    'en': 'English',
+    'zh': 'Chinese (Simplified, 简体中文)',
+    'fr': 'French (Français)',
+}
+
+
+class SummaryGenerationError(Exception):
+    pass
+
+
+class StubSummaryGenerator:
+    """本地/测试用：不调用外部服务，按评分和标题拼出确定的结果；需通过 REVIEW_SUMMARY_GENERATOR 显式启用"""
+
+    model_version = 'stub'
+
+    def generate(self, reviews, total_count, locale):
+        ratings = Counter(review['rating'] for review in reviews)
+        average = sum(r * n for r, n in ratings.items()) / max(1, sum(ratings.values()))
+        titles = [review['title'] for review in reviews if review.get('title')]
+        return {
+            'highlights': titles[:3],
+            'concerns': [review['title'] or review['content'][:60] for review in reviews if review['rating'] <= 2][:3],
+            'best_for': [],
+            'summary_text': f'{total_count} reviews, average {average:.1f}/5 ({locale})',
+            'model_version': self.model_version,
+        }
+
+
+class OpenRouterSummaryGenerator:
+    """通过 OpenRouter（OpenAI 兼容接口）的 tool calling 生成摘要，与前端 BFF 的提示词一致"""
+
+    api_url = 'https://openrouter.ai/api/v1/chat/completions'
+    timeout = 30
+
+    insights_tool = {
+        'type': 'function',
+        'function': {
+            'name': 'submit_review_insights',
+            'description': 'Submit structured insights extracted from guest reviews.',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'highlights': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                        'description': 'Top praised aspects (3-5 items)',
+                    },
+                    'concerns': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                        'description': 'Common concerns or warnings (0-3 items)',
+                    },
+                    'best_for': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                        'description': 'Ideal traveler types (2-4 items)',
+                    },
+                    'summary_text': {
+                        'type': 'string',
+                        'description': 'One-sentence overall summary (under 30 words)',
+                    },
+                },
+                'required': ['highlights', 'concerns', 'best_for', 'summary_text'],
+            },
+        },
+    }
+
+    def __init__(self):
+        self.api_key = settings.OPENROUTER_API_KEY
+        self.model = settings.AI_MODEL
+        if not self.api_key:
+            raise SummaryGenerationError('OPENROUTER_API_KEY is not configured')
+
+    def _system_prompt(self, locale):
+        lang_name = LOCALE_NAMES.get(locale, 'English')
+        extra = ''
+        if locale == 'zh':
+            extra = 'You MUST write in 简体中文. Example: "位置绝佳", "房东热情好客", "适合情侣".\n'
+        elif locale == 'fr':
+            extra = 'You MUST write in français. Example: "Emplacement idéal", "Hôte très accueillant".\n'
+        return (
+            'You are a review analyst for a vacation rental platform.\n'
+            'Analyze the provided guest reviews and extract structured insights.\n\n'
+            f'CRITICAL: ALL output text MUST be written in {lang_name}. Even if the reviews are in another '
+            f'language, you MUST translate and write every string value in {lang_name}.\n'
+            f'{extra}\n'
+            'Rules:\n'
+            f'- highlights: 3-5 most frequently praised aspects. Be specific and concise (under 15 words each). Written in {lang_name}.\n'
+            '- concerns: 0-3 common complaints or things to be aware of. Only include if genuinely mentioned by '
+            'multiple guests or particularly noteworthy. If reviews are overwhelmingly positive, return an empty '
+            f'array. Written in {lang_name}.\n'
+            f'- best_for: 2-4 traveler types this property suits. Written in {lang_name}.\n'
+            f'- summary_text: A single sentence (under 30 words) capturing the overall sentiment. Written in {lang_name}.\n'
+            '- Base your analysis strictly on the reviews provided. Do not invent information.'
+        )
+
+    def _user_message(self, reviews, total_count, locale):
+        lang_name = LOCALE_NAMES.get(locale, 'English')
+        review_texts = '\n'.join(
+            f"Review {i} ({review['rating']}/5): "
+            f"{review['title'] + ' — ' if review.get('title') else ''}{review['content']}"
+            for i, review in enumerate(reviews, start=1)
+        )
+        return (
+            f'Output language: {lang_name}\nTotal reviews: {total_count}\n\n{review_texts}\n\n'
+            f'REMINDER: Write ALL output values in {lang_name}. Do NOT use English unless the output language is English.'
+        )
+
+    def generate(self, reviews, total_count, locale):
+        payload = {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': self._system_prompt(locale)},
+                {'role': 'user', 'content': self._user_message(reviews, total_count, locale)},
+            ],
+            'tools': [self.insights_tool],
+            'tool_choice': {'type': 'function', 'function': {'name': 'submit_review_insights'}},
+        }
+        try:
+            response = requests.post(
+                self.api_url,
+                json=payload,
+                headers={'Authorization': f'Bearer {self.api_key}'},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            tool_calls = response.json()['choices'][0]['message']['tool_calls']
+            insights = json.loads(tool_calls[0]['function']['arguments'])
+        except (requests.RequestException, KeyError, IndexError, TypeError, ValueError) as e:
+            raise SummaryGenerationError(str(e)) from e
+
+        return {
+            'highlights': insights.get('highlights') or [],
+            'concerns': insights.get('concerns') or [],
+            'best_for': insights.get('best_for') or [],
+            'summary_text': insights.get('summary_text') or '',
+            'model_version': self.model,
+        }
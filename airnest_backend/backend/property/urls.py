@@ -13,6 +13,7 @@ urlpatterns = [
     path('my/', api.my_properties, name='api_properties_my'),
     path('<uuid:pk>/reserve/', api.create_reservation, name='api_properties_reserve'),
     path('<uuid:pk>/booked-dates/', api.get_booked_dates, name='api_properties_booked_dates'),
+    path('<uuid:pk>/calendar.ics', api.property_calendar_feed, name='api_properties_calendar_feed'),
     path('reservations/', api.get_user_reservations, name='api_properties_reservations'),
     path('wishlist/', api.get_wishlist, name='api_properties_wishlist'),
     path('<uuid:pk>/toggle-favorite/', api.toggle_favorite, name='api_properties_toggle_favorite'),
@@ -22,6 +23,7 @@ urlpatterns = [
     
     # 评论相关API
     path('review-tags/', api.get_review_tags, name='api_review_tags'),
+    path('review-insights/', api.review_insights_batch, name='api_review_insights_batch'),
     path('<uuid:pk>/reviews/', api.property_reviews, name='api_property_reviews'),
     path('<uuid:pk>/review-stats/', api.property_review_stats, name='api_property_review_stats'),
     path('reviews/<uuid:review_id>/', api.manage_review, name='api_manage_review'),
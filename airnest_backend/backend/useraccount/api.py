@@ -6,7 +6,7 @@ from .models import User, EmailVerification
 from .serializers import LandlordSerializer, UserSerializer
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import CachedJWTAuthentication
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -54,7 +54,7 @@ def profile_detail(request, pk):
 @permission_classes([])
 def landlord_detail(request, pk):
     try:
-        landlord = User.objects.get(pk=pk)
+        landlord = User.objects.prefetch_related('properties__images').get(pk=pk)
         serializer = LandlordSerializer(landlord)
         return JsonResponse(serializer.data, safe=False)
     except User.DoesNotExist:
@@ -483,7 +483,7 @@ def reset_password(request):
 
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([IsAuthenticated])
 @csrf_exempt
 def change_password(request):
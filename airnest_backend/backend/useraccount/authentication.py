@@ -0,0 +1,148 @@
+"""
+JWT 认证的用户缓存
+
+HTTP 的 CachedJWTAuthentication 与 WebSocket 的 CookieOrTokenAuthMiddleware 共用同一套
+"校验 token -> 按 user_id 取用户" 流程。用户对象放在进程内的有界 LRU 缓存中并带 TTL，
+命中时不访问数据库。
+
+共享缓存里每个用户有一个版本号，进程内的条目记录写入时的版本，命中时比对一次：
+用户保存或删除时（包括被停用）由 signals 递增版本号，所有进程的旧条目随即失效。
+QuerySet.update() 不触发信号，批量修改会影响认证的字段（is_active 等）后需调用 bump_version。
+"""
+
+import copy
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import User
+
+
+class UserCache:
+    """有界 LRU + TTL，线程安全"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, entry_version, user = entry
+            if expires_at < time.monotonic() or entry_version != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # 每个请求拿到独立的副本，避免请求间共享可变的模型实例
+        return copy.copy(user)
+
+    def set(self, user, version):
+        key = str(user.pk)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, copy.copy(user))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(max_size=settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL)
+
+
+def _version_key(user_id):
+    return f'auth_user:version:{user_id}'
+
+
+def _shared_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # 随机起点，避免版本键被淘汰后与进程内旧版本号撞上
+        cache.add(_version_key(user_id), random.getrandbits(62), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+async def _ashared_version(user_id):
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        await cache.aadd(_version_key(user_id), random.getrandbits(62), None)
+        version = await cache.aget(_version_key(user_id))
+    return version
+
+
+def bump_version(user_id):
+    """用户变更后调用，使所有进程缓存的该用户失效"""
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.add(_version_key(user_id), random.getrandbits(62), None)
+    user_cache.evict(user_id)
+
+
+def cached_user(user_id):
+    """只查缓存，未命中或已被其他进程标记失效时返回 None"""
+    return user_cache.get(user_id, _shared_version(user_id))
+
+
+async def acached_user(user_id):
+    """cached_user 的异步版本（在事件循环中使用）"""
+    return user_cache.get(user_id, await _ashared_version(user_id))
+
+
+def load_user(user_id):
+    """
+    查库并写入缓存，只缓存启用中的用户
+
+    Returns:
+        User 或 None
+    """
+    # 先取版本再查库：查库期间发生的变更会递增版本，这次写入的条目随即失效
+    version = _shared_version(user_id)
+    user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+    if user is None or not user.is_active:
+        return None
+    user_cache.set(user, version)
+    return user
+
+
+def user_id_from_token(raw_token):
+    """校验 access token 并取出 user_id，失败时抛出 simplejwt 的 TokenError"""
+    token = AccessToken(raw_token)
+    return token.payload.get(api_settings.USER_ID_CLAIM)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """与 JWTAuthentication 相同，只是用户查找先走进程内缓存"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = cached_user(user_id) or load_user(user_id)
+        if user is None:
+            # 不存在或已停用，交给父类给出与原来一致的错误
+            return super().get_user(validated_token)
+        return user
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from useraccount import reputation
+
+
+class Command(BaseCommand):
+    help = 'Recompute landlord rating aggregates and super-host flags from reviews (safe to run on a schedule)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updated = reputation.refresh_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated reputation for {updated} hosts'))
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_landlord_reputation(apps, schema_editor):
+    User = apps.get_model('useraccount', 'User')
+    PropertyReview = apps.get_model('property', 'PropertyReview')
+
+    totals = (
+        PropertyReview.objects.filter(is_hidden=False)
+        .values('property_ref__landlord')
+        .annotate(review_count=Count('id'), rating_sum=Sum('rating'))
+        .order_by()
+    )
+    for row in totals:
+        review_count = row['review_count']
+        rating_sum = row['rating_sum'] or 0
+        User.objects.filter(pk=row['property_ref__landlord']).update(
+            landlord_review_count=review_count,
+            landlord_rating_sum=rating_sum,
+            super_host=review_count >= 5 and rating_sum * 20 >= review_count * 89,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('useraccount', '0006_create_initial_superuser'),
+        ('property', '0023_propertyreviewstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='landlord_rating_sum',
+            field=models.IntegerField(default=0, help_text='名下房源可见评论的评分总和'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='landlord_review_count',
+            field=models.IntegerField(default=0, help_text='名下房源可见评论数'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='super_host',
+            field=models.BooleanField(default=False, help_text='是否为超级房东'),
+        ),
+        migrations.RunPython(backfill_landlord_reputation, migrations.RunPython.noop),
+    ]
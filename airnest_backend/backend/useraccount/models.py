@@ -49,6 +49,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     email_verified = models.BooleanField(default=False, help_text="邮箱是否已验证")
     email_verified_at = models.DateTimeField(blank=True, null=True, help_text="邮箱验证时间")
 
+    # 房东评价聚合（评论写入时增量维护，refresh_host_reputation 命令可全量校正）
+    landlord_rating_sum = models.IntegerField(default=0, help_text="名下房源可见评论的评分总和")
+    landlord_review_count = models.IntegerField(default=0, help_text="名下房源可见评论数")
+    super_host = models.BooleanField(default=False, help_text="是否为超级房东")
+
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
@@ -69,29 +74,15 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     @property
     def landlord_average_rating(self):
-        """计算房东平均评分（基于所有房源的评论）"""
-        # 动态导入避免循环导入
-        from property.models import PropertyReview
-        
-        reviews = PropertyReview.objects.filter(
-            property_ref__landlord=self,
-            is_hidden=False
-        )
-        
-        if not reviews.exists():
+        """房东平均评分（基于所有房源的评论）"""
+        if not self.landlord_review_count:
             return 0
-        
-        return round(sum(review.rating for review in reviews) / reviews.count(), 1)
+        return round(self.landlord_rating_sum / self.landlord_review_count, 1)
     
     @property
     def total_landlord_reviews(self):
         """获取房东总评论数"""
-        from property.models import PropertyReview
-        
-        return PropertyReview.objects.filter(
-            property_ref__landlord=self,
-            is_hidden=False
-        ).count()
+        return self.landlord_review_count
     
     @property
     def response_rate(self):
@@ -101,12 +92,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     @property
     def is_super_host(self):
-        """判断是否为超级房东"""
-        return (
-            self.landlord_average_rating >= 4.5 and
-            self.total_landlord_reviews >= 5 and
-            self.response_rate >= 90
-        )
+        """判断是否为超级房东（读取已存储的标记）"""
+        return self.super_host
     
     def __str__(self):
         return f"{self.email} ({'verified' if self.email_verified else 'unverified'})"
@@ -0,0 +1,110 @@
+"""
+房东评价聚合
+
+User 上的 landlord_rating_sum / landlord_review_count / super_host
+由评论写入时的增量（property.review_stats）维护，也可以用
+refresh_host_reputation 命令按 SQL 聚合全量重算。
+"""
+
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, F, Q, Sum, Value, When
+
+from .models import User
+
+SUPER_HOST_MIN_REVIEWS = 5
+
+
+def super_host_condition():
+    """
+    超级房东条件：评论数 >= 5 且平均分（保留一位小数后）>= 4.5
+
+    round(avg, 1) >= 4.5 等价于 avg >= 4.45，即 sum >= count * 89 / 20。
+    回复率目前固定为 95%，恒满足 >= 90 的门槛，这里不再单独判断。
+    """
+    return (
+        Q(landlord_review_count__gte=SUPER_HOST_MIN_REVIEWS)
+        & Q(landlord_rating_sum__gte=F('landlord_review_count') * 89 / 20.0)
+    )
+
+
+def _super_host_value():
+    return Case(
+        When(super_host_condition(), then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    )
+
+
+def apply_host_delta(landlord_id, review_delta, rating_delta):
+    """在房东聚合上叠加评论数和评分总和的增量，并刷新超级房东标记"""
+    if not landlord_id or (not review_delta and not rating_delta):
+        return
+    hosts = User.objects.filter(pk=landlord_id)
+    hosts.update(
+        landlord_review_count=F('landlord_review_count') + review_delta,
+        landlord_rating_sum=F('landlord_rating_sum') + rating_delta,
+    )
+    hosts.update(super_host=_super_host_value())
+
+
+def refresh_all(batch_size=500):
+    """
+    按 SQL 聚合全量重算所有房东的评价数据
+
+    按批锁住房东行后再聚合：之前提交的增量都已计入，之后的增量等本批提交后在新值上叠加，
+    不会被覆盖。超级房东标记只更新本批中需要变化的房东。
+
+    Returns:
+        int: 被更新的房东数量
+    """
+    from property.models import PropertyReview
+
+    # 有可见评论的房东，加上聚合或标记非零、可能需要清零的房东
+    host_ids = set(
+        PropertyReview.objects.filter(is_hidden=False)
+        .values_list('property_ref__landlord', flat=True).order_by().distinct()
+    )
+    host_ids.update(
+        User.objects.filter(
+            Q(landlord_review_count__gt=0) | Q(landlord_rating_sum__gt=0) | Q(super_host=True)
+        ).values_list('pk', flat=True)
+    )
+    host_ids = sorted(host_id for host_id in host_ids if host_id)
+
+    updated = 0
+    for start in range(0, len(host_ids), batch_size):
+        updated += _refresh_batch(host_ids[start:start + batch_size])
+    return updated
+
+
+def _refresh_batch(host_ids):
+    from property.models import PropertyReview
+
+    with transaction.atomic():
+        # 按主键顺序加锁，与并发的 apply_host_delta 互斥
+        hosts = list(
+            User.objects.select_for_update().filter(pk__in=host_ids).order_by('pk')
+            .only('id', 'landlord_review_count', 'landlord_rating_sum')
+        )
+        totals = {
+            row['property_ref__landlord']: (row['review_count'], row['rating_sum'])
+            for row in PropertyReview.objects.filter(is_hidden=False, property_ref__landlord__in=host_ids)
+            .values('property_ref__landlord')
+            .annotate(review_count=Count('id'), rating_sum=Sum('rating'))
+            .order_by()
+        }
+
+        changed = []
+        for user in hosts:
+            review_count, rating_sum = totals.get(user.pk, (0, 0))
+            if (user.landlord_review_count, user.landlord_rating_sum) != (review_count, rating_sum):
+                user.landlord_review_count = review_count
+                user.landlord_rating_sum = rating_sum
+                changed.append(user)
+
+        User.objects.bulk_update(changed, ['landlord_review_count', 'landlord_rating_sum'])
+        condition = super_host_condition()
+        User.objects.filter(pk__in=host_ids).filter(
+            (Q(super_host=True) & ~condition) | (Q(super_host=False) & condition)
+        ).update(super_host=_super_host_value())
+    return len(changed)
@@ -23,13 +23,19 @@ class LandlordPropertySerializer(serializers.ModelSerializer):
 class LandlordSerializer(serializers.ModelSerializer):
     properties = LandlordPropertySerializer(many=True, read_only=True)
     properties_count = serializers.SerializerMethodField()
+    # 房东评价直接读取 User 上存储的聚合字段
+    average_rating = serializers.FloatField(source='landlord_average_rating', read_only=True)
+    total_reviews = serializers.IntegerField(source='landlord_review_count', read_only=True)
+    is_super_host = serializers.BooleanField(source='super_host', read_only=True)
     
     class Meta:
         model = User
-        fields = ['id', 'name', 'avatar_url', 'properties_count', 'properties', 'date_joined']
+        fields = ['id', 'name', 'avatar_url', 'properties_count', 'properties', 'date_joined',
+                  'average_rating', 'total_reviews', 'is_super_host']
 
     def get_properties_count(self, obj):
-        return obj.properties.count()
+        # properties 已预取时不再额外 COUNT
+        return len(obj.properties.all())
 
 class CustomLoginSerializer(BaseLoginSerializer):
     """自定义登录序列化器，在响应中包含用户信息"""
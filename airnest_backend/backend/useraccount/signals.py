@@ -0,0 +1,20 @@
+"""
+用户相关的模型信号
+
+- 用户保存（含停用）或删除时递增认证缓存的共享版本号，所有进程的缓存条目随即失效
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import bump_version
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    # 提交后再递增：提交前其他进程读到的仍是旧行，若此时递增会把旧数据缓存在新版本下
+    user_id = instance.pk
+    transaction.on_commit(lambda: bump_version(user_id))